@@ -0,0 +1,133 @@
+"""In-process admission control for the public check-in endpoints
+
+A token bucket per client IP caps how fast one client can submit, and a
+concurrency limiter caps how many requests per worker reach the database at
+once. Both reject with a retry delay instead of queueing without bound, so a
+burst is answered with 429s rather than exhausted database connections.
+"""
+
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+def forwarded_client_ip(forwarded: str, trusted_hops: int) -> Optional[str]:
+    """Client address from an X-Forwarded-For header set by `trusted_hops` proxies.
+
+    Each proxy appends the address it received the request from, so only the
+    entries added by our own proxies can be trusted: the client is the one
+    `trusted_hops` from the right. Anything further left was sent by the
+    client. None when the header is shorter, i.e. a proxy was bypassed.
+    """
+    addresses = [address.strip() for address in forwarded.split(',') if address.strip()]
+    if trusted_hops < 1 or len(addresses) < trusted_hops:
+        return None
+    return addresses[-trusted_hops]
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets: `rate` requests per second, bursts up to `burst`.
+
+    Buckets of clients that have been idle long enough to be full again are
+    dropped once more than `max_clients` are tracked.
+    """
+
+    def __init__(self, rate=10.0, burst=50, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets = {}  # client -> (tokens, updated_at)
+
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, client: str) -> float:
+        """Take a token for `client`; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                self._buckets[client] = (tokens - 1, now)
+                self.allowed += 1
+                if len(self._buckets) > self.max_clients:
+                    self._prune_locked(now)
+                return 0.0
+            self._buckets[client] = (tokens, now)
+            self.limited += 1
+            return (1 - tokens) / self.rate
+
+    def _prune_locked(self, now):
+        refill_time = self.burst / self.rate
+        self._buckets = {client: bucket for client, bucket in self._buckets.items()
+                         if now - bucket[1] < refill_time}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            clients = len(self._buckets)
+        return {
+            'rate_per_second': self.rate,
+            'burst': self.burst,
+            'clients': clients,
+            'allowed': self.allowed,
+            'limited': self.limited,
+        }
+
+
+class ConcurrencyLimiter:
+    """At most `limit` requests in progress; others wait up to `queue_timeout` for a place"""
+
+    def __init__(self, limit=8, queue_timeout=2.0):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+
+        self.admitted = 0
+        self.shed = 0
+        self.peak_active = 0
+        self.peak_waiting = 0
+
+    def acquire(self) -> bool:
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            self._waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self._waiting)
+            try:
+                while self._active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._active += 1
+            self.admitted += 1
+            self.peak_active = max(self.peak_active, self._active)
+            return True
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def retry_after(self) -> int:
+        """Whole seconds a shed client should wait before retrying"""
+        return max(1, math.ceil(self.queue_timeout))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'queue_timeout_seconds': self.queue_timeout,
+                'active': self._active,
+                'waiting': self._waiting,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'peak_active': self.peak_active,
+                'peak_waiting': self.peak_waiting,
+            }
@@ -1,12 +1,34 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for
+from flask import (Flask, Response, render_template, jsonify, request, session, redirect, url_for, stream_with_context,
+                   has_request_context)
 import os
 import json
+import math
+import base64
+import csv
+import io
+import queue
+import tempfile
 import time
 from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text
+from functools import wraps
 from dotenv import load_dotenv
 
+from grouping import (GROUP_SIZE, get_group_for_slot, get_vpc_info_from_group_name,
+                      plan_letter_migration,
+                      normalize_group_name, get_group_names_for_vpc)
+from admission import ConcurrencyLimiter, TokenBucketLimiter, forwarded_client_ip
+from bulk_import import RosterImport
+from event_bus import EventBus, PostgresRelay
+from idempotency import MAX_KEY_LENGTH, IdempotencyCache
+from lab_events import (DEFAULT_EVENT_ID, EventPartitions, InvalidEventId, UnknownEvent, event_of,
+                        normalize_event_id)
+from read_replica import ReplicaRouter
+from repository import SQLAlchemyRepository, create_database_engine
+from snapshot_cache import CachedSnapshot, GroupRosterCache
+from write_behind import RegisteredIndex, SlotAllocator, WriteBehindQueue
+from user_directory import (UserDirectory, DirectoryCache, DirectoryWarmingUp, AccountUserCrawler,
+                            SharedDirectoryLoader)
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -14,9 +36,8 @@ load_dotenv()
 CODE_ENGINE_DEPLOYMENT = bool(os.environ.get('DATABASES_FOR_POSTGRESQL_CONNECTION'))
 
 try:
-    from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+    from ibm_cloud_sdk_core.authenticators import IAMAuthenticator, NoAuthAuthenticator
     from ibm_platform_services import UserManagementV1
-    from ibm_platform_services.user_management_v1 import UsersPager
     IBM_SDK_AVAILABLE = True
 except ImportError:
     IBM_SDK_AVAILABLE = False
@@ -24,7 +45,7 @@ except ImportError:
 # Import database operations for Code Engine deployment
 if CODE_ENGINE_DEPLOYMENT:
     try:
-        from database import DatabaseOperations
+        from database import DatabaseOperations, code_engine_connection_config
         print("Using IBM Cloud Code Engine database configuration")
     except ImportError:
         print("Warning: database.py not found, falling back to SQLAlchemy")
@@ -56,166 +77,334 @@ def get_database_url():
     # Priority 3: SQLite fallback
     return 'sqlite:///checkin.db'
 
-# Initialize database operations based on deployment type
+def get_replica_database_url():
+    """Optional read replica URL: DATABASE_REPLICA_URL, or POSTGRES_REPLICA_HOST with the POSTGRES_* credentials"""
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        if replica_url.startswith('postgres://'):
+            replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+        return replica_url
+
+    replica_host = os.environ.get('POSTGRES_REPLICA_HOST')
+    postgres_user = os.environ.get('POSTGRES_USER')
+    postgres_password = os.environ.get('POSTGRES_PASSWORD')
+    postgres_db = os.environ.get('POSTGRES_DB')
+    if all([replica_host, postgres_user, postgres_password, postgres_db]):
+        replica_port = os.environ.get('POSTGRES_REPLICA_PORT', os.environ.get('POSTGRES_PORT', '5432'))
+        return f"postgresql://{postgres_user}:{postgres_password}@{replica_host}:{replica_port}/{postgres_db}"
+    return None
+
+# Every route reads and writes through one CheckinRepository (see repository.py)
 if CODE_ENGINE_DEPLOYMENT:
-    # Use IBM Cloud Code Engine database operations
-    db_ops = DatabaseOperations()
+    # Raw psycopg2 with a connection pool, for IBM Cloud Code Engine
+    repository = DatabaseOperations()
     print("Initialized IBM Cloud Code Engine database operations")
-    # Set Flask config for sessions
-    app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
 else:
-    # Use SQLAlchemy for OpenShift/local deployment
+    # SQLAlchemy Core for OpenShift/local deployment
     database_url = get_database_url()
     print(f"Using database: {database_url}")
-    print(f"Database type: {'PostgreSQL' if database_url.startswith('postgresql://') else 'SQLite'}")
-    
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
-    db = SQLAlchemy(app)
+    engine = create_database_engine(database_url)
+    print(f"Database type: {'PostgreSQL' if engine.dialect.name == 'postgresql' else 'SQLite'}")
+    # "user" and "group" are the table names of the original Flask-SQLAlchemy models
+    repository = SQLAlchemyRepository(engine, users='user', groups='group')
+
+# Optional read replica for the read-only endpoints; writes always use the primary
+replica_repository = None
+if CODE_ENGINE_DEPLOYMENT:
+    if os.environ.get('DATABASES_FOR_POSTGRESQL_REPLICA_CONNECTION'):
+        replica_repository = DatabaseOperations(code_engine_connection_config('DATABASES_FOR_POSTGRESQL_REPLICA_CONNECTION'))
+        print("Using the Code Engine read replica for read-only endpoints")
+elif get_replica_database_url():
+    if repository.dialect == 'postgresql':
+        replica_repository = SQLAlchemyRepository(create_database_engine(get_replica_database_url()),
+                                                  users='user', groups='group')
+        print("Using the read replica for read-only endpoints")
+    else:
+        print("Warning: a read replica needs a PostgreSQL primary, ignoring it")
+
+reads = ReplicaRouter(
+    repository, replica_repository,
+    max_lag=float(os.environ.get('REPLICA_MAX_LAG', 5)),
+    check_interval=float(os.environ.get('REPLICA_CHECK_INTERVAL', 1))
+)
+
+app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
 
 # Admin authentication configuration
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'demo-admin-2024')
 
+# Events sharing this database (see lab_events.py); requests pick one with ?event=
+DEFAULT_EVENT = normalize_event_id(os.environ.get('CHECKIN_DEFAULT_EVENT'))
+_known_events = set()
+
+def get_known_event(event_id):
+    """Return event_id if the event exists, else raise UnknownEvent; found ids are remembered"""
+    if event_id not in _known_events:
+        if not repository.get_event(event_id):
+            raise UnknownEvent(f"Unknown event '{event_id}'")
+        _known_events.add(event_id)
+    return event_id
+
+def current_event():
+    """Event named by the request's `event` query parameter, or DEFAULT_EVENT"""
+    return get_known_event(normalize_event_id(request.args.get('event'), DEFAULT_EVENT))
+
+@app.errorhandler(InvalidEventId)
+def invalid_event(error):
+    return jsonify({"success": False, "error": str(error)}), 400
+
+@app.errorhandler(UnknownEvent)
+def unknown_event(error):
+    return jsonify({"success": False, "error": str(error)}), 404
+
 # Database initialization function
 def ensure_database():
     """Ensure database tables exist"""
     try:
+        repository.ensure_tables()
+        if DEFAULT_EVENT != DEFAULT_EVENT_ID and repository.create_event(DEFAULT_EVENT):
+            print(f"Created default event '{DEFAULT_EVENT}'")
         if CODE_ENGINE_DEPLOYMENT:
-            # Use database.py operations for Code Engine
-            db_ops.ensure_tables()
             print("Database tables created successfully (Code Engine)")
         else:
-            # Use SQLAlchemy for OpenShift/local
-            with app.app_context():
-                db.create_all()
-                print("Database tables created successfully (SQLAlchemy)")
-                print(f"Database file location: {get_database_url()}")
-                
-                # Test the connection
-                result = db.session.execute(text('SELECT 1')).scalar()
-                print(f"Database connection test: {result}")
+            print(f"Database file location: {get_database_url()}")
             
     except Exception as e:
         print(f"Error creating database tables: {e}")
         raise
 
-# Database Models (only for SQLAlchemy deployment)
-if not CODE_ENGINE_DEPLOYMENT:
-    class User(db.Model):
-        id = db.Column(db.Integer, primary_key=True)
-        email = db.Column(db.String(255), unique=True, nullable=False)
-        group_name = db.Column(db.String(100), nullable=True)
-        checked_in_at = db.Column(db.DateTime, default=datetime.utcnow)
-        is_validated = db.Column(db.Boolean, default=False)
-        
-        def to_dict(self):
-            return {
-                'id': self.id,
-                'email': self.email,
-                'group_name': self.group_name,
-                'checked_in_at': self.checked_in_at.isoformat(),
-                'is_validated': self.is_validated
-            }
-
-    class Group(db.Model):
-        id = db.Column(db.Integer, primary_key=True)
-        name = db.Column(db.String(100), unique=True, nullable=False)
-        max_members = db.Column(db.Integer, default=3)
-        current_members = db.Column(db.Integer, default=0)
-        is_full = db.Column(db.Boolean, default=False)
-        created_at = db.Column(db.DateTime, default=datetime.utcnow)
-        
-        def to_dict(self):
-            return {
-                'id': self.id,
-                'name': self.name,
-                'max_members': self.max_members,
-                'current_members': self.current_members,
-                'is_full': self.is_full,
-                'created_at': self.created_at.isoformat()
-            }
+# User directory cache settings
+_cache_ttl = int(os.environ.get('IBM_USER_CACHE_TTL', 300))  # 5 minutes cache
+_cache_shared = os.environ.get('IBM_USER_CACHE_SHARED', 'true').lower() == 'true'
+_cache_check_interval = int(os.environ.get('IBM_USER_CACHE_CHECK_INTERVAL', 30))
 
-# Global cache for user list to avoid repeated API calls
-_user_cache = None
-_cache_timestamp = None
-_cache_ttl = 300  # 5 minutes cache
+def create_user_management_client():
+    """Build the IBM Cloud User Management client from the environment"""
+    api_key = os.environ.get('IBM_CLOUD_API_KEY')
+    service_url = os.environ.get('IBM_USER_MANAGEMENT_URL')
 
-def get_active_ibm_cloud_users():
-    """Fetch and cache active users from IBM Cloud account"""
-    global _user_cache, _cache_timestamp
-    
-    if not IBM_SDK_AVAILABLE:
-        print("IBM Cloud SDK not available")
-        return []
-    
-    # Check cache validity
-    current_time = time.time()
-    if _user_cache is not None and _cache_timestamp is not None:
-        if current_time - _cache_timestamp < _cache_ttl:
-            print("Using cached user list")
-            return _user_cache
-    
-    try:
-        # Initialize IBM Cloud authenticator
-        api_key = os.environ.get('IBM_CLOUD_API_KEY')
-        account_id = os.environ.get('IBM_CLOUD_ACCOUNT_ID')
-        
-        if not api_key:
-            print("IBM_CLOUD_API_KEY not set in environment")
-            return []
-        
-        if not account_id:
-            print("IBM_CLOUD_ACCOUNT_ID not set in environment")
-            return []
-        
-        print(f"Fetching users from IBM Cloud account: {account_id}")
-        
-        # Initialize User Management service
+    if api_key:
         authenticator = IAMAuthenticator(api_key)
-        user_management_service = UserManagementV1(authenticator=authenticator)
-        
-        # Fetch all users using pager
-        all_results = []
-        pager = UsersPager(
-            client=user_management_service,
-            account_id=account_id,
-        )
-        
-        while pager.has_next():
-            next_page = pager.get_next()
-            if next_page is not None:
-                all_results.extend(next_page)
-        
-        print(f"Fetched {len(all_results)} total users from IBM Cloud")
-        
-        # Filter for active users only
-        active_users = []
-        for user in all_results:
+    elif service_url:
+        # A local fake endpoint needs no IAM token
+        authenticator = NoAuthAuthenticator()
+    else:
+        raise ValueError("IBM_CLOUD_API_KEY not set in environment")
+
+    user_management_service = UserManagementV1(authenticator=authenticator)
+
+    # Point at a different User Management endpoint (e.g. a local fake)
+    if service_url:
+        user_management_service.set_service_url(service_url)
+
+    return user_management_service
+
+# Stats from the most recent account crawl in this process
+_last_crawl_stats = None
+
+def load_ibm_cloud_user_directory(client=None):
+    """Crawl the IBM Cloud account and index its active users.
+
+    Raises on configuration and API errors so the cache can back off and keep
+    serving its last good snapshot. Pass a stub client to run offline.
+    """
+    global _last_crawl_stats
+
+    account_id = os.environ.get('IBM_CLOUD_ACCOUNT_ID')
+    if not account_id:
+        raise ValueError("IBM_CLOUD_ACCOUNT_ID not set in environment")
+
+    if client is None:
+        client = create_user_management_client()
+
+    print(f"Fetching users from IBM Cloud account: {account_id}")
+
+    # Index active users page by page as the crawler delivers them
+    active_users = {}
+
+    def index_page(resources):
+        for user in resources:
             user_dict = user.to_dict() if hasattr(user, 'to_dict') else user
             status = user_dict.get('state', '').upper()
             email = user_dict.get('email', '')
-            
+
             if status == 'ACTIVE' and email:
-                active_users.append({
+                active_users[email.lower()] = {
                     'email': email.lower(),  # Normalize email to lowercase
                     'user_id': user_dict.get('user_id', ''),
                     'first_name': user_dict.get('first_name', ''),
                     'last_name': user_dict.get('last_name', ''),
                     'state': status
-                })
-        
-        print(f"Found {len(active_users)} active users")
-        
-        # Update cache
-        _user_cache = active_users
-        _cache_timestamp = current_time
-        
-        return active_users
-        
-    except Exception as e:
-        print(f"Error fetching IBM Cloud users: {e}")
-        return []
+                }
+
+    crawler = AccountUserCrawler(
+        client,
+        account_id,
+        page_size=int(os.environ.get('IBM_USER_CRAWL_PAGE_SIZE', 100)),
+        max_workers=int(os.environ.get('IBM_USER_CRAWL_WORKERS', 4))
+    )
+    stats = crawler.crawl(index_page)
+    _last_crawl_stats = stats
+
+    print(f"Fetched {stats['users']} total users from IBM Cloud in {stats['pages']} pages "
+          f"({stats['mode']}, {stats['duration_ms']}ms, first page {stats['time_to_first_page_ms']}ms)")
+    print(f"Found {len(active_users)} active users")
+
+    return UserDirectory(active_users.values())
+
+# Shared snapshot store in the app database, so one crawl serves every worker
+directory_store = repository
+
+# Refreshed in the background; requests always read the last good snapshot
+if _cache_shared:
+    shared_directory_loader = SharedDirectoryLoader(directory_store, load_ibm_cloud_user_directory, ttl=_cache_ttl)
+    user_directory_cache = DirectoryCache(shared_directory_loader, ttl=_cache_ttl, check_interval=_cache_check_interval)
+else:
+    shared_directory_loader = None
+    user_directory_cache = DirectoryCache(load_ibm_cloud_user_directory, ttl=_cache_ttl)
+
+# Live dashboard events, fanned out across workers with LISTEN/NOTIFY on PostgreSQL
+EVENTS_CHANNEL = 'checkin_events'
+event_bus = EventBus()
+
+# Dashboard counts are served from a short-lived snapshot per event; every
+# write event (local, or relayed from another worker) drops its event's
+# snapshot so the next read is fresh
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', '2'))
+stats_snapshots = EventPartitions(lambda event_id: CachedSnapshot(lambda: load_stats(event_id), ttl=STATS_CACHE_TTL))
+
+def invalidate_stats(event_type, data):
+    for stats_snapshot in stats_snapshots.existing(event_of(event_type, data)):
+        stats_snapshot.invalidate()
+
+event_bus.add_listener(invalidate_stats)
+
+# Group rosters for /api/lookup, per event, dropped per group as check-ins and removals land
+ROSTER_CACHE_TTL = float(os.environ.get('ROSTER_CACHE_TTL', '60'))
+roster_caches = EventPartitions(lambda event_id: GroupRosterCache(ttl=ROSTER_CACHE_TTL))
+
+def invalidate_rosters(event_type, data):
+    for roster_cache in roster_caches.existing(event_of(event_type, data)):
+        if event_type == 'checkin':
+            roster_cache.invalidate((data.get('group') or {}).get('name') or data['user'].get('group_name'))
+        elif event_type == 'removal':
+            roster_cache.invalidate(data.get('group_name'))
+        elif event_type == 'checkins_stored':
+            for group_name in data['groups']:
+                roster_cache.invalidate(group_name)
+        else:
+            # Migrations, resets and resyncs can touch any group
+            roster_cache.invalidate()
+
+event_bus.add_listener(invalidate_rosters)
+
+if repository.dialect == 'postgresql':
+    # LISTEN runs on a dedicated connection, kept out of the request pool
+    event_bus.relay = PostgresRelay(event_bus, repository.connect_to_database,
+                                    lambda payload: repository.notify(EVENTS_CHANNEL, payload),
+                                    channel=EVENTS_CHANNEL)
+
+# Write-behind admission: acknowledge check-ins from memory and a local
+# journal, and store them in batches from a background writer
+CHECKIN_WRITE_BEHIND = os.environ.get('CHECKIN_WRITE_BEHIND', 'false').lower() == 'true'
+
+def store_checkins(records):
+    """Writer-thread flush: one multi-row INSERT per event in the batch, then a recount of its groups"""
+    by_event = {}
+    for record in records:
+        by_event.setdefault(record.get('event_id', DEFAULT_EVENT_ID), []).append(record)
+
+    for event_id, event_records in by_event.items():
+        groups = repository.insert_checkins(event_records, event_id=event_id)
+
+        # Stored check-ins leave the queue next; the index must know them first
+        if registered_indexes is not None:
+            for registered_index in registered_indexes.existing(event_id):
+                for record in event_records:
+                    registered_index.add({key: record[key] for key in ('email', 'group_name', 'checked_in_at')})
+
+        # Counts and rosters read before this landed are stale in every worker
+        event_bus.publish('checkins_stored', {"event_id": event_id, "stored": len(event_records), "groups": groups})
+
+def load_registered_index(event_id):
+    return {user['email']: user
+            for user in repository.iter_users({}, batch_size=REGISTERED_STREAM_BATCH, event_id=event_id)}
+
+if CHECKIN_WRITE_BEHIND:
+    write_behind_queue = WriteBehindQueue(
+        store_checkins,
+        os.environ.get('CHECKIN_JOURNAL_DIR', os.path.join(tempfile.gettempdir(), 'checkin-journal')),
+        batch_size=int(os.environ.get('CHECKIN_BATCH_SIZE', 200)),
+        flush_interval=int(os.environ.get('CHECKIN_FLUSH_INTERVAL_MS', 50)) / 1000,
+        max_attempts=int(os.environ.get('CHECKIN_MAX_FLUSH_ATTEMPTS', 5)),
+        is_transient=repository.is_transient_error
+    )
+    # Every event draws slots from its own counter and has its own index
+    _slot_block = int(os.environ.get('CHECKIN_SLOT_BLOCK', 6))
+    slot_allocators = EventPartitions(lambda event_id: SlotAllocator(
+        lambda count: repository.reserve_slots(count, event_id=event_id), block_size=_slot_block))
+    registered_indexes = EventPartitions(lambda event_id: RegisteredIndex(lambda: load_registered_index(event_id)))
+
+    def update_registered_index(event_type, data):
+        event_id = event_of(event_type, data)
+        for registered_index in registered_indexes.existing(event_id):
+            if event_type == 'checkin':
+                registered_index.add(data['user'])
+            elif event_type == 'removal':
+                registered_index.discard(data['email'])
+            elif event_type != 'checkins_stored':
+                registered_index.invalidate()
+        if event_type == 'reset':
+            for slot_allocator in slot_allocators.existing(event_id):
+                slot_allocator.clear()
+
+    event_bus.add_listener(update_registered_index)
+else:
+    write_behind_queue = slot_allocators = registered_indexes = None
+
+# Responses to check-ins sent with an Idempotency-Key, replayed for retries
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', 300))
+IDEMPOTENCY_DB_TTL = float(os.environ.get('IDEMPOTENCY_DB_TTL', 86400))
+
+def create_idempotency_cache(event_id):
+    def load(key, email):
+        return repository.get_idempotent_response(key, email, IDEMPOTENCY_DB_TTL, event_id=event_id)
+
+    def save(key, email, status_code, response):
+        repository.save_idempotent_response(key, email, status_code, response, event_id=event_id)
+
+    # Write-behind mode answers without touching the database, so its replays stay in memory
+    return IdempotencyCache(
+        load=None if CHECKIN_WRITE_BEHIND else load,
+        save=None if CHECKIN_WRITE_BEHIND else save,
+        ttl=IDEMPOTENCY_TTL
+    )
+
+idempotency_caches = EventPartitions(create_idempotency_cache)
+
+def clear_idempotency_cache(event_type, data):
+    if event_type == 'reset':
+        for idempotency_cache in idempotency_caches.existing(event_of(event_type, data)):
+            idempotency_cache.clear()
+
+event_bus.add_listener(clear_idempotency_cache)
+
+def drain_pending_checkins():
+    """Store queued check-ins before an admin write that must see them"""
+    if write_behind_queue is not None and not write_behind_queue.drain():
+        raise RuntimeError("Timed out storing queued check-ins")
+
+def get_ibm_cloud_user_directory():
+    """Cached active users from IBM Cloud account as an email-keyed index"""
+    if not IBM_SDK_AVAILABLE:
+        print("IBM Cloud SDK not available")
+        return UserDirectory()
+
+    return user_directory_cache.get()
+
+def get_active_ibm_cloud_users():
+    """Active users from IBM Cloud account, ordered by email"""
+    return get_ibm_cloud_user_directory().users
 
 def validate_user_with_ibm_cloud(email):
     """Validate user email against IBM Cloud account active user list"""
@@ -225,149 +414,114 @@ def validate_user_with_ibm_cloud(email):
         return email.lower().endswith('.com') or 'ibm' in email.lower()
     
     # Get active users from IBM Cloud
-    active_users = get_active_ibm_cloud_users()
-    
-    if not active_users:
+    return validate_user_in_directory(email, get_ibm_cloud_user_directory())
+
+# Seconds clients are asked to wait while the first directory crawl runs
+DIRECTORY_WARMING_RETRY_AFTER = 5
+
+def directory_warming_up():
+    """503 for a check-in or import that cannot be validated until the first crawl finishes"""
+    response = jsonify({
+        "success": False,
+        "error": "Attendee validation is still starting up, please try again shortly",
+        "retry_after": DIRECTORY_WARMING_RETRY_AFTER
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(DIRECTORY_WARMING_RETRY_AFTER)
+    return response
+
+def validate_user_in_directory(email, directory):
+    """Check an email against a loaded IBM Cloud user directory snapshot"""
+    if not directory:
         print("No active users found or API error, falling back to basic validation")
         # Fallback to basic email validation if API fails
         return '@' in email and '.' in email and email.lower().endswith('.com')
     
     # Check if email exists in active user list
-    email_lower = email.lower().strip()
-    for user in active_users:
-        if user['email'] == email_lower:
-            print(f"User validated: {email} (ID: {user['user_id']})")
-            return True
+    user = directory.get(email)
+    if user:
+        print(f"User validated: {email} (ID: {user['user_id']})")
+        return True
     
     print(f"User not found in active user list: {email}")
     return False
 
-def get_group_letter_and_vpc(group_index):
-    """Convert group index (0-24) to letter (a-y) and VPC number (1-5)"""
-    if group_index < 0 or group_index >= 25:
-        raise ValueError(f"Group index {group_index} out of range (0-24)")
-    
-    # Convert to letter (a-y)
-    group_letter = chr(ord('a') + group_index)
-    
-    # Calculate VPC (5 groups per VPC)
-    vpc_number = (group_index // 5) + 1
-    
-    return group_letter, vpc_number
+def remember_write():
+    """Keep this client's next reads off a replica that has not replayed its write yet"""
+    if reads.replica is None or not has_request_context():
+        return
+    try:
+        session['write_position'] = repository.get_write_position()
+    except Exception as e:
+        print(f"Could not read the primary WAL position: {e}")
 
-def get_next_available_group():
-    """Get the next available group or create a new one"""
-    if CODE_ENGINE_DEPLOYMENT:
-        # Use database.py operations
-        available_group = db_ops.get_available_group()
-        
-        if available_group:
-            return available_group
-        
-        # Create a new group with letter naming
-        group_count = db_ops.get_group_count()
-        
-        # Ensure we don't exceed 25 groups (a-y)
-        if group_count >= 25:
-            raise ValueError("Maximum number of groups (25) reached")
-        
-        group_letter, vpc_number = get_group_letter_and_vpc(group_count)
-        new_group_name = f"Group {group_letter.upper()}"
-        
-        group_id = db_ops.create_group(new_group_name)
-        return db_ops.get_group_by_name(new_group_name)
-    else:
-        # Use SQLAlchemy operations
-        available_group = Group.query.filter_by(is_full=False).first()
-        
-        if available_group:
-            return available_group
-        
-        # Create a new group with letter naming
-        group_count = Group.query.count()
-        
-        # Ensure we don't exceed 25 groups (a-y)
-        if group_count >= 25:
-            raise ValueError("Maximum number of groups (25) reached")
-        
-        group_letter, vpc_number = get_group_letter_and_vpc(group_count)
-        new_group_name = f"Group {group_letter.upper()}"
-        
-        new_group = Group(name=new_group_name)
-        db.session.add(new_group)
-        db.session.commit()
-        
-        return new_group
+def read_position():
+    """Primary WAL position after this client's last write, for read-your-writes"""
+    return session.get('write_position') if reads.replica is not None else None
 
-def get_vpc_info_from_group_name(group_name):
-    """Extract VPC information from group name (supports both old numeric and new letter formats)"""
-    if not group_name or not group_name.startswith("Group "):
-        return None, None
-    
-    try:
-        # Extract the part after "Group "
-        group_identifier = group_name.replace("Group ", "").strip()
-        
-        # Check if it's a letter format (new system)
-        if len(group_identifier) == 1 and group_identifier.isalpha():
-            group_letter = group_identifier.lower()
-            group_index = ord(group_letter) - ord('a')
-            
-            if group_index < 0 or group_index >= 25:
-                return None, None
-            
-            # Calculate VPC number
-            vpc_number = (group_index // 5) + 1
-            return group_letter.upper(), vpc_number
-        
-        # Check if it's a numeric format (old system) - convert to letter
-        elif group_identifier.isdigit():
-            group_number = int(group_identifier)
-            # Convert group number to index (Group 1 = index 0, Group 2 = index 1, etc.)
-            group_index = group_number - 1
-            
-            if group_index < 0 or group_index >= 25:
-                return None, None
-            
-            # Convert to letter
-            group_letter = chr(ord('a') + group_index).upper()
-            vpc_number = (group_index // 5) + 1
-            
-            return group_letter, vpc_number
-        
-        return None, None
-    except:
-        return None, None
+def remove_users(emails=None, group_name=None, event_id=DEFAULT_EVENT):
+    """Delete an event's users by email list or by group in one statement, then recount their groups.
 
-def assign_user_to_group(user_data):
-    """Assign user to an available group"""
-    group = get_next_available_group()
-    
-    if CODE_ENGINE_DEPLOYMENT:
-        # user_data is a dict from database.py operations
-        # Update user's group assignment
-        user_id = user_data['id']
-        group_name = group['name']
-        
-        # Update user with group assignment (this would need to be implemented in database.py)
-        # For now, we'll handle this in the calling function
-        
-        # Update group member count
-        db_ops.update_group_members(group_name, 1)
-        
-        # Return updated group info
-        return db_ops.get_group_by_name(group_name)
-    else:
-        # user is a SQLAlchemy User object
-        user_data['group_name'] = group.name if hasattr(group, 'name') else group['name']
-        group.current_members += 1
-        
-        # Mark group as full if it reaches max capacity
-        if group.current_members >= group.max_members:
-            group.is_full = True
-        
-        db.session.commit()
-        return group
+    Returns the removed users and a per-group summary; everything happens in
+    a single transaction.
+    """
+    drain_pending_checkins()
+    result = repository.remove_users(emails=emails, group_name=group_name, event_id=event_id)
+    remember_write()
+    return result
+
+# Admission control for the public endpoints: a token bucket per client IP and
+# a per-worker cap on requests in progress, both answering 429 when exceeded
+RATE_LIMIT_PER_SECOND = float(os.environ.get('RATE_LIMIT_PER_SECOND', 10))
+TRUST_PROXY_HEADERS = os.environ.get('TRUST_PROXY_HEADERS', 'false').lower() == 'true'
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1))
+
+rate_limiter = TokenBucketLimiter(
+    rate=RATE_LIMIT_PER_SECOND,
+    burst=int(os.environ.get('RATE_LIMIT_BURST', 50))
+) if RATE_LIMIT_PER_SECOND > 0 else None
+
+# By default no more requests than the worker has pooled database connections
+_max_concurrent = int(os.environ.get('ADMISSION_MAX_CONCURRENT',
+                                     repository.pool.max_size if CODE_ENGINE_DEPLOYMENT else 8))
+concurrency_limiter = ConcurrencyLimiter(
+    limit=_max_concurrent,
+    queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 2))
+) if _max_concurrent > 0 else None
+
+def get_client_ip():
+    """Client address, taken from X-Forwarded-For behind the OpenShift router or Code Engine"""
+    if TRUST_PROXY_HEADERS:
+        forwarded = forwarded_client_ip(request.headers.get('X-Forwarded-For', ''), TRUSTED_PROXY_HOPS)
+        if forwarded:
+            return forwarded
+    return request.remote_addr or 'unknown'
+
+def too_many_requests(message, retry_after):
+    response = jsonify({"success": False, "error": message, "retry_after": retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def admission_controlled(view):
+    """Rate-limit a view per client IP and cap how many run at once"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if rate_limiter is not None:
+            wait = rate_limiter.acquire(get_client_ip())
+            if wait:
+                return too_many_requests("Too many requests, please try again shortly", math.ceil(wait))
+
+        if concurrency_limiter is None:
+            return view(*args, **kwargs)
+        if not concurrency_limiter.acquire():
+            return too_many_requests("The server is busy, please try again shortly",
+                                     concurrency_limiter.retry_after())
+        try:
+            return view(*args, **kwargs)
+        finally:
+            concurrency_limiter.release()
+    return wrapper
 
 def is_admin_authenticated():
     """Check if the current session is authenticated as admin"""
@@ -382,13 +536,13 @@ def authenticate_admin(password):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', event_id=current_event())
 
 @app.route('/registered')
 def registered_users():
     if not is_admin_authenticated():
         return redirect(url_for('admin_login'))
-    return render_template('registered.html')
+    return render_template('registered.html', event_id=current_event())
 
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
@@ -405,139 +559,279 @@ def admin_logout():
     session.pop('admin_authenticated', None)
     return redirect(url_for('index'))
 
+def already_checked_in(group_name, checked_in_at):
+    group_letter, vpc_number = get_vpc_info_from_group_name(group_name)
+    return jsonify({
+        "success": True,
+        "message": "You have already checked in!",
+        "group_name": group_name,
+        "group_letter": group_letter,
+        "vpc_number": vpc_number,
+        "checked_in_at": checked_in_at,
+        "already_registered": True
+    })
+
+def admit_checkin(email, event_id):
+    """Write-behind check-in: answered from memory, stored by the background writer.
+
+    The attendee is checked against the registered index and the unflushed
+    queue, validated against the cached directory, and given the group of a
+    preallocated slot. The response goes out once the check-in is journaled.
+    """
+    # Keeps the registered index current with other workers' check-ins
+    event_bus.start_relay()
+    registered_index = registered_indexes.get(event_id)
+    existing = registered_index.get(email) or write_behind_queue.get_pending(email, event_id)
+    if existing:
+        return already_checked_in(existing['group_name'], existing['checked_in_at'])
+
+    if not validate_user_with_ibm_cloud(email):
+        return jsonify({
+            "success": False,
+            "error": "Email not found in authorized user list"
+        }), 403
+
+    # Taken before the queue lock: reserving a new block is a database round trip
+    slot_allocator = slot_allocators.get(event_id)
+    slot = slot_allocator.take()
+    group_name, group_letter, vpc_number = get_group_for_slot(slot)
+    record = {
+        'email': email,
+        'group_name': group_name,
+        'checked_in_at': datetime.utcnow().isoformat(),
+        'is_validated': True,
+        'slot': slot,
+        'event_id': event_id
+    }
+
+    # Checked again under the queue lock: a concurrent check-in for this email may have won
+    record, created = write_behind_queue.submit_if_absent(record, registered_index.get)
+    if not created:
+        slot_allocator.put_back(slot)
+        return already_checked_in(record['group_name'], record['checked_in_at'])
+
+    user = {key: record[key] for key in ('email', 'group_name', 'checked_in_at', 'is_validated')}
+
+    # Slots fill groups in order, so the slot gives the member count
+    group = {
+        'name': group_name,
+        'max_members': GROUP_SIZE,
+        'current_members': slot % GROUP_SIZE + 1,
+        'is_full': slot % GROUP_SIZE + 1 >= GROUP_SIZE
+    }
+    event_bus.publish('checkin', {"event_id": event_id, "user": user, "group": group})
+
+    return jsonify({
+        "success": True,
+        "message": "Successfully checked in!",
+        "group_name": group_name,
+        "group_letter": group_letter,
+        "vpc_number": vpc_number,
+        "group_members": group['current_members'],
+        "group_max": group['max_members'],
+        "checked_in_at": user['checked_in_at'],
+        "already_registered": False
+    })
+
 @app.route('/api/checkin', methods=['POST'])
+@admission_controlled
 def checkin_user():
+    """Check in; a retry with the same Idempotency-Key gets the first attempt's response"""
+    event_id = current_event()
+    data = request.get_json(silent=True) or {}
+    email = (data.get('email') or '').strip().lower()
+    key = request.headers.get('Idempotency-Key', '').strip()
+    if not key or not email:
+        return process_checkin(email, event_id)
+    if len(key) > MAX_KEY_LENGTH:
+        return jsonify({"success": False, "error": "Idempotency-Key is too long"}), 400
+
+    def operation():
+        response = app.make_response(process_checkin(email, event_id))
+        return response.status_code, response.get_data(as_text=True)
+
+    (status, body), replayed = idempotency_caches.get(event_id).run(key, email, operation)
+    response = Response(body, status=status, mimetype='application/json')
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def process_checkin(email, event_id=DEFAULT_EVENT):
     try:
-        data = request.json or {}
-        email = data.get('email', '').strip().lower()
-        
         if not email:
             return jsonify({"success": False, "error": "Email is required"}), 400
-        
-        if CODE_ENGINE_DEPLOYMENT:
-            # Check if user already exists using database.py
-            existing_user = db_ops.get_user_by_email(email)
-            if existing_user:
-                group_letter, vpc_number = get_vpc_info_from_group_name(existing_user['group_name'])
-                return jsonify({
-                    "success": True,
-                    "message": "You have already checked in!",
-                    "group_name": existing_user['group_name'],
-                    "group_letter": group_letter,
-                    "vpc_number": vpc_number,
-                    "checked_in_at": existing_user['checked_in_at'],
-                    "already_registered": True
-                })
-            
-            # Validate user with IBM Cloud
-            is_valid = validate_user_with_ibm_cloud(email)
-            if not is_valid:
-                return jsonify({
-                    "success": False,
-                    "error": "Email not found in authorized user list"
-                }), 403
-            
-            # Create new user
-            user_id = db_ops.create_user(email, is_validated=True)
-            new_user = db_ops.get_user_by_id(user_id)
-            
-            # Assign to group
-            group = assign_user_to_group(new_user)
-            
-            # Update user with group assignment
-            db_ops.update_user_group(user_id, group['name'])
-            updated_user = db_ops.get_user_by_id(user_id)
-            
-            group_letter, vpc_number = get_vpc_info_from_group_name(group['name'])
-            
-            return jsonify({
-                "success": True,
-                "message": "Successfully checked in!",
-                "group_name": group['name'],
-                "group_letter": group_letter,
-                "vpc_number": vpc_number,
-                "group_members": group['current_members'],
-                "group_max": group['max_members'],
-                "checked_in_at": updated_user['checked_in_at'],
-                "already_registered": False
-            })
+
+        if write_behind_queue is not None:
+            return admit_checkin(email, event_id)
+
+        # Validate user with IBM Cloud
+        is_valid = validate_user_with_ibm_cloud(email)
+        if is_valid:
+            # Upsert, group assignment and read-back in one transaction
+            result = repository.checkin(email, event_id=event_id)
+            user = result['user']
+            group = result['group']
         else:
-            # Check if user already exists using SQLAlchemy
-            existing_user = User.query.filter_by(email=email).first()
-            if existing_user:
-                group_letter, vpc_number = get_vpc_info_from_group_name(existing_user.group_name)
-                return jsonify({
-                    "success": True,
-                    "message": "You have already checked in!",
-                    "group_name": existing_user.group_name,
-                    "group_letter": group_letter,
-                    "vpc_number": vpc_number,
-                    "checked_in_at": existing_user.checked_in_at.isoformat(),
-                    "already_registered": True
-                })
-            
-            # Validate user with IBM Cloud
-            is_valid = validate_user_with_ibm_cloud(email)
-            if not is_valid:
+            # Attendees who already checked in keep their group
+            user = repository.get_user_by_email(email, event_id=event_id)
+            if not user:
                 return jsonify({
                     "success": False,
                     "error": "Email not found in authorized user list"
                 }), 403
-            
-            # Create new user
-            new_user = User(email=email, is_validated=True)
-            db.session.add(new_user)
-            db.session.flush()  # Get the ID without committing
-            
-            # Assign to group
-            group = assign_user_to_group(new_user)
-            group_letter, vpc_number = get_vpc_info_from_group_name(new_user.group_name)
-            
-            return jsonify({
-                "success": True,
-                "message": "Successfully checked in!",
-                "group_name": new_user.group_name,
-                "group_letter": group_letter,
-                "vpc_number": vpc_number,
-                "group_members": group.current_members,
-                "group_max": group.max_members,
-                "checked_in_at": new_user.checked_in_at.isoformat(),
-                "already_registered": False
-            })
+            result = {'already_registered': True}
+
+        if result['already_registered']:
+            return already_checked_in(user['group_name'], user['checked_in_at'])
+
+        group_letter, vpc_number = get_vpc_info_from_group_name(user['group_name'])
+
+        event_bus.publish('checkin', {"event_id": event_id, "user": user, "group": group})
+        remember_write()
+
+        return jsonify({
+            "success": True,
+            "message": "Successfully checked in!",
+            "group_name": group['name'],
+            "group_letter": group_letter,
+            "vpc_number": vpc_number,
+            "group_members": group['current_members'],
+            "group_max": group['max_members'],
+            "checked_in_at": user['checked_in_at'],
+            "already_registered": False
+        })
         
+    except DirectoryWarmingUp:
+        return directory_warming_up()
     except Exception as e:
-        if not CODE_ENGINE_DEPLOYMENT:
-            db.session.rollback()
         print(f"Check-in error: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+# Page size limits for /api/registered
+REGISTERED_PAGE_SIZE = 100
+REGISTERED_MAX_PAGE_SIZE = 500
+REGISTERED_STREAM_BATCH = 500
+
+def parse_user_filters(args):
+    """Group, VPC and email prefix filters from query parameters"""
+    filters = {}
+    if args.get('group'):
+        filters['group_name'] = normalize_group_name(args['group'])
+    if args.get('vpc'):
+        filters['group_names'] = get_group_names_for_vpc(int(args['vpc']))
+    if args.get('email_prefix'):
+        filters['email_prefix'] = args['email_prefix'].strip().lower()
+    return filters
+
+def encode_user_cursor(user):
+    """Opaque keyset cursor pointing just past this user"""
+    raw = f"{user['checked_in_at']}|{user['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_user_cursor(cursor):
+    """Inverse of encode_user_cursor; raises ValueError on a malformed cursor"""
+    try:
+        checked_in_at, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(checked_in_at), int(user_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def get_registered_page(filters, after, limit, event_id):
+    """One page of matching users; returns (users, has_more)"""
+    return reads.run(lambda db: db.get_users_page(filters, after=after, limit=limit, event_id=event_id),
+                     read_position())
+
+def count_registered_users(filters, event_id):
+    return reads.run(lambda db: db.count_users(filters, event_id=event_id), read_position())
+
+def iter_registered_users(filters, event_id):
+    """Stream matching users without loading them all (server-side cursor on PostgreSQL)"""
+    return reads.iterate(lambda db: db.iter_users(filters, batch_size=REGISTERED_STREAM_BATCH, event_id=event_id),
+                         read_position())
+
+def get_all_group_dicts(event_id):
+    return reads.run(lambda db: db.get_all_groups(event_id=event_id), read_position())
+
 @app.route('/api/registered')
 def get_registered_users():
+    """Registered users and groups.
+
+    With `limit` or `cursor`, returns one page of users (newest first) plus a
+    `next_cursor`; the first page also carries the filtered total and the
+    groups. Without them, every matching user is streamed as chunked JSON.
+    Filters: `group`, `vpc`, `email_prefix`; `event` picks the event.
+    """
+    event_id = current_event()
     try:
-        users = User.query.order_by(User.checked_in_at.desc()).all()
-        groups = Group.query.all()
-        
-        # Group users by their assigned groups
-        grouped_users = {}
-        for user in users:
-            if user.group_name not in grouped_users:
-                grouped_users[user.group_name] = []
-            grouped_users[user.group_name].append(user.to_dict())
-        
-        return jsonify({
-            "total_users": len(users),
-            "total_groups": len(groups),
-            "users": [user.to_dict() for user in users],
-            "groups": [group.to_dict() for group in groups],
-            "grouped_users": grouped_users
-        })
-        
+        filters = parse_user_filters(request.args)
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit')
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
+
+    if cursor or limit:
+        try:
+            after = decode_user_cursor(cursor) if cursor else None
+            limit = min(max(int(limit or REGISTERED_PAGE_SIZE), 1), REGISTERED_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            users, has_more = get_registered_page(filters, after, limit, event_id)
+            page = {
+                "users": users,
+                "has_more": has_more,
+                "next_cursor": encode_user_cursor(users[-1]) if has_more else None,
+                "limit": limit
+            }
+            if after is None:
+                groups = get_all_group_dicts(event_id)
+                page["total_users"] = count_registered_users(filters, event_id)
+                page["total_groups"] = len(groups)
+                page["groups"] = groups
+            return jsonify(page)
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    try:
+        groups = get_all_group_dicts(event_id)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    def generate():
+        yield '{"total_groups": %d, "groups": %s, "users": [' % (len(groups), json.dumps(groups))
+        total_users = 0
+        batch = []
+        for user in iter_registered_users(filters, event_id):
+            batch.append(json.dumps(user))
+            total_users += 1
+            if len(batch) >= REGISTERED_STREAM_BATCH:
+                yield (',' if total_users > len(batch) else '') + ','.join(batch)
+                batch = []
+        if batch:
+            yield (',' if total_users > len(batch) else '') + ','.join(batch)
+        yield '], "total_users": %d}' % total_users
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def load_user_roster(email, event_id):
+    """The user, their group and every member of it in one joined query.
+
+    Also returns whether it was read from the replica, which may be up to
+    REPLICA_MAX_LAG seconds behind.
+    """
+    source = {}
+    def read(db):
+        source['replica'] = db is not repository
+        return db.get_user_roster(email, event_id=event_id)
+    return reads.run(read, read_position()), source['replica']
+
 @app.route('/api/lookup', methods=['POST'])
+@admission_controlled
 def lookup_user_group():
     """Look up a user's group by their email address"""
+    event_id = current_event()
     try:
         data = request.json or {}
         email = data.get('email', '').strip().lower()
@@ -548,39 +842,47 @@ def lookup_user_group():
                 "error": "Email address is required"
             }), 400
         
-        # Find user by email
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            return jsonify({
-                "success": False,
-                "error": "User not found. Please check your email address or register first.",
-                "email": email
-            }), 404
+        # Cached rosters must hear about writes made by other workers
+        event_bus.start_relay()
+
+        roster_cache = roster_caches.get(event_id)
+        cached = roster_cache.get(email)
+        if cached:
+            user, roster = cached
+            group, members = roster['group'], roster['members']
+        else:
+            token = roster_cache.begin()
+            result, from_replica = load_user_roster(email, event_id)
+            if not result:
+                return jsonify({
+                    "success": False,
+                    "error": "User not found. Please check your email address or register first.",
+                    "email": email
+                }), 404
+            user, group, members = result['user'], result['group'], result['members']
+            if group:
+                # A replica read may miss a write it has not replayed yet, so keep it only briefly
+                roster_cache.put(group, members, token, ttl=reads.max_lag if from_replica else None)
         
         # Get group information if user has a group
         group_info = None
-        group_letter, vpc_number = get_vpc_info_from_group_name(user.group_name)
+        group_letter, vpc_number = get_vpc_info_from_group_name(user['group_name'])
         
-        if user.group_name:
-            group = Group.query.filter_by(name=user.group_name).first()
-            if group:
-                group_info = group.to_dict()
-                # Get other group members
-                group_members = User.query.filter_by(group_name=user.group_name).all()
-                group_info['members'] = [u.email for u in group_members]
-                group_info['group_letter'] = group_letter
-                group_info['vpc_number'] = vpc_number
+        if group:
+            group_info = dict(group)
+            group_info['members'] = [member['email'] for member in members]
+            group_info['group_letter'] = group_letter
+            group_info['vpc_number'] = vpc_number
         
         return jsonify({
             "success": True,
             "user": {
-                "email": user.email,
-                "group_name": user.group_name,
+                "email": user['email'],
+                "group_name": user['group_name'],
                 "group_letter": group_letter,
                 "vpc_number": vpc_number,
-                "checked_in_at": user.checked_in_at.isoformat() if user.checked_in_at else None,
-                "is_validated": user.is_validated
+                "checked_in_at": user['checked_in_at'],
+                "is_validated": user['is_validated']
             },
             "group": group_info
         })
@@ -591,33 +893,74 @@ def lookup_user_group():
             "error": f"Lookup failed: {str(e)}"
         }), 500
 
+def load_stats(event_id):
+    """All of an event's dashboard counts from one aggregate query"""
+    counts = reads.run(lambda db: db.get_stats(event_id=event_id))
+    counts["average_group_size"] = round(counts["total_users"] / max(counts["total_groups"], 1), 1)
+    return counts
+
 @app.route('/api/stats')
 def get_stats():
+    stats_snapshot = stats_snapshots.get(current_event())
     try:
-        total_users = User.query.count()
-        total_groups = Group.query.count()
-        full_groups = Group.query.filter_by(is_full=True).count()
-        available_groups = Group.query.filter_by(is_full=False).count()
-        
-        return jsonify({
-            "total_users": total_users,
-            "total_groups": total_groups,
-            "full_groups": full_groups,
-            "available_groups": available_groups,
-            "average_group_size": round(total_users / max(total_groups, 1), 1)
-        })
+        return jsonify(stats_snapshot.get())
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/health')
 def health_check():
-    return jsonify({
+    health = {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "version": "1.0.0",
         "ibm_sdk_available": IBM_SDK_AVAILABLE
-    })
+    }
+    health["database_pool"] = repository.get_pool_stats()
+    health["read_replica"] = reads.get_stats()
+    health["events"] = event_bus.get_stats()
+    health["stats_cache"] = stats_snapshots.get_stats()
+    health["roster_cache"] = roster_caches.get_stats()
+    health["idempotency"] = idempotency_caches.get_stats()
+    health["admission"] = {
+        "rate_limit": rate_limiter.get_stats() if rate_limiter else None,
+        "concurrency": concurrency_limiter.get_stats() if concurrency_limiter else None
+    }
+    if write_behind_queue is not None:
+        health["write_behind"] = dict(write_behind_queue.get_stats(), slot_reservations=sum(
+            slot_allocator.reservations for slot_allocator in slot_allocators.existing()))
+    return jsonify(health)
+
+@app.route('/api/events')
+def stream_events():
+    """Server-Sent Events stream of one event's check-ins, removals and group changes for the admin dashboard"""
+    if not is_admin_authenticated():
+        return jsonify({"error": "Authentication required"}), 401
+
+    event_id = current_event()
+    subscriber = event_bus.subscribe()
+
+    def generate():
+        try:
+            # Clients reload a full snapshot on (re)connect, then apply deltas
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=15)
+                except queue.Empty:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                if event_of(event['type'], event['data']) not in (None, event_id):
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            event_bus.unsubscribe(subscriber)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/debug/active-users')
 def get_active_users():
@@ -626,7 +969,9 @@ def get_active_users():
         active_users = get_active_ibm_cloud_users()
         return jsonify({
             "total_active_users": len(active_users),
-            "cache_age_seconds": int(time.time() - _cache_timestamp) if _cache_timestamp else None,
+            **user_directory_cache.get_stats(),
+            "shared_cache": shared_directory_loader.get_stats() if shared_directory_loader else None,
+            "last_crawl": _last_crawl_stats,
             "ibm_sdk_available": IBM_SDK_AVAILABLE,
             "api_key_configured": bool(os.environ.get('IBM_CLOUD_API_KEY')),
             "account_id_configured": bool(os.environ.get('IBM_CLOUD_ACCOUNT_ID')),
@@ -644,107 +989,288 @@ def get_active_users():
 @app.route('/api/debug/clear-cache', methods=['POST'])
 def clear_user_cache():
     """Clear the user cache to force refresh"""
-    global _user_cache, _cache_timestamp
-    _user_cache = None
-    _cache_timestamp = None
+    if shared_directory_loader:
+        # Re-crawl instead of reloading the shared snapshot
+        shared_directory_loader.expire()
+    user_directory_cache.clear()
     return jsonify({"message": "User cache cleared successfully"})
 
+def plan_group_migration(event_id=DEFAULT_EVENT):
+    """Numeric-to-letter renames, planned from one aggregate query over the event's groups and members"""
+    return plan_letter_migration(repository.get_group_member_counts(event_id=event_id))
+
+def apply_group_migration(plan, event_id=DEFAULT_EVENT):
+    """Apply a plan from plan_group_migration(); cost does not grow with the number of users"""
+    renames = [(step['old_name'], step['new_name']) for step in plan]
+    if not renames:
+        return {'groups_renamed': 0, 'users_updated': 0}
+    drain_pending_checkins()
+    result = repository.rename_groups(renames, event_id=event_id)
+    remember_write()
+    event_bus.publish('migration', {"event_id": event_id, "groups_migrated": result['groups_renamed']})
+    return result
+
 @app.route('/api/admin/migrate-groups', methods=['POST'])
 def migrate_groups_to_letters():
-    """Migrate existing numeric groups to letter-based groups"""
+    """Migrate existing numeric groups to letter-based groups (`dry_run` returns the plan only)"""
     if not is_admin_authenticated():
         return jsonify({"error": "Authentication required"}), 401
     
+    event_id = current_event()
+    data = request.get_json(silent=True) or {}
+    dry_run = bool(data.get('dry_run')) or request.args.get('dry_run', 'false').lower() == 'true'
+
     try:
-        # Get all groups and users that need migration
-        numeric_groups = Group.query.filter(Group.name.like('Group %')).all()
-        migration_results = []
-        
-        for group in numeric_groups:
-            # Extract the number from "Group 1", "Group 2", etc.
-            group_identifier = group.name.replace("Group ", "").strip()
-            
-            # Only migrate numeric groups
-            if group_identifier.isdigit():
-                group_number = int(group_identifier)
-                group_index = group_number - 1  # Group 1 = index 0
-                
-                if 0 <= group_index < 25:
-                    # Convert to letter
-                    new_letter = chr(ord('a') + group_index).upper()
-                    old_name = group.name
-                    new_name = f"Group {new_letter}"
-                    
-                    # Update group name
-                    group.name = new_name
-                    
-                    # Update all users in this group
-                    users_in_group = User.query.filter_by(group_name=old_name).all()
-                    for user in users_in_group:
-                        user.group_name = new_name
-                    
-                    migration_results.append({
-                        "old_name": old_name,
-                        "new_name": new_name,
-                        "users_updated": len(users_in_group),
-                        "group_letter": new_letter,
-                        "vpc_number": (group_index // 5) + 1
-                    })
-        
-        # Commit all changes
-        db.session.commit()
+        plan, skipped = plan_group_migration(event_id)
+        migration_results = [{
+            "old_name": step['old_name'],
+            "new_name": step['new_name'],
+            "users_updated": step['users_count'],
+            "group_letter": step['group_letter'],
+            "vpc_number": step['vpc_number']
+        } for step in plan]
+
+        if dry_run:
+            return jsonify({
+                "success": True,
+                "dry_run": True,
+                "message": f"{len(migration_results)} groups would be migrated to letter format",
+                "migrations": migration_results,
+                "skipped": skipped
+            })
+
+        result = apply_group_migration(plan, event_id)
         
         return jsonify({
             "success": True,
-            "message": f"Successfully migrated {len(migration_results)} groups to letter format",
-            "migrations": migration_results
+            "message": f"Successfully migrated {result['groups_renamed']} groups to letter format",
+            "migrations": migration_results,
+            "users_updated": result['users_updated'],
+            "skipped": skipped
         })
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({
             "success": False,
             "error": f"Migration failed: {str(e)}"
         }), 500
 
+def bulk_email_validator():
+    """Validation for a whole import against one directory snapshot (same fallbacks as check-in)"""
+    if not IBM_SDK_AVAILABLE:
+        return lambda email: email.endswith('.com') or 'ibm' in email
+
+    directory = get_ibm_cloud_user_directory()
+    if not directory:
+        print("No active users found or API error, falling back to basic validation")
+        return lambda email: '.' in email and email.endswith('.com')
+    return directory.__contains__
+
+def import_roster(lines, require_validated=True, event_id=DEFAULT_EVENT):
+    """Load a roster CSV into one event on the active backend and report throughput"""
+    roster = RosterImport(lines, bulk_email_validator(), require_validated=require_validated,
+                          batch_size=repository.import_batch_size)
+    # Walk-ins already acknowledged keep their slots ahead of the roster
+    drain_pending_checkins()
+    written = repository.import_users(roster.batches(), event_id=event_id)
+    remember_write()
+
+    report = roster.report(written)
+    print(f"Imported {report['imported']} of {report['rows']} roster rows in {report['duration_ms']}ms "
+          f"({report['rows_per_second']} rows/s)")
+    if report['imported']:
+        event_bus.publish('import', {"event_id": event_id, "imported": report['imported'],
+                                     "groups": report['groups_touched']})
+    return report
+
+@app.route('/api/admin/import', methods=['POST'])
+def import_attendees():
+    """Pre-register attendees from a CSV upload (email[,group] columns)"""
+    if not is_admin_authenticated():
+        return jsonify({"error": "Authentication required"}), 401
+
+    event_id = current_event()
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    require_validated = request.args.get('require_validated', 'true').lower() != 'false'
+
+    try:
+        lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        report = import_roster(lines, require_validated=require_validated, event_id=event_id)
+        return jsonify({"success": True, **report})
+    except DirectoryWarmingUp:
+        return directory_warming_up()
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Import failed: {str(e)}"
+        }), 500
+
+EXPORT_FIELDS = ['email', 'group_name', 'group_letter', 'vpc_number', 'checked_in_at', 'is_validated']
+
+@app.route('/api/admin/export')
+def export_registrations():
+    """Stream registrations as CSV (default) or NDJSON (`?format=ndjson`).
+
+    Rows come from a server-side cursor and are written out in batches, so
+    memory use does not grow with the number of attendees. Accepts the same
+    `group`, `vpc` and `email_prefix` filters as /api/registered.
+    """
+    if not is_admin_authenticated():
+        return jsonify({"error": "Authentication required"}), 401
+
+    event_id = current_event()
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({"error": "format must be 'csv' or 'ndjson'"}), 400
+    try:
+        filters = parse_user_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
+
+    vpc_info = {}
+
+    def export_rows():
+        for user in iter_registered_users(filters, event_id):
+            group_name = user['group_name']
+            if group_name not in vpc_info:
+                vpc_info[group_name] = get_vpc_info_from_group_name(group_name)
+            group_letter, vpc_number = vpc_info[group_name]
+            yield {
+                'email': user['email'],
+                'group_name': group_name,
+                'group_letter': group_letter,
+                'vpc_number': vpc_number,
+                'checked_in_at': user['checked_in_at'],
+                'is_validated': user['is_validated']
+            }
+
+    def generate():
+        buffer = io.StringIO()
+        if export_format == 'csv':
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda row: buffer.write(json.dumps(row) + '\n')
+
+        pending = 0
+        for row in export_rows():
+            write(row)
+            pending += 1
+            if pending >= REGISTERED_STREAM_BATCH:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        yield buffer.getvalue()
+
+    filename = f"registrations-{event_id}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def reset_registration_data(archive=True, event_id=DEFAULT_EVENT):
+    """Archive the event's session (optional), then empty its users and groups and restart its slots"""
+    drain_pending_checkins()
+    result = repository.reset_all_data(archive=archive, event_id=event_id)
+    remember_write()
+    return result
+
 @app.route('/api/admin/reset-data', methods=['POST'])
 def reset_all_data():
-    """Reset all users and groups - use before demo session"""
+    """Reset an event's users and groups - use before demo session.
+
+    The session is archived first unless the body has `"archive": false`.
+    Other events are left alone. Caches are re-warmed afterwards, and the
+    response reports per-phase timings.
+    """
     if not is_admin_authenticated():
         return jsonify({"error": "Authentication required"}), 401
     
+    event_id = current_event()
+    data = request.get_json(silent=True) or {}
+    archive = data.get('archive', True) is not False
+
     try:
-        # Count existing data
-        user_count = User.query.count()
-        group_count = Group.query.count()
-        
-        # Delete all users and groups
-        User.query.delete()
-        Group.query.delete()
-        
-        # Commit changes
-        db.session.commit()
+        started = time.monotonic()
+        result = reset_registration_data(archive=archive, event_id=event_id)
+        
+        # Drops the event's stats snapshot and group rosters here and in other workers
+        event_bus.publish('reset', {"event_id": event_id})
+        
+        # Re-warm so the first dashboards and check-ins hit warm caches
+        warm_started = time.monotonic()
+        stats_snapshots.get(event_id).get()
+        try:
+            get_ibm_cloud_user_directory()
+        except DirectoryWarmingUp:
+            pass  # Still crawling; the reset itself is done
+        timings = result['timings_ms']
+        timings['warm_ms'] = round((time.monotonic() - warm_started) * 1000, 1)
+        timings['total_ms'] = round((time.monotonic() - started) * 1000, 1)
+        print(f"Reset complete: {result['users_removed']} users, {result['groups_removed']} groups "
+              f"(archive {result['archive_id']}) in {timings['total_ms']}ms")
         
         return jsonify({
             "success": True,
             "message": "All registration data has been reset",
-            "users_removed": user_count,
-            "groups_removed": group_count
+            "event_id": event_id,
+            "users_removed": result['users_removed'],
+            "groups_removed": result['groups_removed'],
+            "archive_id": result['archive_id'],
+            "timings_ms": timings
         })
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({
             "success": False,
             "error": f"Reset failed: {str(e)}"
         }), 500
 
+@app.route('/api/admin/events', methods=['GET', 'POST'])
+def manage_events():
+    """List events with their counts, or create one from a JSON body with `id` and an optional `name`"""
+    if not is_admin_authenticated():
+        return jsonify({"error": "Authentication required"}), 401
+
+    if request.method == 'GET':
+        try:
+            events = reads.run(lambda db: db.get_events(), read_position())
+            return jsonify({"success": True, "default_event": DEFAULT_EVENT, "events": events})
+        except Exception as e:
+            return jsonify({"success": False, "error": f"Error listing events: {str(e)}"}), 500
+
+    data = request.get_json(silent=True) or {}
+    if not (data.get('id') or '').strip():
+        return jsonify({"success": False, "error": "Event id is required"}), 400
+    event_id = normalize_event_id(data['id'])
+    name = (data.get('name') or '').strip() or None
+
+    try:
+        event = repository.create_event(event_id, name)
+        if event is None:
+            return jsonify({"success": False, "error": f"Event '{event_id}' already exists"}), 409
+        remember_write()
+        _known_events.add(event_id)
+        return jsonify({"success": True, "event": event}), 201
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Event creation failed: {str(e)}"
+        }), 500
+
 @app.route('/api/admin/remove-user', methods=['POST'])
 def remove_specific_user():
     """Remove a specific user by email"""
     if not is_admin_authenticated():
         return jsonify({"error": "Authentication required"}), 401
     
+    event_id = current_event()
     try:
         data = request.json or {}
         email = data.get('email', '').strip().lower()
@@ -752,44 +1278,80 @@ def remove_specific_user():
         if not email:
             return jsonify({"success": False, "error": "Email is required"}), 400
         
-        # Find the user
-        user = User.query.filter_by(email=email).first()
-        if not user:
+        result = remove_users(emails=[email], event_id=event_id)
+        if not result['removed']:
             return jsonify({"success": False, "error": "User not found"}), 404
         
-        # Get group info before deletion
-        group_name = user.group_name
-        
-        # Remove the user
-        db.session.delete(user)
+        group_name = result['removed'][0]['group_name']
+        summary = result['groups'][0] if result['groups'] else None
+        group_removed = summary['group_removed'] if summary else False
         
-        # Check if group is now empty and remove it
-        if group_name:
-            group = Group.query.filter_by(name=group_name).first()
-            if group:
-                remaining_users = User.query.filter_by(group_name=group_name).count()
-                if remaining_users == 0:
-                    # Group is empty, remove it
-                    db.session.delete(group)
-                    group_removed = True
-                else:
-                    # Update group member count
-                    group.current_members = remaining_users
-                    group.is_full = False  # Group is no longer full
-                    group_removed = False
-        
-        # Commit changes
-        db.session.commit()
+        event_bus.publish('removal', {
+            "event_id": event_id,
+            "email": email,
+            "group_name": group_name,
+            "group_removed": group_removed,
+            "group": summary['group'] if summary else None
+        })
         
         return jsonify({
             "success": True,
             "message": f"User {email} has been removed",
             "group_name": group_name,
-            "group_removed": group_removed if group_name else False
+            "group_removed": group_removed
         })
         
     except Exception as e:
-        db.session.rollback()
+        return jsonify({
+            "success": False,
+            "error": f"User removal failed: {str(e)}"
+        }), 500
+
+@app.route('/api/admin/remove-users', methods=['POST'])
+def remove_users_in_bulk():
+    """Remove several users at once, by `emails` list or by `group` name"""
+    if not is_admin_authenticated():
+        return jsonify({"error": "Authentication required"}), 401
+    
+    event_id = current_event()
+    data = request.get_json(silent=True) or {}
+    emails = data.get('emails')
+    group = data.get('group')
+
+    if (emails is None) == (group is None):
+        return jsonify({"success": False, "error": "Provide either 'emails' or 'group'"}), 400
+    if emails is not None:
+        if not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+            return jsonify({"success": False, "error": "'emails' must be a list of email addresses"}), 400
+        emails = sorted({email.strip().lower() for email in emails if email.strip()})
+        if not emails:
+            return jsonify({"success": False, "error": "'emails' is empty"}), 400
+    else:
+        group = normalize_group_name(group)
+        if not group:
+            return jsonify({"success": False, "error": "'group' is empty"}), 400
+
+    try:
+        result = remove_users(emails=emails, group_name=group, event_id=event_id)
+        removed_emails = {user['email'] for user in result['removed']}
+
+        if result['removed']:
+            event_bus.publish('bulk_removal', {
+                "event_id": event_id,
+                "users_removed": len(result['removed']),
+                "groups": [summary['group_name'] for summary in result['groups']]
+            })
+
+        return jsonify({
+            "success": True,
+            "message": f"{len(result['removed'])} users have been removed",
+            "users_removed": len(result['removed']),
+            "removed": result['removed'],
+            "not_found": [email for email in emails if email not in removed_emails] if emails is not None else [],
+            "groups": result['groups']
+        })
+
+    except Exception as e:
         return jsonify({
             "success": False,
             "error": f"User removal failed: {str(e)}"
@@ -797,37 +1359,26 @@ def remove_specific_user():
 
 @app.route('/api/ibm-cloud-users')
 def get_ibm_cloud_users():
-    """Get all IBM Cloud account users for admin view"""
+    """Get all IBM Cloud account users for admin view, flagged as registered for the event"""
     if not is_admin_authenticated():
         return jsonify({"error": "Authentication required"}), 401
     
+    event_id = current_event()
     try:
-        active_users = get_active_ibm_cloud_users()
+        directory = get_ibm_cloud_user_directory()
         
         # Get registered user emails for comparison
-        registered_users = User.query.all()
-        registered_emails = set(user.email for user in registered_users)
-        
-        # Categorize users
-        users_data = []
-        for user in active_users:
-            user_info = {
-                'email': user['email'],
-                'first_name': user.get('first_name', ''),
-                'last_name': user.get('last_name', ''),
-                'user_id': user.get('user_id', ''),
-                'state': user.get('state', 'ACTIVE'),
-                'is_registered': user['email'] in registered_emails
-            }
-            users_data.append(user_info)
+        registered_emails = reads.run(lambda db: db.get_registered_emails(event_id=event_id), read_position())
         
-        # Sort by registration status (unregistered first) then by email
-        users_data.sort(key=lambda x: (x['is_registered'], x['email']))
+        # Unregistered first, then registered; the directory is already ordered by email
+        partition = directory.partition_registered(registered_emails)
+        users_data = [dict(user, is_registered=False) for user in partition['unregistered']]
+        users_data += [dict(user, is_registered=True) for user in partition['registered']]
         
         # Calculate statistics
         total_users = len(users_data)
-        registered_count = sum(1 for u in users_data if u['is_registered'])
-        unregistered_count = total_users - registered_count
+        registered_count = len(partition['registered'])
+        unregistered_count = len(partition['unregistered'])
         
         return jsonify({
             "success": True,
@@ -835,10 +1386,12 @@ def get_ibm_cloud_users():
             "registered_count": registered_count,
             "unregistered_count": unregistered_count,
             "users": users_data,
-            "cache_age_seconds": int(time.time() - _cache_timestamp) if _cache_timestamp else None,
+            "cache_age_seconds": user_directory_cache.get_stats()['cache_age_seconds'],
             "ibm_sdk_available": IBM_SDK_AVAILABLE
         })
         
+    except DirectoryWarmingUp as e:
+        return jsonify({"success": False, "error": str(e), "ibm_sdk_available": IBM_SDK_AVAILABLE}), 503
     except Exception as e:
         return jsonify({
             "success": False,
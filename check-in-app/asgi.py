@@ -0,0 +1,434 @@
+"""
+Async check-in service: the attendee-facing API on asyncio
+
+An alternate entry point that serves /api/checkin, /api/lookup, /api/stats,
+/api/registered and /api/health with the same responses as app.py, using
+asyncpg instead of psycopg2 so a slow request never holds a worker thread.
+It shares app.py's configuration, IBM Cloud user directory cache, group
+roster cache, event bus, rate limiter and, with CHECKIN_WRITE_BEHIND, its
+write-behind queue. Idempotency-Key replays use the same table, so a retry
+gets the first response whichever entry point answers it. The admin pages
+and endpoints stay on the Flask app.
+
+Requests pick their event with the `event` query parameter, as in app.py.
+
+Requires PostgreSQL (the Code Engine binding or a postgresql:// DATABASE_URL).
+
+Usage:
+    uvicorn asgi:app --host 0.0.0.0 --port 8080 [--workers N]
+"""
+
+import asyncio
+import json
+import math
+import os
+import sys
+from contextlib import asynccontextmanager
+
+# Add the app directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as sync_app
+from admission import forwarded_client_ip
+from async_database import AsyncDatabaseOperations, PoolExhausted
+from grouping import get_vpc_info_from_group_name
+from idempotency import MAX_KEY_LENGTH, AsyncIdempotencyCache
+from lab_events import EventPartitions, InvalidEventId, UnknownEvent, event_of, normalize_event_id
+from snapshot_cache import AsyncCachedSnapshot
+from user_directory import DirectoryWarmingUp
+
+event_bus = sync_app.event_bus
+roster_caches = sync_app.roster_caches
+
+
+def create_database():
+    """asyncpg access to the same database and tables as the Flask app's repository"""
+    repository = sync_app.repository
+    if repository.dialect != 'postgresql':
+        raise RuntimeError("The async service needs PostgreSQL; set DATABASE_URL to a postgresql:// URL")
+
+    if sync_app.CODE_ENGINE_DEPLOYMENT:
+        config = repository.DATABASE_CONFIG
+        return AsyncDatabaseOperations(host=config['host'], port=int(config['port']), user=config['user'],
+                                       password=config['password'], database=config['database'], ssl='require')
+
+    # asyncpg takes a plain libpq URL, without a SQLAlchemy driver suffix
+    dsn = repository.engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+    return AsyncDatabaseOperations(users=repository.users_name, groups=repository.groups_name, dsn=dsn)
+
+
+db = create_database()
+
+stats_snapshots = EventPartitions(
+    lambda event_id: AsyncCachedSnapshot(lambda: load_stats(event_id), ttl=sync_app.STATS_CACHE_TTL))
+
+
+def invalidate_stats(event_type, data):
+    for stats_snapshot in stats_snapshots.existing(event_of(event_type, data)):
+        stats_snapshot.invalidate()
+
+
+event_bus.add_listener(invalidate_stats)
+
+
+def create_idempotency_cache(event_id):
+    """Replays from the same idempotency_keys table as app.py, so either entry point can answer a retry"""
+    async def load(key, email):
+        return await db.get_idempotent_response(key, email, sync_app.IDEMPOTENCY_DB_TTL, event_id=event_id)
+
+    async def save(key, email, status_code, response):
+        await db.save_idempotent_response(key, email, status_code, response, event_id=event_id)
+
+    # Write-behind mode answers without touching the database, so its replays stay in memory
+    return AsyncIdempotencyCache(
+        load=None if sync_app.CHECKIN_WRITE_BEHIND else load,
+        save=None if sync_app.CHECKIN_WRITE_BEHIND else save,
+        ttl=sync_app.IDEMPOTENCY_TTL
+    )
+
+
+idempotency_caches = EventPartitions(create_idempotency_cache)
+
+
+def clear_idempotency_cache(event_type, data):
+    if event_type == 'reset':
+        for idempotency_cache in idempotency_caches.existing(event_of(event_type, data)):
+            idempotency_cache.clear()
+
+
+event_bus.add_listener(clear_idempotency_cache)
+known_events = set()
+
+
+async def current_event(request):
+    """Event named by the `event` query parameter (see app.current_event)"""
+    event_id = normalize_event_id(request.query_params.get('event'), sync_app.DEFAULT_EVENT)
+    if event_id not in known_events:
+        if not await db.get_event(event_id):
+            raise UnknownEvent(f"Unknown event '{event_id}'")
+        known_events.add(event_id)
+    return event_id
+
+
+async def load_stats(event_id):
+    counts = await db.get_stats(event_id=event_id)
+    counts["average_group_size"] = round(counts["total_users"] / max(counts["total_groups"], 1), 1)
+    return counts
+
+
+async def publish(event_type, data):
+    """Deliver to this process, then NOTIFY the other workers without blocking the loop"""
+    event_bus.publish(event_type, data, relay=False)
+    try:
+        await db.notify(sync_app.EVENTS_CHANNEL, event_bus.relay_payload(event_type, data))
+    except Exception as e:
+        print(f"Event relay notify failed: {e}")
+
+
+async def validate_user(email):
+    """validate_user_with_ibm_cloud without blocking the event loop"""
+    if not sync_app.IBM_SDK_AVAILABLE:
+        return sync_app.validate_user_with_ibm_cloud(email)
+
+    directory = sync_app.user_directory_cache.get(wait=False)
+    if directory is None:
+        # Cold cache: wait for the first crawl in a worker thread
+        directory = await asyncio.to_thread(sync_app.get_ibm_cloud_user_directory)
+    return sync_app.validate_user_in_directory(email, directory)
+
+
+def get_client_ip(request):
+    if sync_app.TRUST_PROXY_HEADERS:
+        forwarded = forwarded_client_ip(request.headers.get('x-forwarded-for', ''), sync_app.TRUSTED_PROXY_HOPS)
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else 'unknown'
+
+
+def too_many_requests(message, retry_after):
+    return JSONResponse({"success": False, "error": message, "retry_after": retry_after},
+                        status_code=429, headers={'Retry-After': str(retry_after)})
+
+
+async def invalid_event(request, error):
+    return JSONResponse({"success": False, "error": str(error)}, status_code=400)
+
+
+async def unknown_event(request, error):
+    return JSONResponse({"success": False, "error": str(error)}, status_code=404)
+
+
+def admission_controlled(endpoint):
+    """Per-IP rate limit as in app.py; concurrency is bounded by the connection pool wait"""
+    async def wrapper(request):
+        if sync_app.rate_limiter is not None:
+            wait = sync_app.rate_limiter.acquire(get_client_ip(request))
+            if wait:
+                return too_many_requests("Too many requests, please try again shortly", math.ceil(wait))
+        try:
+            return await endpoint(request)
+        except PoolExhausted:
+            return too_many_requests("The server is busy, please try again shortly", 1)
+    return wrapper
+
+
+async def read_email(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    return (data.get('email') or '').strip().lower() if isinstance(data, dict) else ''
+
+
+def admit_write_behind(email, event_id):
+    """app.admit_checkin, run in a worker thread because it fsyncs the journal"""
+    with sync_app.app.app_context():
+        response = sync_app.app.make_response(sync_app.admit_checkin(email, event_id))
+    return Response(response.get_data(), status_code=response.status_code, media_type='application/json')
+
+
+@admission_controlled
+async def checkin_user(request):
+    """Check in; a retry with the same Idempotency-Key gets the first attempt's response"""
+    event_id = await current_event(request)
+    email = await read_email(request)
+    key = request.headers.get('idempotency-key', '').strip()
+    if not key or not email:
+        return await process_checkin(email, event_id)
+    if len(key) > MAX_KEY_LENGTH:
+        return JSONResponse({"success": False, "error": "Idempotency-Key is too long"}, status_code=400)
+
+    async def operation():
+        response = await process_checkin(email, event_id)
+        return response.status_code, response.body.decode()
+
+    (status, body), replayed = await idempotency_caches.get(event_id).run(key, email, operation)
+    return Response(body, status_code=status, media_type='application/json',
+                    headers={'Idempotent-Replayed': 'true'} if replayed else None)
+
+
+async def process_checkin(email, event_id):
+    if not email:
+        return JSONResponse({"success": False, "error": "Email is required"}, status_code=400)
+
+    try:
+        if sync_app.write_behind_queue is not None:
+            # Same in-memory admission and journal as the Flask app
+            return await asyncio.to_thread(admit_write_behind, email, event_id)
+
+        if await validate_user(email):
+            # Upsert, group assignment and read-back in one transaction
+            result = await db.checkin(email, event_id=event_id)
+            user, group = result['user'], result['group']
+        else:
+            # Attendees who already checked in keep their group
+            user = await db.get_user_by_email(email, event_id=event_id)
+            if not user:
+                return JSONResponse({
+                    "success": False,
+                    "error": "Email not found in authorized user list"
+                }, status_code=403)
+            result = {'already_registered': True}
+
+        group_letter, vpc_number = get_vpc_info_from_group_name(user['group_name'])
+
+        if result['already_registered']:
+            return JSONResponse({
+                "success": True,
+                "message": "You have already checked in!",
+                "group_name": user['group_name'],
+                "group_letter": group_letter,
+                "vpc_number": vpc_number,
+                "checked_in_at": user['checked_in_at'],
+                "already_registered": True
+            })
+
+        await publish('checkin', {"event_id": event_id, "user": user, "group": group})
+
+        return JSONResponse({
+            "success": True,
+            "message": "Successfully checked in!",
+            "group_name": group['name'],
+            "group_letter": group_letter,
+            "vpc_number": vpc_number,
+            "group_members": group['current_members'],
+            "group_max": group['max_members'],
+            "checked_in_at": user['checked_in_at'],
+            "already_registered": False
+        })
+
+    except PoolExhausted:
+        raise
+    except DirectoryWarmingUp:
+        retry_after = sync_app.DIRECTORY_WARMING_RETRY_AFTER
+        return JSONResponse({
+            "success": False,
+            "error": "Attendee validation is still starting up, please try again shortly",
+            "retry_after": retry_after
+        }, status_code=503, headers={'Retry-After': str(retry_after)})
+    except Exception as e:
+        print(f"Check-in error: {e}")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+
+
+@admission_controlled
+async def lookup_user_group(request):
+    event_id = await current_event(request)
+    email = await read_email(request)
+    if not email:
+        return JSONResponse({"success": False, "error": "Email address is required"}, status_code=400)
+
+    try:
+        roster_cache = roster_caches.get(event_id)
+        cached = roster_cache.get(email)
+        if cached:
+            user, roster = cached
+            group, members = roster['group'], roster['members']
+        else:
+            token = roster_cache.begin()
+            result = await db.get_user_roster(email, event_id=event_id)
+            if not result:
+                return JSONResponse({
+                    "success": False,
+                    "error": "User not found. Please check your email address or register first.",
+                    "email": email
+                }, status_code=404)
+            user, group, members = result['user'], result['group'], result['members']
+            if group:
+                roster_cache.put(group, members, token)
+
+        group_info = None
+        group_letter, vpc_number = get_vpc_info_from_group_name(user['group_name'])
+        if group:
+            group_info = dict(group)
+            group_info['members'] = [member['email'] for member in members]
+            group_info['group_letter'] = group_letter
+            group_info['vpc_number'] = vpc_number
+
+        return JSONResponse({
+            "success": True,
+            "user": {
+                "email": user['email'],
+                "group_name": user['group_name'],
+                "group_letter": group_letter,
+                "vpc_number": vpc_number,
+                "checked_in_at": user['checked_in_at'],
+                "is_validated": user['is_validated']
+            },
+            "group": group_info
+        })
+
+    except PoolExhausted:
+        raise
+    except Exception as e:
+        return JSONResponse({"success": False, "error": f"Lookup failed: {str(e)}"}, status_code=500)
+
+
+async def get_stats(request):
+    stats_snapshot = stats_snapshots.get(await current_event(request))
+    try:
+        return JSONResponse(await stats_snapshot.get())
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def get_registered_users(request):
+    """Same parameters and responses as app.py's /api/registered"""
+    event_id = await current_event(request)
+    args = request.query_params
+    try:
+        filters = sync_app.parse_user_filters(args)
+        cursor = args.get('cursor')
+        limit = args.get('limit')
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid filter: {e}"}, status_code=400)
+
+    if cursor or limit:
+        try:
+            after = sync_app.decode_user_cursor(cursor) if cursor else None
+            limit = min(max(int(limit or sync_app.REGISTERED_PAGE_SIZE), 1), sync_app.REGISTERED_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        try:
+            users, has_more = await db.get_users_page(filters, after=after, limit=limit, event_id=event_id)
+            page = {
+                "users": users,
+                "has_more": has_more,
+                "next_cursor": sync_app.encode_user_cursor(users[-1]) if has_more else None,
+                "limit": limit
+            }
+            if after is None:
+                groups = await db.get_all_groups(event_id=event_id)
+                page["total_users"] = await db.count_users(filters, event_id=event_id)
+                page["total_groups"] = len(groups)
+                page["groups"] = groups
+            return JSONResponse(page)
+
+        except Exception as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+
+    try:
+        groups = await db.get_all_groups(event_id=event_id)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    async def generate():
+        yield '{"total_groups": %d, "groups": %s, "users": [' % (len(groups), json.dumps(groups))
+        total_users = 0
+        batch = []
+        async for user in db.iter_users(filters, batch_size=sync_app.REGISTERED_STREAM_BATCH, event_id=event_id):
+            batch.append(json.dumps(user))
+            total_users += 1
+            if len(batch) >= sync_app.REGISTERED_STREAM_BATCH:
+                yield (',' if total_users > len(batch) else '') + ','.join(batch)
+                batch = []
+        if batch:
+            yield (',' if total_users > len(batch) else '') + ','.join(batch)
+        yield '], "total_users": %d}' % total_users
+
+    return StreamingResponse(generate(), media_type='application/json')
+
+
+async def health_check(request):
+    return JSONResponse({
+        "status": "healthy",
+        "mode": "asgi",
+        "ibm_sdk_available": sync_app.IBM_SDK_AVAILABLE,
+        "database_pool": db.get_pool_stats(),
+        "events": event_bus.get_stats(),
+        "stats_cache": stats_snapshots.get_stats(),
+        "roster_cache": roster_caches.get_stats(),
+        "idempotency": idempotency_caches.get_stats(),
+        "write_behind": sync_app.write_behind_queue.get_stats() if sync_app.write_behind_queue else None,
+        "admission": {
+            "rate_limit": sync_app.rate_limiter.get_stats() if sync_app.rate_limiter else None
+        }
+    })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Schema migrations run through the sync layer, once per worker start
+    await asyncio.to_thread(sync_app.ensure_database)
+    await db.open()
+    # Hear other workers' check-ins, so cached rosters and stats stay current
+    event_bus.start_relay()
+    yield
+    await db.close()
+
+
+app = Starlette(routes=[
+    Route('/api/checkin', checkin_user, methods=['POST']),
+    Route('/api/lookup', lookup_user_group, methods=['POST']),
+    Route('/api/stats', get_stats),
+    Route('/api/registered', get_registered_users),
+    Route('/api/health', health_check),
+], exception_handlers={
+    InvalidEventId: invalid_event,
+    UnknownEvent: unknown_event,
+}, lifespan=lifespan)
@@ -0,0 +1,297 @@
+"""asyncpg counterpart of DatabaseOperations for the ASGI entry point (asgi.py)
+
+Covers what the async routes need: check-in with slot-based group
+assignment, roster lookup, dashboard counts and registered-user pages, each
+scoped to one event (see lab_events.py). The
+SQL matches database.py; table names are parameters so the same class works
+on the Code Engine schema ("users"/"groups") and on a PostgreSQL database
+created by the SQLAlchemy repository ("user"/"group"). Timestamps are written
+explicitly in UTC, like the models do, because tables created by older
+releases have no column defaults.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+from repository import pool_settings_from_env
+from grouping import GROUP_SIZE, get_group_for_slot
+from lab_events import DEFAULT_EVENT_ID, slot_sequence_name
+
+
+class PoolExhausted(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+def user_record(row, offset=0) -> Dict[str, Any]:
+    return {
+        'id': row[offset],
+        'email': row[offset + 1],
+        'group_name': row[offset + 2],
+        'checked_in_at': row[offset + 3].isoformat() if row[offset + 3] else None,
+        'is_validated': row[offset + 4]
+    }
+
+
+def group_record(row, offset=0) -> Dict[str, Any]:
+    return {
+        'id': row[offset],
+        'name': row[offset + 1],
+        'max_members': row[offset + 2],
+        'current_members': row[offset + 3],
+        'is_full': row[offset + 4],
+        'created_at': row[offset + 5].isoformat() if row[offset + 5] else None
+    }
+
+
+class AsyncDatabaseOperations:
+    """Pooled asyncpg access to the check-in tables.
+
+    `connect_kwargs` go to asyncpg.create_pool (a `dsn`, or host/user/...).
+    The pool is sized like the psycopg2 one (pool_settings_from_env), and a
+    request that waits longer than DB_POOL_TIMEOUT for a connection gets
+    PoolExhausted instead of queueing indefinitely.
+    """
+
+    def __init__(self, users='users', groups='groups', **connect_kwargs):
+        self.users = f'"{users}"'
+        self.groups = f'"{groups}"'
+        self._connect_kwargs = connect_kwargs
+        settings = pool_settings_from_env()
+        self.min_size = settings['min_size']
+        self.max_size = settings['max_size']
+        self.timeout = settings['timeout']
+        self.pool = None
+        self.timeouts = 0
+
+    async def open(self):
+        self.pool = await asyncpg.create_pool(min_size=self.min_size, max_size=self.max_size,
+                                              **self._connect_kwargs)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+
+    def connection(self):
+        """Borrow a pooled connection; raises PoolExhausted after DB_POOL_TIMEOUT"""
+        return _Checkout(self)
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        if self.pool is None:
+            return {'size': 0, 'max_size': self.max_size}
+        size = self.pool.get_size()
+        return {
+            'size': size,
+            'idle': self.pool.get_idle_size(),
+            'in_use': size - self.pool.get_idle_size(),
+            'min_size': self.pool.get_min_size(),
+            'max_size': self.pool.get_max_size(),
+            'timeouts': self.timeouts,
+        }
+
+    async def checkin(self, email: str, is_validated: bool = True, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Check a user in and assign their group in one transaction (see DatabaseOperations.checkin)"""
+        email = email.lower().strip()
+        async with self.connection() as conn:
+            async with conn.transaction():
+                inserted = await conn.fetchrow(f"""
+                    INSERT INTO {self.users} (email, is_validated, checked_in_at, event_id)
+                    SELECT $1::varchar, $2, timezone('utc', now()), $3::varchar
+                    WHERE NOT EXISTS (SELECT 1 FROM {self.users} WHERE event_id = $3 AND email = $1)
+                    ON CONFLICT (event_id, email) DO NOTHING
+                    RETURNING id, nextval($4::text::regclass)
+                """, email, is_validated, event_id, slot_sequence_name(event_id))
+
+                if inserted:
+                    user_id, slot = inserted
+                    group_name, _, _ = get_group_for_slot(slot)
+                    row = await conn.fetchrow(f"""
+                        WITH assigned AS (
+                            UPDATE {self.users} SET group_name = $1 WHERE id = $2
+                            RETURNING id, email, group_name, checked_in_at, is_validated
+                        ), grp AS (
+                            INSERT INTO {self.groups} (name, max_members, current_members, is_full, created_at, event_id)
+                            VALUES ($1, $3, 1, $4, timezone('utc', now()), $5)
+                            ON CONFLICT (event_id, name) DO UPDATE
+                                SET current_members = {self.groups}.current_members + 1,
+                                    is_full = {self.groups}.current_members + 1 >= {self.groups}.max_members
+                            RETURNING id, name, max_members, current_members, is_full, created_at
+                        )
+                        SELECT assigned.*, grp.* FROM assigned, grp
+                    """, group_name, user_id, GROUP_SIZE, GROUP_SIZE <= 1, event_id)
+                else:
+                    row = await conn.fetchrow(f"""
+                        SELECT u.id, u.email, u.group_name, u.checked_in_at, u.is_validated,
+                               g.id, g.name, g.max_members, g.current_members, g.is_full, g.created_at
+                        FROM {self.users} u
+                        LEFT JOIN {self.groups} g ON g.event_id = u.event_id AND g.name = u.group_name
+                        WHERE u.event_id = $2 AND u.email = $1
+                    """, email, event_id)
+
+        return {
+            'user': user_record(row),
+            'group': group_record(row, 5) if row[5] is not None else None,
+            'already_registered': inserted is None
+        }
+
+    async def get_user_by_email(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
+        async with self.connection() as conn:
+            row = await conn.fetchrow(
+                f"SELECT id, email, group_name, checked_in_at, is_validated FROM {self.users}"
+                " WHERE event_id = $2 AND email = $1",
+                email.lower().strip(), event_id
+            )
+        return user_record(row) if row else None
+
+    async def get_user_roster(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
+        """Get a user, their group and every member of that group in one query"""
+        async with self.connection() as conn:
+            rows = await conn.fetch(f"""
+                SELECT u.id, u.email, u.group_name, u.checked_in_at, u.is_validated,
+                       g.id, g.name, g.max_members, g.current_members, g.is_full, g.created_at,
+                       m.id, m.email, m.group_name, m.checked_in_at, m.is_validated
+                FROM {self.users} u
+                LEFT JOIN {self.groups} g ON g.event_id = u.event_id AND g.name = u.group_name
+                LEFT JOIN {self.users} m ON m.event_id = u.event_id AND m.group_name = u.group_name
+                WHERE u.event_id = $2 AND u.email = $1
+                ORDER BY m.id
+            """, email, event_id)
+        if not rows:
+            return None
+
+        row = rows[0]
+        return {
+            'user': user_record(row),
+            'group': group_record(row, 5) if row[5] is not None else None,
+            'members': [user_record(r, 11) for r in rows if r[11] is not None]
+        }
+
+    async def get_stats(self, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, int]:
+        """User and group counts for the dashboard in a single round trip"""
+        async with self.connection() as conn:
+            total_users, total_groups, full_groups = await conn.fetchrow(f"""
+                SELECT (SELECT COUNT(*) FROM {self.users} WHERE event_id = $1),
+                       COUNT(*),
+                       COUNT(*) FILTER (WHERE is_full)
+                FROM {self.groups} WHERE event_id = $1
+            """, event_id)
+        return {
+            'total_users': total_users,
+            'total_groups': total_groups,
+            'full_groups': full_groups,
+            'available_groups': total_groups - full_groups,
+        }
+
+    def _user_filter_sql(self, filters: Optional[Dict[str, Any]] = None, after=None, event_id: str = DEFAULT_EVENT_ID):
+        """WHERE clause and params for the event, filters and keyset cursor of DatabaseOperations"""
+        filters = filters or {}
+        clauses, params = ["event_id = $1"], [event_id]
+        if filters.get('group_name'):
+            params.append(filters['group_name'])
+            clauses.append(f"group_name = ${len(params)}")
+        if filters.get('group_names') is not None:
+            params.append(list(filters['group_names']))
+            clauses.append(f"group_name = ANY(${len(params)})")
+        if filters.get('email_prefix'):
+            prefix = filters['email_prefix'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(prefix + '%')
+            clauses.append(f"email LIKE ${len(params)} ESCAPE '\\'")
+        if after is not None:
+            # Newest first: continue strictly after the last (checked_in_at, id) seen
+            params.extend(after)
+            clauses.append(f"(checked_in_at, id) < (${len(params) - 1}, ${len(params)})")
+        return " WHERE " + " AND ".join(clauses), params
+
+    async def get_users_page(self, filters: Optional[Dict[str, Any]] = None, after=None, limit: int = 100,
+                             event_id: str = DEFAULT_EVENT_ID):
+        """One page of users, newest first; returns (users, has_more)"""
+        where, params = self._user_filter_sql(filters, after, event_id)
+        async with self.connection() as conn:
+            rows = await conn.fetch(
+                f"SELECT id, email, group_name, checked_in_at, is_validated FROM {self.users}"
+                + where + f" ORDER BY checked_in_at DESC, id DESC LIMIT ${len(params) + 1}",
+                *params, limit + 1
+            )
+        return [user_record(row) for row in rows[:limit]], len(rows) > limit
+
+    async def count_users(self, filters: Optional[Dict[str, Any]] = None, event_id: str = DEFAULT_EVENT_ID) -> int:
+        where, params = self._user_filter_sql(filters, event_id=event_id)
+        async with self.connection() as conn:
+            return await conn.fetchval(f"SELECT COUNT(*) FROM {self.users}" + where, *params)
+
+    async def iter_users(self, filters: Optional[Dict[str, Any]] = None, batch_size: int = 500,
+                         event_id: str = DEFAULT_EVENT_ID):
+        """Yield users newest first through a server-side cursor"""
+        where, params = self._user_filter_sql(filters, event_id=event_id)
+        async with self.connection() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(
+                    f"SELECT id, email, group_name, checked_in_at, is_validated FROM {self.users}"
+                    + where + " ORDER BY checked_in_at DESC, id DESC",
+                    *params, prefetch=batch_size
+                ):
+                    yield user_record(row)
+
+    async def get_all_groups(self, event_id: str = DEFAULT_EVENT_ID) -> List[Dict[str, Any]]:
+        async with self.connection() as conn:
+            rows = await conn.fetch(
+                f"SELECT id, name, max_members, current_members, is_full, created_at FROM {self.groups}"
+                " WHERE event_id = $1 ORDER BY created_at",
+                event_id
+            )
+        return [group_record(row) for row in rows]
+
+    async def get_event(self, event_id: str) -> Optional[Dict[str, Any]]:
+        async with self.connection() as conn:
+            row = await conn.fetchrow("SELECT id, name, created_at FROM events WHERE id = $1", event_id)
+        if not row:
+            return None
+        return {'id': row[0], 'name': row[1], 'created_at': row[2].isoformat() if row[2] else None}
+
+    # Stored check-in responses for idempotent retries (same table as the sync backends)
+    async def get_idempotent_response(self, key: str, email: str, max_age: float,
+                                      event_id: str = DEFAULT_EVENT_ID) -> Optional[tuple]:
+        """(status_code, response body) stored for this key and email, if recent enough"""
+        async with self.connection() as conn:
+            row = await conn.fetchrow("""
+                SELECT status_code, response FROM idempotency_keys
+                WHERE idempotency_key = $1 AND email = $2 AND event_id = $3 AND created_at > $4
+            """, key, email, event_id, time.time() - max_age)
+        return (row[0], row[1]) if row else None
+
+    async def save_idempotent_response(self, key: str, email: str, status_code: int, response: str,
+                                       event_id: str = DEFAULT_EVENT_ID):
+        """Store a response; the first one stored for a key and email wins"""
+        async with self.connection() as conn:
+            await conn.execute("""
+                INSERT INTO idempotency_keys (idempotency_key, email, status_code, response, created_at, event_id)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                ON CONFLICT (event_id, idempotency_key, email) DO NOTHING
+            """, key, email, status_code, response, time.time(), event_id)
+
+    async def notify(self, channel: str, payload: str):
+        """Send a PostgreSQL NOTIFY on the given channel"""
+        async with self.connection() as conn:
+            await conn.execute("SELECT pg_notify($1, $2)", channel, payload)
+
+
+class _Checkout:
+    """async context manager around pool.acquire with a bounded wait"""
+
+    def __init__(self, db: AsyncDatabaseOperations):
+        self._db = db
+        self._conn = None
+
+    async def __aenter__(self):
+        try:
+            self._conn = await self._db.pool.acquire(timeout=self._db.timeout)
+        except asyncio.TimeoutError:
+            self._db.timeouts += 1
+            raise PoolExhausted(f"No database connection available after {self._db.timeout}s "
+                                f"(pool size {self._db.max_size})")
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        await self._db.pool.release(self._conn)
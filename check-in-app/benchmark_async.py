@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Load test: compare the Flask app and the ASGI entry point under many clients
+
+Opens --clients concurrent keep-alive connections to each --url and has every
+client check in, look up its group and read the stats, --rounds times. Prints
+throughput, latency percentiles and the number of 429 and failed responses
+per target and endpoint.
+
+Each client checks in one of --emails addresses, so repeated runs exercise
+the "already checked in" path once those users exist. Keep --emails at or
+below 25 groups worth of attendees, and reset the data before each target.
+
+Usage:
+    python benchmark_async.py --url http://localhost:8080 [--url ...] [--clients 1000] [--rounds 1]
+
+Start the targets with rate limiting off, e.g.:
+    RATE_LIMIT_PER_SECOND=0 python app.py
+    RATE_LIMIT_PER_SECOND=0 uvicorn asgi:app --port 8081
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+ENDPOINTS = ('checkin', 'lookup', 'stats')
+
+
+class Client:
+    """Minimal HTTP/1.1 keep-alive client, enough for the JSON API"""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+
+        payload = json.dumps(body).encode() if body is not None else b''
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n")
+        self.writer.write(head.encode() + payload)
+        try:
+            return await asyncio.wait_for(self._read_response(), self.timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        else:
+            await self.reader.read()
+            await self.close()
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def run_client(url, index, args, results, start):
+    client = Client(url, args.timeout)
+    email = f"bench-{index % args.emails:04d}@example.com"
+    # Start everyone together, like a room of attendees opening the page at once
+    await start.wait()
+    try:
+        for _ in range(args.rounds):
+            for endpoint in ENDPOINTS:
+                if endpoint == 'stats':
+                    method, path, body = 'GET', '/api/stats', None
+                else:
+                    method, path, body = 'POST', f'/api/{endpoint}', {'email': email}
+
+                began = time.perf_counter()
+                try:
+                    status = await client.request(method, path, body)
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+                    results[endpoint]['errors'] += 1
+                    results[endpoint]['error_types'][type(e).__name__] = \
+                        results[endpoint]['error_types'].get(type(e).__name__, 0) + 1
+                    continue
+                elapsed = time.perf_counter() - began
+
+                if status == 429:
+                    results[endpoint]['rejected'] += 1
+                elif status >= 500:
+                    results[endpoint]['errors'] += 1
+                else:
+                    results[endpoint]['latencies'].append(elapsed)
+    finally:
+        await client.close()
+
+
+async def benchmark(url, args):
+    results = {endpoint: {'latencies': [], 'rejected': 0, 'errors': 0, 'error_types': {}}
+               for endpoint in ENDPOINTS}
+    start = asyncio.Event()
+    tasks = [asyncio.create_task(run_client(url, i, args, results, start)) for i in range(args.clients)]
+    await asyncio.sleep(0)
+    began = time.perf_counter()
+    start.set()
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - began
+
+
+def report(url, results, elapsed):
+    print(f"\n🎯 {url}  ({elapsed:.2f}s)")
+    print(f"   {'endpoint':<10}{'ok':>8}{'429':>7}{'failed':>8}{'req/s':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    total_ok = 0
+    for endpoint, result in results.items():
+        latencies = sorted(result['latencies'])
+        total_ok += len(latencies)
+        print(f"   {endpoint:<10}{len(latencies):>8}{result['rejected']:>7}{result['errors']:>8}"
+              f"{len(latencies) / elapsed:>9.1f}"
+              f"{percentile(latencies, 0.50) * 1000:>9.1f}{percentile(latencies, 0.95) * 1000:>9.1f}"
+              f"{percentile(latencies, 0.99) * 1000:>9.1f}{(latencies[-1] if latencies else 0) * 1000:>9.1f}")
+        if result['error_types']:
+            print(f"   {'':<10}errors: {result['error_types']}")
+    print(f"   total: {total_ok / elapsed:.1f} successful requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare check-in API servers under concurrent clients")
+    parser.add_argument('--url', action='append', required=True,
+                        help="Base URL of a running server (repeat to compare several)")
+    parser.add_argument('--clients', type=int, default=1000, help="Concurrent clients (default: 1000)")
+    parser.add_argument('--rounds', type=int, default=1,
+                        help="Check-in/lookup/stats rounds per client (default: 1)")
+    parser.add_argument('--emails', type=int, default=75,
+                        help="Distinct attendee emails shared by the clients (default: 75)")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds (default: 30)")
+    args = parser.parse_args()
+
+    print(f"🚀 {args.clients} clients x {args.rounds} round(s), {args.emails} distinct emails")
+    for url in args.url:
+        results, elapsed = asyncio.run(benchmark(url.rstrip('/'), args))
+        report(url, results, elapsed)
+
+
+if __name__ == '__main__':
+    main()
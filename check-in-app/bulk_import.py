@@ -0,0 +1,133 @@
+"""Streaming roster CSV import shared by the admin endpoint and import_roster.py"""
+
+import csv
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from grouping import GROUP_SIZE, get_vpc_info_from_group_name, normalize_group_name
+
+# Invalid rows beyond this many are counted but not listed in the report
+MAX_REPORTED_ERRORS = 50
+
+
+def parse_group_column(value: Optional[str]) -> Optional[str]:
+    """Canonical "Group X" for a pre-assigned group, None for a blank cell.
+
+    Raises ValueError for anything that is not one of the 25 letter groups
+    (numeric "Group 3" style names are converted to their letter).
+    """
+    group_name = normalize_group_name(value)
+    if not group_name:
+        return None
+    group_letter, _ = get_vpc_info_from_group_name(group_name)
+    if not group_letter:
+        raise ValueError(f"Unknown group '{value}'")
+    return f"Group {group_letter}"
+
+
+def first_free_slot(group_names: Iterable[str]) -> int:
+    """First check-in slot after the highest pre-assigned group.
+
+    Slot allocation is moved past it, so walk-in check-ins (and roster rows
+    without a group) start filling the next untouched group.
+    """
+    highest = -1
+    for group_name in group_names:
+        group_letter, _ = get_vpc_info_from_group_name(group_name)
+        if group_letter:
+            highest = max(highest, ord(group_letter) - ord('A'))
+    return (highest + 1) * GROUP_SIZE
+
+
+class RosterImport:
+    """Reads a roster CSV as a stream and hands validated rows out in batches.
+
+    The CSV needs an `email` column; an optional `group` (or `group_name`)
+    column pre-assigns the attendee. Emails are checked with `is_valid`, which
+    should be a constant-time lookup against a directory snapshot taken once
+    for the whole import. Rows failing validation are rejected unless
+    `require_validated` is False, in which case they are stored unvalidated.
+    """
+
+    def __init__(self, lines: Iterable[str], is_valid: Callable[[str], bool],
+                 require_validated=True, batch_size=1000):
+        self.lines = lines
+        self.is_valid = is_valid
+        self.require_validated = require_validated
+        self.batch_size = batch_size
+
+        self.rows = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.invalid = 0
+        self.errors: List[Dict[str, Any]] = []
+        self._seen = set()
+        self._started = None
+
+    def _error(self, line: int, email: str, message: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'email': email, 'error': message})
+
+    def _rows(self) -> Iterator[Dict[str, Any]]:
+        reader = csv.DictReader(self.lines)
+        fields = {name.strip().lower(): name for name in (reader.fieldnames or [])}
+        if 'email' not in fields:
+            raise ValueError("CSV must have an 'email' column")
+        group_field = fields.get('group') or fields.get('group_name')
+
+        for record in reader:
+            self.rows += 1
+            line = reader.line_num
+            email = (record.get(fields['email']) or '').strip().lower()
+
+            if not email or '@' not in email:
+                self._error(line, email, "Invalid email address")
+                continue
+            try:
+                group_name = parse_group_column(record.get(group_field)) if group_field else None
+            except ValueError as e:
+                self._error(line, email, str(e))
+                continue
+            if email in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(email)
+
+            is_validated = self.is_valid(email)
+            if not is_validated and self.require_validated:
+                self.rejected += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append({'line': line, 'email': email,
+                                        'error': "Email not found in authorized user list"})
+                continue
+
+            yield {'email': email, 'group_name': group_name, 'is_validated': is_validated}
+
+    def batches(self) -> Iterator[List[Dict[str, Any]]]:
+        self._started = time.monotonic()
+        batch = []
+        for row in self._rows():
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def report(self, written: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine the parse tallies with the writer's result"""
+        duration = time.monotonic() - (self._started or time.monotonic())
+        return {
+            'rows': self.rows,
+            'imported': written.get('imported', 0),
+            'already_registered': written.get('existing', 0),
+            'auto_assigned': written.get('auto_assigned', 0),
+            'groups_touched': written.get('groups', []),
+            'duplicates': self.duplicates,
+            'rejected_unvalidated': self.rejected,
+            'invalid': self.invalid,
+            'errors': self.errors,
+            'duration_ms': round(duration * 1000),
+            'rows_per_second': round(self.rows / duration) if duration > 0 else None,
+        }
@@ -11,6 +11,8 @@ APP_NAME="checkin-app"
 IMAGE_NAME="icr.io/${ICR_NAMESPACE}/checkin-app:latest"
 POSTGRES_INSTANCE_NAME="checkin-postgres"
 SERVICE_KEY_NAME="checkin-postgres-key" # pragma: allowlist secret
+# Proxies in front of the app that append to X-Forwarded-For
+TRUSTED_PROXY_HOPS="${TRUSTED_PROXY_HOPS:-1}"
 
 # Colors for output
 RED='\033[0;31m'
@@ -113,7 +115,9 @@ deploy_application() {
             --env IBM_CLOUD_ACCOUNT_ID="$IBM_CLOUD_ACCOUNT_ID" \
             --env FLASK_SECRET_KEY="$FLASK_SECRET_KEY" \
             --env ADMIN_PASSWORD="$ADMIN_PASSWORD" \
-            --env PORT=8080
+            --env PORT=8080 \
+            --env TRUST_PROXY_HEADERS=true \
+            --env TRUSTED_PROXY_HOPS="$TRUSTED_PROXY_HOPS"
     else
         echo_info "Creating new application $APP_NAME"
         ibmcloud ce application create --name $APP_NAME \
@@ -128,7 +132,9 @@ deploy_application() {
             --env IBM_CLOUD_ACCOUNT_ID="$IBM_CLOUD_ACCOUNT_ID" \
             --env FLASK_SECRET_KEY="$FLASK_SECRET_KEY" \
             --env ADMIN_PASSWORD="$ADMIN_PASSWORD" \
-            --env PORT=8080
+            --env PORT=8080 \
+            --env TRUST_PROXY_HEADERS=true \
+            --env TRUSTED_PROXY_HOPS="$TRUSTED_PROXY_HOPS"
     fi
     
     echo_info "Application deployed successfully"
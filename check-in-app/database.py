@@ -1,12 +1,26 @@
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from pydantic import BaseModel
+import csv
+import io
 import json
+import re
 import ssl
 import os
 import base64
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Iterable
+
+from bulk_import import first_free_slot
+from grouping import GROUP_SIZE, get_group_for_slot
+from lab_events import DEFAULT_EVENT_ID, slot_sequence_name
+from migrations import SchemaContext, migrate
+from repository import REPLICATION_STATUS_SQL, CheckinRepository, pool_settings_from_env
+from user_directory import UserDirectory
 
 class UserCreate(BaseModel):
     email: str
@@ -17,91 +31,525 @@ class GroupCreate(BaseModel):
     name: str
     max_members: int = 3
 
-class DatabaseOperations:
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
 
-    def __init__(self):
-        # IBM Cloud Code Engine PostgreSQL connection
-        pqsqlServiceVars = os.environ.get('DATABASES_FOR_POSTGRESQL_CONNECTION')
-        if not pqsqlServiceVars:
-            raise ValueError("DATABASES_FOR_POSTGRESQL_CONNECTION environment variable not set")
-            
-        connectionJson = json.loads(pqsqlServiceVars)
-        connectionVars = list(connectionJson.values())[1]
-        
-        # Handle SSL certificate for IBM Cloud PostgreSQL
-        encodedCert = connectionVars['certificate']['certificate_base64']
-        certName = connectionVars['certificate']['name']
-        certFileName = certName + '.crt'
-        ca_cert = base64.b64decode(encodedCert)
-        decodedCert = ca_cert.decode('utf-8')
-        pqsqlCert = '/usr/local/share/ca-certificates/' + certFileName
+
+class ConnectionPool:
+    """Thread-safe, bounded pool of psycopg2 connections.
+
+    Connections are created lazily up to max_size. A connection that sat idle
+    longer than health_check_interval is pinged before being handed out, and
+    idle connections above min_size are closed once they exceed max_idle.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=5, timeout=10.0,
+                 max_idle=300.0, health_check_interval=30.0):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, returned_at) pairs, most recent last
+        self._size = 0
+        self._pid = os.getpid()
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._closed = 0
+        self._health_check_failures = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _check_fork(self):
+        """Forget connections inherited from a parent process (e.g. gunicorn preload)"""
+        if self._pid != os.getpid():
+            # Closing would send a terminate message on the parent's socket
+            self._idle.clear()
+            self._size = 0
+            self._pid = os.getpid()
+
+    def _close(self, conn):
+        self._closed += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _reap_idle_locked(self):
+        """Close idle connections above min_size that exceeded max_idle"""
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size:
+            conn, returned_at = self._idle[0]
+            if now - returned_at < self.max_idle:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._close(conn)
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        """Check out a connection, waiting up to timeout seconds for one to free up"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            with self._cond:
+                self._check_fork()
+                self._reap_idle_locked()
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    conn, returned_at = None, None
+                    self._size += 1  # reserve the slot before connecting outside the lock
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+            elif not self._is_healthy(conn, returned_at):
+                with self._cond:
+                    self._health_check_failures += 1
+                    self._size -= 1
+                    self._close(conn)
+                    self._cond.notify()
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                self._wait_time_total += waited
+                self._wait_time_max = max(self._wait_time_max, waited)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, closing it if it is broken"""
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if not discard and not conn.closed:
+                try:
+                    # Never hand out a connection with an open transaction
+                    if conn.status != psycopg2.extensions.STATUS_READY:
+                        conn.rollback()
+                except Exception:
+                    discard = True
+            if discard or conn.closed:
+                self._size -= 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._reap_idle_locked()
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commit on success, roll back on error"""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def close_all(self):
+        """Close every idle connection, e.g. on shutdown"""
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                self._close(conn)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Pool sizing, checkout and wait-time metrics"""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'connections_created': self._created,
+                'connections_closed': self._closed,
+                'health_check_failures': self._health_check_failures,
+                'wait_time_avg_ms': round(self._wait_time_total * 1000 / max(self._checkouts, 1), 3),
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 3),
+            }
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which named statements it has prepared"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # None after statements were lost: read pg_prepared_statements on next use
+        self.prepared = set()
+
+
+class StatementRegistry:
+    """Server-side prepared statements, prepared once per connection and run by name.
+
+    Statements are registered with $n placeholders and parameter types. The
+    first execution on a connection sends PREPARE, later ones only EXECUTE,
+    so PostgreSQL skips parsing and planning. Prepared names are tracked on
+    the connection itself (PreparingConnection), so a connection the pool
+    opens after a reconnect prepares them again on first use. If a session
+    loses its statements anyway, the failed statement is prepared again and
+    retried once, provided it opened the transaction (nothing else is rolled
+    back); later in a transaction the error is raised.
+
+    With enabled=False the same SQL is sent as plain text instead, e.g.
+    behind PgBouncer in transaction mode where sessions are not kept.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._statements = {}
+        self._lock = threading.Lock()
+        self._prepares = 0
+        self._executions = 0
+        self._lost = 0
+
+    def register(self, name: str, param_types: tuple, query: str):
+        # Plain-text form for enabled=False: $1 becomes %(1)s for psycopg2
+        text_query = re.sub(r'\$(\d+)', r'%(\1)s', query.replace('%', '%%'))
+        self._statements[name] = (param_types, query, text_query)
+
+    def execute(self, cur, name: str, params: tuple = ()):
+        """Run a registered statement on the cursor's connection"""
+        param_types, query, text_query = self._statements[name]
+        with self._lock:
+            self._executions += 1
+        if not self.enabled:
+            cur.execute(text_query, {str(i + 1): value for i, value in enumerate(params)})
+            return
+
+        conn = cur.connection
+        # A statement that opens the transaction can be retried after a rollback
+        starts_transaction = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        try:
+            self._prepare_and_execute(cur, name, param_types, query, params)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # The session dropped its statements (e.g. DISCARD ALL); relearn which it still has
+            conn.prepared = None
+            with self._lock:
+                self._lost += 1
+            if not starts_transaction:
+                raise
+            conn.rollback()
+            self._prepare_and_execute(cur, name, param_types, query, params)
+
+    def _prepare_and_execute(self, cur, name: str, param_types: tuple, query: str, params: tuple):
+        conn = cur.connection
+        if conn.prepared is None:
+            cur.execute("SELECT name FROM pg_prepared_statements")
+            conn.prepared = {row[0] for row in cur.fetchall()}
+        if name not in conn.prepared:
+            types = f" ({', '.join(param_types)})" if param_types else ""
+            cur.execute(f"PREPARE {name}{types} AS {query}")
+            conn.prepared.add(name)
+            with self._lock:
+                self._prepares += 1
+
+        cur.execute(f"EXECUTE {name}" + (f" ({', '.join(['%s'] * len(params))})" if params else ""), params)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'statements': len(self._statements),
+                'prepares': self._prepares,
+                'executions': self._executions,
+                'lost': self._lost,
+            }
+
+
+def code_engine_connection_config(variable: str = 'DATABASES_FOR_POSTGRESQL_CONNECTION') -> Dict[str, Any]:
+    """psycopg2 connection settings from a Code Engine service binding.
+
+    `variable` names the binding (the primary by default, or a read replica's).
+    Also writes the service's CA certificate to disk, where `sslcert` points.
+    """
+    # IBM Cloud Code Engine PostgreSQL connection
+    pqsqlServiceVars = os.environ.get(variable)
+    if not pqsqlServiceVars:
+        raise ValueError(f"{variable} environment variable not set")
         
-        # Ensure certificate directory exists
-        os.makedirs('/usr/local/share/ca-certificates/', exist_ok=True)
-        with open(pqsqlCert, 'w+') as output_file:
-            output_file.write(decodedCert)
+    connectionJson = json.loads(pqsqlServiceVars)
+    connectionVars = list(connectionJson.values())[1]
     
-        ssl_context = ssl.create_default_context(cafile=pqsqlCert)
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-
-        self.DATABASE_CONFIG = {
-            'database': connectionVars.get('database', 'checkin'),
-            'user': connectionVars['username'],
-            'password': connectionVars['password'],
-            'host': connectionVars['host'],
-            'port': connectionVars['port'],
-            'sslmode': 'require',
-            'sslcert': pqsqlCert
-        }
+    # Handle SSL certificate for IBM Cloud PostgreSQL
+    encodedCert = connectionVars['certificate']['certificate_base64']
+    certName = connectionVars['certificate']['name']
+    certFileName = certName + '.crt'
+    ca_cert = base64.b64decode(encodedCert)
+    decodedCert = ca_cert.decode('utf-8')
+    pqsqlCert = '/usr/local/share/ca-certificates/' + certFileName
+    
+    # Ensure certificate directory exists
+    os.makedirs('/usr/local/share/ca-certificates/', exist_ok=True)
+    with open(pqsqlCert, 'w+') as output_file:
+        output_file.write(decodedCert)
+
+    ssl_context = ssl.create_default_context(cafile=pqsqlCert)
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+
+    return {
+        'database': connectionVars.get('database', 'checkin'),
+        'user': connectionVars['username'],
+        'password': connectionVars['password'],
+        'host': connectionVars['host'],
+        'port': connectionVars['port'],
+        'sslmode': 'require',
+        'sslcert': pqsqlCert
+    }
+
+
+# Statements on the check-in and lookup paths: (name, parameter types, SQL).
+# Event-scoped statements take the event id as their last parameter.
+PREPARED_STATEMENTS = [
+    ('user_by_email', ('varchar', 'varchar'), """
+        SELECT id, email, group_name, checked_in_at, is_validated FROM users WHERE event_id = $2 AND email = $1
+    """),
+    ('checkin_insert_user', ('varchar', 'boolean', 'varchar', 'text'), """
+        INSERT INTO users (email, is_validated, event_id)
+        SELECT $1, $2, $3
+        WHERE NOT EXISTS (SELECT 1 FROM users WHERE event_id = $3 AND email = $1)
+        ON CONFLICT (event_id, email) DO NOTHING
+        RETURNING id, nextval($4::regclass)
+    """),
+    ('checkin_assign_group', ('varchar', 'integer', 'integer', 'boolean', 'varchar'), """
+        WITH assigned AS (
+            UPDATE users SET group_name = $1 WHERE id = $2
+            RETURNING id, email, group_name, checked_in_at, is_validated
+        ), grp AS (
+            INSERT INTO groups (name, max_members, current_members, is_full, event_id)
+            VALUES ($1, $3, 1, $4, $5)
+            ON CONFLICT (event_id, name) DO UPDATE
+                SET current_members = groups.current_members + 1,
+                    is_full = groups.current_members + 1 >= groups.max_members
+            RETURNING id, name, max_members, current_members, is_full, created_at
+        )
+        SELECT assigned.*, grp.* FROM assigned, grp
+    """),
+    ('checkin_existing_user', ('varchar', 'varchar'), """
+        SELECT u.id, u.email, u.group_name, u.checked_in_at, u.is_validated,
+               g.id, g.name, g.max_members, g.current_members, g.is_full, g.created_at
+        FROM users u
+        LEFT JOIN groups g ON g.event_id = u.event_id AND g.name = u.group_name
+        WHERE u.event_id = $2 AND u.email = $1
+    """),
+    ('user_roster', ('varchar', 'varchar'), """
+        SELECT u.id, u.email, u.group_name, u.checked_in_at, u.is_validated,
+               g.id, g.name, g.max_members, g.current_members, g.is_full, g.created_at,
+               m.id, m.email, m.group_name, m.checked_in_at, m.is_validated
+        FROM users u
+        LEFT JOIN groups g ON g.event_id = u.event_id AND g.name = u.group_name
+        LEFT JOIN users m ON m.event_id = u.event_id AND m.group_name = u.group_name
+        WHERE u.event_id = $2 AND u.email = $1
+        ORDER BY m.id
+    """),
+    ('checkin_stats', ('varchar',), """
+        SELECT (SELECT COUNT(*) FROM users WHERE event_id = $1),
+               COUNT(*),
+               COUNT(*) FILTER (WHERE is_full)
+        FROM groups WHERE event_id = $1
+    """),
+    ('available_group', ('varchar',), """
+        SELECT id, name, max_members, current_members, is_full, created_at
+        FROM groups WHERE event_id = $1 AND is_full = FALSE ORDER BY created_at LIMIT 1
+    """),
+    ('write_position', (), """
+        SELECT pg_current_wal_lsn()::text
+    """),
+    ('add_group_members', ('integer', 'varchar', 'varchar'), """
+        UPDATE groups SET current_members = current_members + $1,
+                          is_full = (current_members + $1 >= max_members)
+        WHERE event_id = $3 AND name = $2
+    """),
+]
+
+
+class DatabaseOperations(CheckinRepository):
+    """CheckinRepository on raw psycopg2 and a ConnectionPool (the Code Engine backend).
+
+    `config` is passed to psycopg2.connect (e.g. {'dsn': ...}); by default it
+    comes from the Code Engine service binding. The statements in
+    PREPARED_STATEMENTS are prepared on each pooled connection unless
+    `prepared_statements` (or DB_PREPARED_STATEMENTS=false) turns that off.
+    """
+
+    dialect = 'postgresql'
+    # Rows are staged with COPY, so large batches are cheap
+    import_batch_size = 5000
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, prepared_statements: Optional[bool] = None):
+        self.DATABASE_CONFIG = config if config is not None else code_engine_connection_config()
+        self.pool = ConnectionPool(self.connect_to_database, **pool_settings_from_env())
+
+        if prepared_statements is None:
+            prepared_statements = os.environ.get('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+        self.statements = StatementRegistry(enabled=prepared_statements)
+        for name, param_types, query in PREPARED_STATEMENTS:
+            self.statements.register(name, param_types, query)
 
     def connect_to_database(self):
-        return psycopg2.connect(**self.DATABASE_CONFIG)
+        """Open a new, unpooled connection (used by the pool to grow)"""
+        return psycopg2.connect(connection_factory=PreparingConnection, **self.DATABASE_CONFIG)
+
+    def connection(self):
+        """Borrow a pooled connection for one transaction"""
+        return self.pool.connection()
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Connection pool and prepared statement metrics for health and debug endpoints"""
+        return dict(self.pool.get_stats(), prepared_statements=self.statements.get_stats())
+
+    def is_transient_error(self, error: Exception) -> bool:
+        # OperationalError covers lost connections, failovers and serialization conflicts
+        return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout))
 
     def ensure_tables(self):
-        """Create tables if they don't exist"""
-        with self.connect_to_database() as conn:
+        """Bring the schema up to date and sync the slot counter"""
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                # Create users table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id SERIAL PRIMARY KEY,
-                        email VARCHAR(255) UNIQUE NOT NULL,
-                        group_name VARCHAR(100),
-                        checked_in_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        is_validated BOOLEAN DEFAULT FALSE
-                    )
-                """)
+                def execute(statement, params=None):
+                    cur.execute(statement, params)
+                    return cur.fetchall() if cur.description else None
+
+                result = migrate(SchemaContext('postgresql', execute))
+
+                # Continue after the default event's existing groups when the sequence is new
+                cur.execute("SELECT is_called FROM checkin_slot_seq")
+                if not cur.fetchone()[0]:
+                    cur.execute("SELECT COUNT(*) FROM groups WHERE event_id = %s", (DEFAULT_EVENT_ID,))
+                    group_count = cur.fetchone()[0]
+                    if group_count:
+                        cur.execute(
+                            "SELECT setval('checkin_slot_seq', %s, false)",
+                            (group_count * GROUP_SIZE,)
+                        )
                 
-                # Create groups table
+                conn.commit()
+                if result['applied']:
+                    print(f"Database schema migrated to version {result['to_version']}")
+                else:
+                    print(f"Database schema is current (version {result['to_version']})")
+                return result
+
+    # Events
+    def create_event(self, event_id: str, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Create an event and its slot sequence; None if the id is taken"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
                 cur.execute("""
-                    CREATE TABLE IF NOT EXISTS groups (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(100) UNIQUE NOT NULL,
-                        max_members INTEGER DEFAULT 3,
-                        current_members INTEGER DEFAULT 0,
-                        is_full BOOLEAN DEFAULT FALSE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
+                    INSERT INTO events (id, name) VALUES (%s, %s)
+                    ON CONFLICT (id) DO NOTHING
+                    RETURNING id, name, created_at
+                """, (event_id, name or event_id))
+                row = cur.fetchone()
+                if row:
+                    cur.execute(sql.SQL("CREATE SEQUENCE IF NOT EXISTS {} MINVALUE 0 START WITH 0").format(
+                        sql.Identifier(slot_sequence_name(event_id))))
                 conn.commit()
-                print("Database tables created successfully")
+                if not row:
+                    return None
+                return {
+                    'id': row[0],
+                    'name': row[1],
+                    'created_at': row[2].isoformat() if row[2] else None
+                }
+
+    def get_event(self, event_id: str) -> Optional[Dict[str, Any]]:
+        """Get an event by id"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, name, created_at FROM events WHERE id = %s", (event_id,))
+                row = cur.fetchone()
+                if row:
+                    return {
+                        'id': row[0],
+                        'name': row[1],
+                        'created_at': row[2].isoformat() if row[2] else None
+                    }
+                return None
 
-    def create_user(self, email: str, group_name: Optional[str] = None, is_validated: bool = False) -> int:
+    def get_events(self) -> List[Dict[str, Any]]:
+        """Every event with its user and group counts"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT e.id, e.name, e.created_at,
+                           (SELECT COUNT(*) FROM users u WHERE u.event_id = e.id),
+                           (SELECT COUNT(*) FROM groups g WHERE g.event_id = e.id)
+                    FROM events e ORDER BY e.created_at, e.id
+                """)
+                return [{
+                    'id': row[0],
+                    'name': row[1],
+                    'created_at': row[2].isoformat() if row[2] else None,
+                    'total_users': row[3],
+                    'total_groups': row[4]
+                } for row in cur.fetchall()]
+
+    def create_user(self, email: str, group_name: Optional[str] = None, is_validated: bool = False,
+                    event_id: str = DEFAULT_EVENT_ID) -> int:
         """Create a new user and return the user ID"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 insert_query = sql.SQL(
-                    "INSERT INTO users (email, group_name, is_validated) VALUES (%s, %s, %s) RETURNING id"
+                    "INSERT INTO users (email, group_name, is_validated, event_id) VALUES (%s, %s, %s, %s) RETURNING id"
                 )
-                cur.execute(insert_query, (email.lower().strip(), group_name, is_validated))
+                cur.execute(insert_query, (email.lower().strip(), group_name, is_validated, event_id))
                 conn.commit()
                 return cur.fetchone()[0]
 
     def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user by ID"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT id, email, group_name, checked_in_at, is_validated FROM users WHERE id = %s", (user_id,))
                 row = cur.fetchone()
@@ -115,11 +563,11 @@ class DatabaseOperations:
                     }
                 return None
 
-    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+    def get_user_by_email(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
         """Get user by email address"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT id, email, group_name, checked_in_at, is_validated FROM users WHERE email = %s", (email.lower().strip(),))
+                self.statements.execute(cur, 'user_by_email', (email.lower().strip(), event_id))
                 row = cur.fetchone()
                 if row:
                     return {
@@ -131,11 +579,15 @@ class DatabaseOperations:
                     }
                 return None
 
-    def get_all_users(self) -> List[Dict[str, Any]]:
-        """Get all users"""
-        with self.connect_to_database() as conn:
+    def get_all_users(self, event_id: str = DEFAULT_EVENT_ID) -> List[Dict[str, Any]]:
+        """Get all users of an event"""
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT id, email, group_name, checked_in_at, is_validated FROM users ORDER BY checked_in_at DESC")
+                cur.execute(
+                    "SELECT id, email, group_name, checked_in_at, is_validated FROM users"
+                    " WHERE event_id = %s ORDER BY checked_in_at DESC",
+                    (event_id,)
+                )
                 rows = cur.fetchall()
                 return [{
                     'id': row[0],
@@ -145,9 +597,99 @@ class DatabaseOperations:
                     'is_validated': row[4]
                 } for row in rows]
 
+    def _user_filter_sql(self, filters: Optional[Dict[str, Any]] = None, after=None, event_id: str = DEFAULT_EVENT_ID):
+        """WHERE clause and params for the event, group / VPC / email prefix filters and a keyset cursor"""
+        filters = filters or {}
+        clauses, params = ["event_id = %s"], [event_id]
+        if filters.get('group_name'):
+            clauses.append("group_name = %s")
+            params.append(filters['group_name'])
+        if filters.get('group_names') is not None:
+            clauses.append("group_name = ANY(%s)")
+            params.append(list(filters['group_names']))
+        if filters.get('email_prefix'):
+            prefix = filters['email_prefix'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("email LIKE %s ESCAPE '\\'")
+            params.append(prefix + '%')
+        if after is not None:
+            # Newest first: continue strictly after the last (checked_in_at, id) seen
+            clauses.append("(checked_in_at, id) < (%s, %s)")
+            params.extend(after)
+        return " WHERE " + " AND ".join(clauses), params
+
+    def get_users_page(self, filters: Optional[Dict[str, Any]] = None, after=None, limit: int = 100,
+                       event_id: str = DEFAULT_EVENT_ID):
+        """One page of users, newest first; returns (users, has_more)"""
+        where, params = self._user_filter_sql(filters, after, event_id)
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT id, email, group_name, checked_in_at, is_validated FROM users"
+                    + where + " ORDER BY checked_in_at DESC, id DESC LIMIT %s",
+                    params + [limit + 1]
+                )
+                rows = cur.fetchall()
+                users = [{
+                    'id': row[0],
+                    'email': row[1],
+                    'group_name': row[2],
+                    'checked_in_at': row[3].isoformat() if row[3] else None,
+                    'is_validated': row[4]
+                } for row in rows[:limit]]
+                return users, len(rows) > limit
+
+    def count_users(self, filters: Optional[Dict[str, Any]] = None, event_id: str = DEFAULT_EVENT_ID) -> int:
+        """Count users matching the filters"""
+        where, params = self._user_filter_sql(filters, event_id=event_id)
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT COUNT(*) FROM users" + where, params)
+                return cur.fetchone()[0]
+
+    def iter_users(self, filters: Optional[Dict[str, Any]] = None, batch_size: int = 500,
+                   event_id: str = DEFAULT_EVENT_ID):
+        """Yield users newest first through a server-side cursor, batch_size rows at a time"""
+        where, params = self._user_filter_sql(filters, event_id=event_id)
+        with self.connection() as conn:
+            with conn.cursor(name='iter_users') as cur:
+                cur.itersize = batch_size
+                cur.execute(
+                    "SELECT id, email, group_name, checked_in_at, is_validated FROM users"
+                    + where + " ORDER BY checked_in_at DESC, id DESC",
+                    params
+                )
+                for row in cur:
+                    yield {
+                        'id': row[0],
+                        'email': row[1],
+                        'group_name': row[2],
+                        'checked_in_at': row[3].isoformat() if row[3] else None,
+                        'is_validated': row[4]
+                    }
+
+    def get_stats(self, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, int]:
+        """User and group counts for the dashboard in a single round trip"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self.statements.execute(cur, 'checkin_stats', (event_id,))
+                total_users, total_groups, full_groups = cur.fetchone()
+                return {
+                    'total_users': total_users,
+                    'total_groups': total_groups,
+                    'full_groups': full_groups,
+                    'available_groups': total_groups - full_groups,
+                }
+
+    def get_registered_emails(self, event_id: str = DEFAULT_EVENT_ID) -> set:
+        """Get the set of all emails registered for an event"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT email FROM users WHERE event_id = %s", (event_id,))
+                return {row[0] for row in cur.fetchall()}
+
     def update_user_group(self, user_id: int, group_name: str) -> bool:
         """Update user's group assignment"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("UPDATE users SET group_name = %s WHERE id = %s", (group_name, user_id))
                 conn.commit()
@@ -155,37 +697,41 @@ class DatabaseOperations:
 
     def delete_user(self, user_id: int) -> bool:
         """Delete user by ID"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
                 conn.commit()
                 return cur.rowcount > 0
 
-    def delete_user_by_email(self, email: str) -> bool:
+    def delete_user_by_email(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> bool:
         """Delete user by email"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("DELETE FROM users WHERE email = %s", (email.lower().strip(),))
+                cur.execute("DELETE FROM users WHERE event_id = %s AND email = %s", (event_id, email.lower().strip()))
                 conn.commit()
                 return cur.rowcount > 0
 
     # Group management methods
-    def create_group(self, name: str, max_members: int = 3) -> int:
+    def create_group(self, name: str, max_members: int = 3, event_id: str = DEFAULT_EVENT_ID) -> int:
         """Create a new group and return the group ID"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    "INSERT INTO groups (name, max_members) VALUES (%s, %s) RETURNING id",
-                    (name, max_members)
+                    "INSERT INTO groups (name, max_members, event_id) VALUES (%s, %s, %s) RETURNING id",
+                    (name, max_members, event_id)
                 )
                 conn.commit()
                 return cur.fetchone()[0]
 
-    def get_group_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+    def get_group_by_name(self, name: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
         """Get group by name"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT id, name, max_members, current_members, is_full, created_at FROM groups WHERE name = %s", (name,))
+                cur.execute(
+                    "SELECT id, name, max_members, current_members, is_full, created_at FROM groups"
+                    " WHERE event_id = %s AND name = %s",
+                    (event_id, name)
+                )
                 row = cur.fetchone()
                 if row:
                     return {
@@ -198,11 +744,11 @@ class DatabaseOperations:
                     }
                 return None
 
-    def get_available_group(self) -> Optional[Dict[str, Any]]:
+    def get_available_group(self, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
         """Get first available group (not full)"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT id, name, max_members, current_members, is_full, created_at FROM groups WHERE is_full = FALSE LIMIT 1")
+                self.statements.execute(cur, 'available_group', (event_id,))
                 row = cur.fetchone()
                 if row:
                     return {
@@ -215,11 +761,15 @@ class DatabaseOperations:
                     }
                 return None
 
-    def get_all_groups(self) -> List[Dict[str, Any]]:
-        """Get all groups"""
-        with self.connect_to_database() as conn:
+    def get_all_groups(self, event_id: str = DEFAULT_EVENT_ID) -> List[Dict[str, Any]]:
+        """Get all groups of an event"""
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT id, name, max_members, current_members, is_full, created_at FROM groups ORDER BY created_at")
+                cur.execute(
+                    "SELECT id, name, max_members, current_members, is_full, created_at FROM groups"
+                    " WHERE event_id = %s ORDER BY created_at",
+                    (event_id,)
+                )
                 rows = cur.fetchall()
                 return [{
                     'id': row[0],
@@ -230,52 +780,522 @@ class DatabaseOperations:
                     'created_at': row[5].isoformat() if row[5] else None
                 } for row in rows]
 
-    def update_group_members(self, group_name: str, increment: int = 1) -> bool:
+    def update_group_members(self, group_name: str, increment: int = 1, event_id: str = DEFAULT_EVENT_ID) -> bool:
         """Update group member count and full status"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                # Update member count
-                cur.execute(
-                    "UPDATE groups SET current_members = current_members + %s WHERE name = %s",
-                    (increment, group_name)
-                )
-                
-                # Check if group is now full and update status
-                cur.execute(
-                    "UPDATE groups SET is_full = (current_members >= max_members) WHERE name = %s",
-                    (group_name,)
-                )
-                
+                # Member count and full status in one statement
+                self.statements.execute(cur, 'add_group_members', (increment, group_name, event_id))
                 conn.commit()
                 return cur.rowcount > 0
 
-    def get_group_count(self) -> int:
+    def _next_slot(self, cur, event_id: str = DEFAULT_EVENT_ID) -> int:
+        """Take the event's next check-in slot; sequences never block or roll back"""
+        cur.execute("SELECT nextval(%s::regclass)", (slot_sequence_name(event_id),))
+        return cur.fetchone()[0]
+
+    def assign_user_to_slot_group(self, user_id: int, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Assign a user to the group owned by the next check-in slot.
+
+        The group follows from the slot alone, so there is no read-then-write
+        race between workers; the only write contention is the counter on the
+        attendee's own group row. A slot is not reused if the transaction fails
+        or the user is later removed.
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                group_name, _, _ = get_group_for_slot(self._next_slot(cur, event_id))
+                cur.execute("""
+                    WITH assigned AS (
+                        UPDATE users SET group_name = %s WHERE id = %s
+                    )
+                    INSERT INTO groups (name, max_members, current_members, is_full, event_id)
+                    VALUES (%s, %s, 1, %s, %s)
+                    ON CONFLICT (event_id, name) DO UPDATE
+                        SET current_members = groups.current_members + 1,
+                            is_full = groups.current_members + 1 >= groups.max_members
+                    RETURNING id, name, max_members, current_members, is_full, created_at
+                """, (group_name, user_id, group_name, GROUP_SIZE, GROUP_SIZE <= 1, event_id))
+                row = cur.fetchone()
+                conn.commit()
+                return {
+                    'id': row[0],
+                    'name': row[1],
+                    'max_members': row[2],
+                    'current_members': row[3],
+                    'is_full': row[4],
+                    'created_at': row[5].isoformat() if row[5] else None
+                }
+
+    def checkin(self, email: str, is_validated: bool = True, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Check a user in and assign their group in a single transaction.
+
+        A new user is inserted together with their check-in slot, then the
+        group assignment and group counter are written in one statement that
+        returns both rows. Re-submissions hit the NOT EXISTS / ON CONFLICT
+        guard, take no slot and read back the existing assignment instead.
+        Slots come from the event's own sequence.
+        """
+        email = email.lower().strip()
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self.statements.execute(cur, 'checkin_insert_user',
+                                        (email, is_validated, event_id, slot_sequence_name(event_id)))
+                inserted = cur.fetchone()
+
+                if inserted:
+                    user_id, slot = inserted
+                    group_name, _, _ = get_group_for_slot(slot)
+                    self.statements.execute(cur, 'checkin_assign_group',
+                                            (group_name, user_id, GROUP_SIZE, GROUP_SIZE <= 1, event_id))
+                else:
+                    self.statements.execute(cur, 'checkin_existing_user', (email, event_id))
+                row = cur.fetchone()
+                conn.commit()
+
+                return {
+                    'user': {
+                        'id': row[0],
+                        'email': row[1],
+                        'group_name': row[2],
+                        'checked_in_at': row[3].isoformat() if row[3] else None,
+                        'is_validated': row[4]
+                    },
+                    'group': {
+                        'id': row[5],
+                        'name': row[6],
+                        'max_members': row[7],
+                        'current_members': row[8],
+                        'is_full': row[9],
+                        'created_at': row[10].isoformat() if row[10] else None
+                    } if row[5] is not None else None,
+                    'already_registered': inserted is None
+                }
+
+    def get_user_roster(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
+        """Get a user, their group and every member of that group in one query"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self.statements.execute(cur, 'user_roster', (email, event_id))
+                rows = cur.fetchall()
+                if not rows:
+                    return None
+
+                row = rows[0]
+                return {
+                    'user': {
+                        'id': row[0],
+                        'email': row[1],
+                        'group_name': row[2],
+                        'checked_in_at': row[3].isoformat() if row[3] else None,
+                        'is_validated': row[4]
+                    },
+                    'group': {
+                        'id': row[5],
+                        'name': row[6],
+                        'max_members': row[7],
+                        'current_members': row[8],
+                        'is_full': row[9],
+                        'created_at': row[10].isoformat() if row[10] else None
+                    } if row[5] is not None else None,
+                    'members': [{
+                        'id': r[11],
+                        'email': r[12],
+                        'group_name': r[13],
+                        'checked_in_at': r[14].isoformat() if r[14] else None,
+                        'is_validated': r[15]
+                    } for r in rows if r[11] is not None]
+                }
+
+    def get_group_member_counts(self, event_id: str = DEFAULT_EVENT_ID) -> List[tuple]:
+        """(group name, member count) for every group of an event, from one aggregate query"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT g.name, COUNT(u.id)
+                    FROM groups g
+                    LEFT JOIN users u ON u.event_id = g.event_id AND u.group_name = g.name
+                    WHERE g.event_id = %s
+                    GROUP BY g.id, g.name
+                """, (event_id,))
+                return cur.fetchall()
+
+    def rename_groups(self, renames: List[tuple], event_id: str = DEFAULT_EVENT_ID) -> Dict[str, int]:
+        """Rename groups and move their members with one UPDATE each, in a single transaction"""
+        if not renames:
+            return {'groups_renamed': 0, 'users_updated': 0}
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                # The event id is bound into the statement before execute_values fills in VALUES
+                execute_values(cur, cur.mogrify("""
+                    UPDATE groups SET name = v.new_name
+                    FROM (VALUES %%s) AS v(old_name, new_name)
+                    WHERE groups.event_id = %s AND groups.name = v.old_name
+                """, (event_id,)).decode(), renames, page_size=len(renames))
+                groups_renamed = cur.rowcount
+                execute_values(cur, cur.mogrify("""
+                    UPDATE users SET group_name = v.new_name
+                    FROM (VALUES %%s) AS v(old_name, new_name)
+                    WHERE users.event_id = %s AND users.group_name = v.old_name
+                """, (event_id,)).decode(), renames, page_size=len(renames))
+                users_updated = cur.rowcount
+                conn.commit()
+                return {'groups_renamed': groups_renamed, 'users_updated': users_updated}
+
+    def _recount_groups(self, cur, group_names: List[str], event_id: str) -> List[str]:
+        """Set the event's group counters from the users table for the given groups.
+
+        One aggregate upsert covers every group that still has members; groups
+        left without members are deleted, and their names returned.
+        """
+        cur.execute("""
+            INSERT INTO groups (event_id, name, max_members, current_members, is_full)
+            SELECT event_id, group_name, %s, COUNT(*), COUNT(*) >= %s
+            FROM users WHERE event_id = %s AND group_name = ANY(%s)
+            GROUP BY event_id, group_name
+            ON CONFLICT (event_id, name) DO UPDATE
+                SET current_members = EXCLUDED.current_members,
+                    is_full = EXCLUDED.current_members >= groups.max_members
+        """, (GROUP_SIZE, GROUP_SIZE, event_id, list(group_names)))
+        cur.execute("""
+            DELETE FROM groups
+            WHERE event_id = %s AND name = ANY(%s)
+              AND NOT EXISTS (SELECT 1 FROM users
+                              WHERE users.event_id = groups.event_id AND users.group_name = groups.name)
+            RETURNING name
+        """, (event_id, list(group_names)))
+        return [row[0] for row in cur.fetchall()]
+
+    def remove_users(self, emails: Optional[List[str]] = None, group_name: Optional[str] = None,
+                     event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Delete users by email list or by group in one statement, then recount their groups.
+
+        Returns the removed users and a per-group summary; everything happens
+        in a single transaction.
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                if emails is not None:
+                    cur.execute("DELETE FROM users WHERE event_id = %s AND email = ANY(%s) RETURNING email, group_name",
+                                (event_id, list(emails)))
+                else:
+                    cur.execute("DELETE FROM users WHERE event_id = %s AND group_name = %s RETURNING email, group_name",
+                                (event_id, group_name))
+                removed = cur.fetchall()
+
+                affected = sorted({name for _, name in removed if name})
+                groups_removed = set(self._recount_groups(cur, affected, event_id)) if affected else set()
+
+                remaining = {}
+                if affected:
+                    cur.execute("""
+                        SELECT id, name, max_members, current_members, is_full, created_at
+                        FROM groups WHERE event_id = %s AND name = ANY(%s)
+                    """, (event_id, affected))
+                    for row in cur.fetchall():
+                        remaining[row[1]] = {
+                            'id': row[0],
+                            'name': row[1],
+                            'max_members': row[2],
+                            'current_members': row[3],
+                            'is_full': row[4],
+                            'created_at': row[5].isoformat() if row[5] else None
+                        }
+                conn.commit()
+
+                return {
+                    'removed': [{'email': email, 'group_name': name} for email, name in removed],
+                    'groups': [{
+                        'group_name': name,
+                        'users_removed': sum(1 for _, removed_group in removed if removed_group == name),
+                        'group_removed': name in groups_removed,
+                        'group': remaining.get(name)
+                    } for name in affected]
+                }
+
+    def import_users(self, batches: Iterable[List[Dict[str, Any]]], event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Bulk-register attendees in one transaction.
+
+        Each batch is streamed into a temporary staging table with COPY, then
+        new emails move to users in a single INSERT ... SELECT (existing users
+        are left alone). Rows without a group take check-in slots after the
+        highest pre-assigned group, and the touched group counters are
+        recomputed from the users table.
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE import_users (
+                        email VARCHAR(255),
+                        group_name VARCHAR(100),
+                        is_validated BOOLEAN
+                    ) ON COMMIT DROP
+                """)
+                staged = 0
+                for batch in batches:
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    for row in batch:
+                        # An unquoted empty field is NULL in COPY's CSV format
+                        writer.writerow((row['email'], row['group_name'] or '', 't' if row['is_validated'] else 'f'))
+                    buffer.seek(0)
+                    cur.copy_expert("COPY import_users (email, group_name, is_validated) FROM STDIN WITH (FORMAT csv)", buffer)
+                    staged += len(batch)
+
+                cur.execute("""
+                    INSERT INTO users (email, group_name, is_validated, event_id)
+                    SELECT email, group_name, is_validated, %s FROM import_users
+                    ON CONFLICT (event_id, email) DO NOTHING
+                    RETURNING id, group_name
+                """, (event_id,))
+                inserted = cur.fetchall()
+
+                unassigned = [user_id for user_id, group_name in inserted if group_name is None]
+                groups = {group_name for _, group_name in inserted if group_name}
+
+                # Walk-in slots continue after the pre-assigned groups
+                sequence = slot_sequence_name(event_id)
+                cur.execute(sql.SQL("""
+                    SELECT setval({name}, GREATEST(%s,
+                        (SELECT CASE WHEN is_called THEN last_value + 1 ELSE last_value END FROM {sequence})), false)
+                """).format(name=sql.Literal(sequence), sequence=sql.Identifier(sequence)), (first_free_slot(groups),))
+
+                if unassigned:
+                    cur.execute("SELECT nextval(%s::regclass) FROM generate_series(1, %s)", (sequence, len(unassigned)))
+                    assignments = [(user_id, get_group_for_slot(slot)[0])
+                                   for user_id, (slot,) in zip(unassigned, cur.fetchall())]
+                    execute_values(cur, """
+                        UPDATE users SET group_name = v.group_name
+                        FROM (VALUES %s) AS v(id, group_name)
+                        WHERE users.id = v.id
+                    """, assignments, page_size=1000)
+                    groups.update(group_name for _, group_name in assignments)
+
+                if groups:
+                    self._recount_groups(cur, sorted(groups), event_id)
+                conn.commit()
+
+                return {
+                    'imported': len(inserted),
+                    'existing': staged - len(inserted),
+                    'auto_assigned': len(unassigned),
+                    'groups': sorted(groups)
+                }
+
+    def reserve_slots(self, count: int, event_id: str = DEFAULT_EVENT_ID) -> List[int]:
+        """Take `count` check-in slots from the event's sequence in one round trip"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT nextval(%s::regclass) FROM generate_series(1, %s)",
+                            (slot_sequence_name(event_id), count))
+                slots = [row[0] for row in cur.fetchall()]
+                conn.commit()
+                return slots
+
+    def insert_checkins(self, records: List[Dict[str, Any]], event_id: str = DEFAULT_EVENT_ID) -> List[str]:
+        """Store already-assigned check-ins with one multi-row INSERT, then recount their groups.
+
+        Emails that are already stored are skipped, so replaying a batch is
+        harmless. Returns the groups touched.
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(cur, """
+                    INSERT INTO users (email, group_name, is_validated, checked_in_at, event_id)
+                    VALUES %s
+                    ON CONFLICT (event_id, email) DO NOTHING
+                """, [(r['email'], r['group_name'], r['is_validated'], r['checked_in_at'], event_id) for r in records],
+                    page_size=len(records))
+                groups = sorted({r['group_name'] for r in records})
+                self._recount_groups(cur, groups, event_id)
+                conn.commit()
+                return groups
+
+    def notify(self, channel: str, payload: str):
+        """Send a PostgreSQL NOTIFY on the given channel"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+                conn.commit()
+
+    def get_write_position(self) -> Optional[str]:
+        """Current WAL position (LSN) on this server, for read-your-writes on a replica"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self.statements.execute(cur, 'write_position')
+                return cur.fetchone()[0]
+
+    def get_replication_status(self) -> Dict[str, Any]:
+        """Replayed WAL position and replay delay, when this server is a read replica"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(REPLICATION_STATUS_SQL)
+                position, lag = cur.fetchone()
+                return {'position': position, 'lag_seconds': float(lag)}
+
+    def get_group_count(self, event_id: str = DEFAULT_EVENT_ID) -> int:
         """Get total number of groups"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT COUNT(*) FROM groups")
+                cur.execute("SELECT COUNT(*) FROM groups WHERE event_id = %s", (event_id,))
                 return cur.fetchone()[0]
 
-    def get_user_count(self) -> int:
+    def get_user_count(self, event_id: str = DEFAULT_EVENT_ID) -> int:
         """Get total number of users"""
-        with self.connect_to_database() as conn:
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT COUNT(*) FROM users")
+                cur.execute("SELECT COUNT(*) FROM users WHERE event_id = %s", (event_id,))
                 return cur.fetchone()[0]
 
-    def reset_all_data(self) -> Dict[str, int]:
-        """Reset all users and groups - use before demo session"""
-        with self.connect_to_database() as conn:
+    def reset_all_data(self, archive: bool = True, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Reset an event's users and groups - use before demo session.
+
+        With `archive`, the session is first copied into the archive tables.
+        While other events have rows in the tables, the event's rows are
+        deleted through the event_id indexes; otherwise the tables are emptied
+        with TRUNCATE ... RESTART IDENTITY, which leaves no dead tuples behind.
+        Both phases share one transaction, and each is timed.
+        """
+        timings = {}
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                # Count existing data
-                cur.execute("SELECT COUNT(*) FROM users")
-                user_count = cur.fetchone()[0]
-                cur.execute("SELECT COUNT(*) FROM groups")
-                group_count = cur.fetchone()[0]
-                
-                # Delete all data
-                cur.execute("DELETE FROM users")
-                cur.execute("DELETE FROM groups")
-                
+                started = time.monotonic()
+                archive_id = None
+                if archive:
+                    cur.execute("INSERT INTO checkin_archives (event_id) VALUES (%s) RETURNING id", (event_id,))
+                    archive_id = cur.fetchone()[0]
+                    cur.execute("""
+                        INSERT INTO archived_users (archive_id, email, group_name, checked_in_at, is_validated)
+                        SELECT %s, email, group_name, checked_in_at, is_validated FROM users WHERE event_id = %s
+                    """, (archive_id, event_id))
+                    user_count = cur.rowcount
+                    cur.execute("""
+                        INSERT INTO archived_groups (archive_id, name, max_members, current_members, is_full, created_at)
+                        SELECT %s, name, max_members, current_members, is_full, created_at FROM groups WHERE event_id = %s
+                    """, (archive_id, event_id))
+                    group_count = cur.rowcount
+                    cur.execute(
+                        "UPDATE checkin_archives SET users_count = %s, groups_count = %s WHERE id = %s",
+                        (user_count, group_count, archive_id)
+                    )
+                else:
+                    cur.execute("""
+                        SELECT (SELECT COUNT(*) FROM users WHERE event_id = %s),
+                               (SELECT COUNT(*) FROM groups WHERE event_id = %s)
+                    """, (event_id, event_id))
+                    user_count, group_count = cur.fetchone()
+                timings['archive_ms'] = round((time.monotonic() - started) * 1000, 1)
+
+                started = time.monotonic()
+                cur.execute("""
+                    SELECT EXISTS (SELECT 1 FROM users WHERE event_id <> %s)
+                        OR EXISTS (SELECT 1 FROM groups WHERE event_id <> %s)
+                        OR EXISTS (SELECT 1 FROM idempotency_keys WHERE event_id <> %s)
+                """, (event_id, event_id, event_id))
+                if cur.fetchone()[0]:
+                    cur.execute("DELETE FROM users WHERE event_id = %s", (event_id,))
+                    cur.execute("DELETE FROM groups WHERE event_id = %s", (event_id,))
+                    cur.execute("DELETE FROM idempotency_keys WHERE event_id = %s", (event_id,))
+                else:
+                    cur.execute("TRUNCATE users, groups RESTART IDENTITY")
+                    cur.execute("TRUNCATE idempotency_keys")
+                cur.execute(sql.SQL("ALTER SEQUENCE {} RESTART").format(sql.Identifier(slot_sequence_name(event_id))))
+                conn.commit()
+                timings['truncate_ms'] = round((time.monotonic() - started) * 1000, 1)
+
+                return {
+                    'users_removed': user_count,
+                    'groups_removed': group_count,
+                    'archive_id': archive_id,
+                    'timings_ms': timings
+                }
+
+    # Stored check-in responses for idempotent retries
+    def get_idempotent_response(self, key: str, email: str, max_age: float,
+                                event_id: str = DEFAULT_EVENT_ID) -> Optional[tuple]:
+        """(status_code, response body) stored for this key and email, if recent enough"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT status_code, response FROM idempotency_keys
+                    WHERE idempotency_key = %s AND email = %s AND event_id = %s AND created_at > %s
+                """, (key, email, event_id, time.time() - max_age))
+                row = cur.fetchone()
+                conn.commit()
+                return (row[0], row[1]) if row else None
+
+    def save_idempotent_response(self, key: str, email: str, status_code: int, response: str,
+                                 event_id: str = DEFAULT_EVENT_ID):
+        """Store a response; the first one stored for a key and email wins"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO idempotency_keys (idempotency_key, email, status_code, response, created_at, event_id)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (event_id, idempotency_key, email) DO NOTHING
+                """, (key, email, status_code, response, time.time(), event_id))
+                conn.commit()
+
+    # Shared user directory snapshot (same interface as SQLAlchemyDirectoryStore)
+    def get_directory_version(self):
+        """(version, refreshed_at) of the shared snapshot; version 0 means empty"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT version, refreshed_at FROM user_directory_snapshot WHERE id = 1")
+                row = cur.fetchone()
+                return (row[0], row[1]) if row else None
+
+    def load_directory(self) -> Optional[UserDirectory]:
+        """Load the shared snapshot, or None if nothing has been published"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT version, refreshed_at, users FROM user_directory_snapshot WHERE id = 1")
+                row = cur.fetchone()
+                if not row or not row[0]:
+                    return None
+                return UserDirectory(json.loads(row[2]), version=row[0], refreshed_at=row[1])
+
+    def try_lease_directory_refresh(self, owner: str, seconds: float) -> bool:
+        """Claim the right to crawl for the next `seconds`; False if someone holds it"""
+        now = time.time()
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE user_directory_snapshot
+                    SET lease_owner = %s, lease_until = %s
+                    WHERE id = 1 AND (lease_until IS NULL OR lease_until < %s OR lease_owner = %s)
+                """, (owner, now + seconds, now, owner))
+                conn.commit()
+                return cur.rowcount == 1
+
+    def release_directory_lease(self, owner: str):
+        """Give up a lease after a failed crawl so another worker can try"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE user_directory_snapshot SET lease_until = NULL WHERE id = 1 AND lease_owner = %s",
+                    (owner,)
+                )
+                conn.commit()
+
+    def save_directory(self, users: List[Dict[str, Any]], refreshed_at: float) -> int:
+        """Publish a new snapshot, release the lease and return the new version"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE user_directory_snapshot
+                    SET version = version + 1, users = %s, refreshed_at = %s,
+                        lease_owner = NULL, lease_until = NULL
+                    WHERE id = 1
+                    RETURNING version
+                """, (json.dumps(users), refreshed_at))
+                version = cur.fetchone()[0]
+                conn.commit()
+                return version
+
+    def expire_directory(self):
+        """Mark the shared snapshot stale so the next check re-crawls"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE user_directory_snapshot SET refreshed_at = 0 WHERE id = 1")
                 conn.commit()
-                return {'users_removed': user_count, 'groups_removed': group_count}
@@ -0,0 +1,212 @@
+"""In-process event bus for live dashboard updates, with optional PostgreSQL fan-out"""
+
+import json
+import os
+import queue
+import select
+import threading
+import time
+import uuid
+from typing import Dict, Any, Callable
+
+
+class EventBus:
+    """Publish/subscribe hub for check-in, removal and group events.
+
+    Each subscriber (one per open Server-Sent Events stream) gets a bounded
+    queue. A subscriber that falls too far behind has its backlog replaced by
+    a single "resync" event, telling the client to reload a full snapshot
+    instead of slowing down publishers.
+
+    Events published here reach subscribers in this process immediately. When
+    a relay is attached (see PostgresRelay), they are also forwarded to every
+    other worker and replica, which deliver them to their own subscribers.
+    """
+
+    def __init__(self, max_queue=500):
+        self.max_queue = max_queue
+        self._instance = uuid.uuid4().hex
+        self.relay = None
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._listeners = []
+        self._next_id = 1
+
+        self.published = 0
+        self.relayed_in = 0
+        self.dropped = 0
+
+    @property
+    def origin(self):
+        """Identifies this process, so relayed copies of our own events are skipped"""
+        return f"{self._instance}:{os.getpid()}"
+
+    def subscribe(self) -> queue.Queue:
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        self.start_relay()
+        return subscriber
+
+    def start_relay(self):
+        """Start hearing other workers' events (no-op without a relay, or if already running)"""
+        if self.relay is not None:
+            self.relay.start()
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def add_listener(self, callback: Callable[[str, Dict[str, Any]], None]):
+        """Call `callback(event_type, data)` for every event seen by this process.
+
+        Listeners run synchronously on the publishing (or relay) thread, so they
+        must be cheap; they are meant for things like cache invalidation.
+        """
+        self._listeners.append(callback)
+
+    def dispatch(self, event_type: str, data: Dict[str, Any]):
+        """Deliver an event to the subscribers in this process only"""
+        for callback in self._listeners:
+            try:
+                callback(event_type, data)
+            except Exception as e:
+                print(f"Event listener error: {e}")
+
+        with self._lock:
+            event = {'id': self._next_id, 'type': event_type, 'data': data}
+            self._next_id += 1
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+                # Too far behind for deltas: replace the backlog with a resync
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait({'id': event['id'], 'type': 'resync', 'data': {}})
+
+    def relay_payload(self, event_type: str, data: Dict[str, Any]) -> str:
+        """NOTIFY payload that carries an event to the other workers"""
+        return json.dumps({'origin': self.origin, 'type': event_type, 'data': data})
+
+    def publish(self, event_type: str, data: Dict[str, Any], relay=True):
+        """Deliver locally and forward to other workers through the relay.
+
+        Pass relay=False when the caller sends relay_payload() itself (e.g. the
+        ASGI app, which notifies through its async driver).
+        """
+        self.published += 1
+        self.dispatch(event_type, data)
+        if relay and self.relay is not None:
+            try:
+                self.relay.notify(self.relay_payload(event_type, data))
+            except Exception as e:
+                print(f"Event relay notify failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {
+            'subscribers': subscribers,
+            'published': self.published,
+            'relayed_in': self.relayed_in,
+            'dropped': self.dropped,
+            'relay': self.relay.get_stats() if self.relay is not None else None,
+        }
+
+
+class PostgresRelay:
+    """Fans EventBus events out across processes with LISTEN/NOTIFY.
+
+    `listen_connect` opens a dedicated psycopg2 connection for LISTEN, and
+    `notify` sends one payload with pg_notify. The listener thread is started
+    lazily by the first subscriber, so workers with no open dashboards hold no
+    extra connection. After a reconnect, local subscribers get a "resync",
+    because notifications sent while disconnected are lost.
+    """
+
+    def __init__(self, bus: EventBus, listen_connect: Callable, notify: Callable[[str], None],
+                 channel='checkin_events'):
+        self.bus = bus
+        self.listen_connect = listen_connect
+        self._notify = notify
+        self.channel = channel
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.connected = False
+        self.reconnects = 0
+        self.notify_count = 0
+
+    def notify(self, payload: str):
+        self._notify(payload)
+        self.notify_count += 1
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='event-relay', daemon=True)
+            self._thread.start()
+
+    def _handle(self, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get('origin') == self.bus.origin:
+            return
+        self.bus.relayed_in += 1
+        self.bus.dispatch(message['type'], message.get('data', {}))
+
+    def _listen(self):
+        conn = self.listen_connect()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+            self.connected = True
+            if self.reconnects:
+                # Anything sent while we were disconnected is gone
+                self.bus.dispatch('resync', {})
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._handle(conn.notifies.pop(0).payload)
+        finally:
+            self.connected = False
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        delay = 1
+        while True:
+            started = time.monotonic()
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"Event relay listener error: {e}")
+            if time.monotonic() - started > 60:
+                delay = 1
+            self.reconnects += 1
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'channel': self.channel,
+            'connected': self.connected,
+            'reconnects': self.reconnects,
+            'notified': self.notify_count,
+        }
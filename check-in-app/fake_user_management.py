@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Local fake of the IBM Cloud User Management API for offline testing
+
+Serves GET /v2/accounts/<account_id>/users with generated users, paginated
+through next_url/_start like the real service, so the check-in app's crawler
+can be exercised and timed without an IBM Cloud account.
+
+Usage:
+    python fake_user_management.py [--users 5000] [--latency-ms 150] [--port 9090] [--opaque-tokens]
+
+Then run the app against it:
+    IBM_USER_MANAGEMENT_URL=http://localhost:9090 IBM_CLOUD_ACCOUNT_ID=demo python app.py
+"""
+
+import argparse
+import base64
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+def make_handler(total_users, latency, opaque_tokens):
+    def encode_start(offset):
+        if opaque_tokens:
+            return base64.urlsafe_b64encode(f"offset:{offset}".encode()).decode()
+        return str(offset)
+
+    def decode_start(token):
+        if not token:
+            return 0
+        if opaque_tokens:
+            return int(base64.urlsafe_b64decode(token.encode()).decode().split(':')[1])
+        return int(token)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip('/').split('/')
+            if len(parts) != 4 or parts[:2] != ['v2', 'accounts'] or parts[3] != 'users':
+                self.send_error(404)
+                return
+
+            account_id = parts[2]
+            query = parse_qs(url.query)
+            limit = min(int(query.get('limit', ['100'])[0]), 100)
+            offset = decode_start(query.get('_start', [None])[0])
+
+            time.sleep(latency)
+
+            resources = []
+            for i in range(offset, min(offset + limit, total_users)):
+                resources.append({
+                    'id': f'IBMid-{i:07d}',
+                    'user_id': f'user{i}@example.com',
+                    'email': f'user{i}@example.com',
+                    'first_name': 'User',
+                    'last_name': str(i),
+                    # Every tenth user is pending, like real invitations
+                    'state': 'PENDING' if i % 10 == 9 else 'ACTIVE',
+                    'account_id': account_id,
+                })
+
+            body = {
+                'total_results': len(resources),
+                'limit': limit,
+                'first_url': f'/v2/accounts/{account_id}/users?limit={limit}',
+                'resources': resources,
+            }
+            if offset + limit < total_users:
+                body['next_url'] = f'/v2/accounts/{account_id}/users?limit={limit}&_start={encode_start(offset + limit)}'
+
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake IBM Cloud User Management endpoint")
+    parser.add_argument('--users', type=int, default=5000, help='Number of users in the fake account')
+    parser.add_argument('--latency-ms', type=int, default=150, help='Delay added to every page request')
+    parser.add_argument('--port', type=int, default=9090)
+    parser.add_argument('--opaque-tokens', action='store_true',
+                        help='Use opaque _start tokens instead of numeric offsets')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port),
+                                 make_handler(args.users, args.latency_ms / 1000, args.opaque_tokens))
+    print(f"Fake User Management API on http://127.0.0.1:{args.port} ({args.users} users, {args.latency_ms}ms/page)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Group naming and VPC mapping shared by the Flask app and database.py"""
+
+# Every attendee gets the next check-in slot; slots fill groups in order
+GROUP_SIZE = 3
+MAX_GROUPS = 25
+GROUPS_PER_VPC = 5
+
+def get_group_letter_and_vpc(group_index):
+    """Convert group index (0-24) to letter (a-y) and VPC number (1-5)"""
+    if group_index < 0 or group_index >= MAX_GROUPS:
+        raise ValueError(f"Group index {group_index} out of range (0-{MAX_GROUPS - 1})")
+
+    # Convert to letter (a-y)
+    group_letter = chr(ord('a') + group_index)
+
+    # Calculate VPC (5 groups per VPC)
+    vpc_number = (group_index // GROUPS_PER_VPC) + 1
+
+    return group_letter, vpc_number
+
+def get_group_for_slot(slot, group_size=GROUP_SIZE):
+    """Map a check-in slot (0, 1, 2, ...) to its group name, letter and VPC.
+
+    This is a pure function of the slot, so concurrent check-ins that were
+    handed distinct slots can never disagree about group membership.
+    """
+    group_index = slot // group_size
+    if group_index >= MAX_GROUPS:
+        raise ValueError(f"Maximum number of groups ({MAX_GROUPS}) reached")
+
+    group_letter, vpc_number = get_group_letter_and_vpc(group_index)
+    return f"Group {group_letter.upper()}", group_letter.upper(), vpc_number
+
+def get_vpc_info_from_group_name(group_name):
+    """Extract VPC information from group name (supports both old numeric and new letter formats)"""
+    if not group_name or not group_name.startswith("Group "):
+        return None, None
+
+    try:
+        # Extract the part after "Group "
+        group_identifier = group_name.replace("Group ", "").strip()
+
+        # Check if it's a letter format (new system)
+        if len(group_identifier) == 1 and group_identifier.isalpha():
+            group_letter = group_identifier.lower()
+            group_index = ord(group_letter) - ord('a')
+
+            if group_index < 0 or group_index >= MAX_GROUPS:
+                return None, None
+
+            # Calculate VPC number
+            vpc_number = (group_index // GROUPS_PER_VPC) + 1
+            return group_letter.upper(), vpc_number
+
+        # Check if it's a numeric format (old system) - convert to letter
+        elif group_identifier.isdigit():
+            group_number = int(group_identifier)
+            # Convert group number to index (Group 1 = index 0, Group 2 = index 1, etc.)
+            group_index = group_number - 1
+
+            if group_index < 0 or group_index >= MAX_GROUPS:
+                return None, None
+
+            # Convert to letter
+            group_letter = chr(ord('a') + group_index).upper()
+            vpc_number = (group_index // GROUPS_PER_VPC) + 1
+
+            return group_letter, vpc_number
+
+        return None, None
+    except:
+        return None, None
+
+def normalize_group_name(value):
+    """Accept "Group A", "group a" or just "A" and return the canonical group name"""
+    value = (value or '').strip()
+    if value.lower().startswith('group '):
+        value = value[len('group '):].strip()
+    if len(value) == 1 and value.isalpha():
+        return f"Group {value.upper()}"
+    return f"Group {value}" if value else None
+
+def get_group_names_for_vpc(vpc_number):
+    """Names of the letter groups that share a VPC"""
+    first_index = (vpc_number - 1) * GROUPS_PER_VPC
+    if vpc_number < 1 or first_index >= MAX_GROUPS:
+        return []
+    return [f"Group {chr(ord('A') + index)}"
+            for index in range(first_index, min(first_index + GROUPS_PER_VPC, MAX_GROUPS))]
+
+def plan_letter_migration(group_counts):
+    """Plan renaming numeric groups ("Group 1") to letter groups ("Group A").
+
+    `group_counts` holds (group name, member count) for every group. Returns
+    the renames and the numeric groups that have to be left alone, because
+    their number is out of range or their letter name is already taken.
+    """
+    taken = {name for name, _ in group_counts}
+    renames, skipped = [], []
+    for name, users_count in sorted(group_counts, key=lambda row: row[0]):
+        identifier = name[len("Group "):].strip() if name.startswith("Group ") else ''
+        if not identifier.isdigit():
+            continue
+
+        group_letter, vpc_number = get_vpc_info_from_group_name(name)
+        if not group_letter:
+            skipped.append({"old_name": name, "reason": f"Group number out of range (1-{MAX_GROUPS})"})
+            continue
+        new_name = f"Group {group_letter}"
+        if new_name in taken:
+            skipped.append({"old_name": name, "reason": f"{new_name} already exists"})
+            continue
+
+        taken.add(new_name)
+        renames.append({
+            "old_name": name,
+            "new_name": new_name,
+            "group_letter": group_letter,
+            "vpc_number": vpc_number,
+            "users_count": users_count
+        })
+    return renames, skipped
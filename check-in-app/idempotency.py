@@ -0,0 +1,197 @@
+"""Replay stored responses for retried check-in submissions
+
+Clients send an `Idempotency-Key` header with each check-in attempt and
+reuse it when they retry. The first completed response for a (key, email)
+pair is kept in memory for a few minutes and, through the `load`/`save`
+callbacks, in the database so other workers can replay it too. Concurrent
+submissions of the same pair wait for the one already running instead of
+repeating it. AsyncIdempotencyCache does the same for the ASGI app.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Longest accepted Idempotency-Key header
+MAX_KEY_LENGTH = 255
+
+StoredResponse = Tuple[int, str]
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[StoredResponse] = None
+
+
+class IdempotencyCache:
+    """Stored (status, body) per (key, email), with in-flight collapsing.
+
+    `load(key, email)` returns a stored (status, body) or None, and
+    `save(key, email, status, body)` stores one; either may be None to keep
+    responses in memory only. Only responses for which `should_store(status)`
+    is true are kept (2xx by default), so rejections and failures can be
+    retried for real: an attendee added to the account after a 403 is not
+    stuck with it. At most `max_entries` responses are held in memory; the
+    oldest are evicted first.
+    """
+
+    def __init__(self, load: Optional[Callable[[str, str], Optional[StoredResponse]]] = None,
+                 save: Optional[Callable[[str, str, int, str], None]] = None,
+                 ttl=300.0, wait_timeout=30.0, max_entries=10000,
+                 should_store: Callable[[int], bool] = lambda status: 200 <= status < 300):
+        self._load = load
+        self._save = save
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.max_entries = max_entries
+        self._should_store = should_store
+        self._lock = threading.Lock()
+        # Insertion order is expiry order, since every entry gets the same ttl
+        self._responses: OrderedDict[Tuple[str, str], Tuple[StoredResponse, float]] = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], _InFlight] = {}
+
+        self.executed = 0
+        self.memory_hits = 0
+        self.database_hits = 0
+        self.collapsed = 0
+
+    def _remember_locked(self, pair, response: StoredResponse):
+        now = time.monotonic()
+        self._responses[pair] = (response, now + self.ttl)
+        self._responses.move_to_end(pair)
+        # Drop expired entries from the old end, then the oldest beyond max_entries
+        while self._responses:
+            _, expires_at = next(iter(self._responses.values()))
+            if expires_at > now and len(self._responses) <= self.max_entries:
+                break
+            self._responses.popitem(last=False)
+
+    def run(self, key: str, email: str, operation: Callable[[], StoredResponse]) -> Tuple[StoredResponse, bool]:
+        """Return (response, replayed), running `operation()` only for a new (key, email)"""
+        pair = (key, email)
+        with self._lock:
+            stored = self._responses.get(pair)
+            if stored and stored[1] > time.monotonic():
+                self.memory_hits += 1
+                return stored[0], True
+            in_flight = self._in_flight.get(pair)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[pair] = _InFlight()
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            if in_flight.done.wait(self.wait_timeout) and in_flight.response is not None:
+                return in_flight.response, True
+            # The first attempt failed or is stuck; this one runs on its own
+            return operation(), False
+
+        try:
+            response = self._load(key, email) if self._load else None
+            if response is not None:
+                self.database_hits += 1
+                replayed = True
+            else:
+                response = operation()
+                self.executed += 1
+                replayed = False
+                if self._should_store(response[0]) and self._save:
+                    try:
+                        self._save(key, email, response[0], response[1])
+                    except Exception as e:
+                        # The response is still good; only cross-worker replay is lost
+                        print(f"Failed to store idempotent response: {e}")
+
+            in_flight.response = response
+            if self._should_store(response[0]):
+                with self._lock:
+                    self._remember_locked(pair, response)
+            return response, replayed
+        finally:
+            with self._lock:
+                self._in_flight.pop(pair, None)
+            in_flight.done.set()
+
+    def clear(self):
+        """Forget every stored response (after a reset)"""
+        with self._lock:
+            self._responses.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stored = len(self._responses)
+            in_flight = len(self._in_flight)
+        return {
+            'ttl_seconds': self.ttl,
+            'stored': stored,
+            'in_flight': in_flight,
+            'executed': self.executed,
+            'memory_hits': self.memory_hits,
+            'database_hits': self.database_hits,
+            'collapsed': self.collapsed,
+        }
+
+
+class AsyncIdempotencyCache(IdempotencyCache):
+    """IdempotencyCache for coroutine `load`, `save` and operations, shared by the tasks of one event loop.
+
+    Stored responses sit behind the same lock as in IdempotencyCache, so
+    clear() may still be called from event listeners on other threads.
+    """
+
+    async def run(self, key: str, email: str,
+                  operation: Callable[[], Awaitable[StoredResponse]]) -> Tuple[StoredResponse, bool]:
+        """Return (response, replayed), awaiting `operation()` only for a new (key, email)"""
+        pair = (key, email)
+        with self._lock:
+            stored = self._responses.get(pair)
+            if stored and stored[1] > time.monotonic():
+                self.memory_hits += 1
+                return stored[0], True
+            in_flight = self._in_flight.get(pair)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[pair] = asyncio.get_running_loop().create_future()
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            try:
+                response = await asyncio.wait_for(asyncio.shield(in_flight), self.wait_timeout)
+            except asyncio.TimeoutError:
+                response = None
+            if response is not None:
+                return response, True
+            # The first attempt failed or is stuck; this one runs on its own
+            return await operation(), False
+
+        response = None
+        try:
+            response = await self._load(key, email) if self._load else None
+            if response is not None:
+                self.database_hits += 1
+                replayed = True
+            else:
+                response = await operation()
+                self.executed += 1
+                replayed = False
+                if self._should_store(response[0]) and self._save:
+                    try:
+                        await self._save(key, email, response[0], response[1])
+                    except Exception as e:
+                        # The response is still good; only cross-worker replay is lost
+                        print(f"Failed to store idempotent response: {e}")
+
+            if self._should_store(response[0]):
+                with self._lock:
+                    self._remember_locked(pair, response)
+            return response, replayed
+        finally:
+            with self._lock:
+                self._in_flight.pop(pair, None)
+            if not in_flight.done():
+                in_flight.set_result(response)
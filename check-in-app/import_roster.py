@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Bulk Attendee Import: Pre-register an event roster from CSV
+
+Loads a CSV with an `email` column and an optional `group` column (A-Y, or
+"Group A") into the configured database. Rows without a group are assigned
+check-in slots after the highest pre-assigned group. Emails are validated in
+bulk against the IBM Cloud user directory.
+
+Usage:
+    python import_roster.py roster.csv [--allow-unvalidated] [--event EVENT_ID]
+
+Options:
+    --allow-unvalidated    Import emails missing from the IBM Cloud account as unvalidated
+                           instead of rejecting them
+    --event EVENT_ID       Event to import into (default: CHECKIN_DEFAULT_EVENT)
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# Add the app directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import DEFAULT_EVENT, app, get_ibm_cloud_user_directory, get_known_event, import_roster
+from lab_events import normalize_event_id
+from user_directory import DirectoryWarmingUp
+
+def wait_for_directory():
+    """Block until the first user directory crawl finishes, so rows are validated for real"""
+    while True:
+        try:
+            get_ibm_cloud_user_directory()
+            return
+        except DirectoryWarmingUp:
+            print("⏳ Waiting for the IBM Cloud user directory to load...")
+            time.sleep(5)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-register attendees from a roster CSV")
+    parser.add_argument('csv_file', help="Roster CSV with 'email' and optional 'group' columns ('-' for stdin)")
+    parser.add_argument('--allow-unvalidated', action='store_true',
+                        help='Import emails not found in the IBM Cloud account instead of rejecting them')
+    parser.add_argument('--event', default=DEFAULT_EVENT,
+                        help=f'Event to import into (default: {DEFAULT_EVENT})')
+
+    args = parser.parse_args()
+
+    try:
+        with app.app_context():
+            event_id = get_known_event(normalize_event_id(args.event))
+            wait_for_directory()
+            print(f"📥 Importing roster from {args.csv_file} into event '{event_id}'")
+            if args.csv_file == '-':
+                report = import_roster(sys.stdin, require_validated=not args.allow_unvalidated, event_id=event_id)
+            else:
+                with open(args.csv_file, newline='', encoding='utf-8-sig') as roster:
+                    report = import_roster(roster, require_validated=not args.allow_unvalidated, event_id=event_id)
+
+        print()
+        print(f"✅ Imported: {report['imported']} of {report['rows']} rows")
+        print(f"📊 Already registered: {report['already_registered']}, duplicates: {report['duplicates']}")
+        print(f"📊 Auto-assigned groups: {report['auto_assigned']}, groups touched: {len(report['groups_touched'])}")
+        print(f"⚠️  Rejected (not in IBM Cloud account): {report['rejected_unvalidated']}, invalid rows: {report['invalid']}")
+        for error in report['errors']:
+            print(f"  line {error['line']}: {error['email']} - {error['error']}")
+        print(f"⏱️  {report['duration_ms']}ms ({report['rows_per_second']} rows/s)")
+
+    except KeyboardInterrupt:
+        print("\n❌ Import interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n💥 Import failed with error: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Events: the lab sessions that share one check-in database
+
+Users, groups, check-in slots, archives and stored idempotent responses
+carry an event id. Every event numbers its own groups from Group A, so the
+group cap applies per event, and a reset only empties its own event.
+Requests name their event with the `event` query parameter.
+"""
+
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_EVENT_ID = 'default'
+
+# Lowercase letters, digits and hyphens, so an id maps to a plain sequence name
+EVENT_ID_PATTERN = re.compile(r'^[a-z0-9][a-z0-9-]{0,39}$')
+
+
+class InvalidEventId(ValueError):
+    """Raised for an event id that does not match EVENT_ID_PATTERN"""
+
+
+class UnknownEvent(LookupError):
+    """Raised when a request names an event that has not been created"""
+
+
+def normalize_event_id(value: Optional[str], default: str = DEFAULT_EVENT_ID) -> str:
+    """Lowercased event id, or `default` when none is given; raises InvalidEventId"""
+    event_id = (value or '').strip().lower() or default
+    if not EVENT_ID_PATTERN.match(event_id):
+        raise InvalidEventId(f"Invalid event id '{event_id}' "
+                             "(1-40 lowercase letters, digits and hyphens)")
+    return event_id
+
+
+def slot_sequence_name(event_id: str) -> str:
+    """PostgreSQL sequence handing out an event's check-in slots.
+
+    The default event keeps the original checkin_slot_seq. Ids never contain
+    underscores, so replacing hyphens cannot make two events share a name.
+    """
+    if event_id == DEFAULT_EVENT_ID:
+        return 'checkin_slot_seq'
+    return 'checkin_slot_seq_' + event_id.replace('-', '_')
+
+
+def event_of(event_type: str, data: Dict[str, Any]) -> Optional[str]:
+    """Event a bus event concerns, or None for a resync, which concerns them all.
+
+    Events relayed by workers from before events existed carry no event id;
+    they belong to the default event.
+    """
+    if event_type == 'resync':
+        return None
+    return data.get('event_id') or DEFAULT_EVENT_ID
+
+
+class EventPartitions:
+    """One object per event (a cache, slot allocator, ...), created on first use"""
+
+    def __init__(self, factory: Callable[[str], Any]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._partitions = {}
+
+    def get(self, event_id: str):
+        with self._lock:
+            partition = self._partitions.get(event_id)
+            if partition is None:
+                partition = self._partitions[event_id] = self._factory(event_id)
+            return partition
+
+    def existing(self, event_id: Optional[str] = None) -> List[Any]:
+        """The partition of one event if it was created, or every partition when no event is given"""
+        with self._lock:
+            if event_id is None:
+                return list(self._partitions.values())
+            partition = self._partitions.get(event_id)
+            return [partition] if partition is not None else []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """get_stats() of every partition, with counters summed across events"""
+        with self._lock:
+            partitions = list(self._partitions.values())
+        totals = {'events': len(partitions)}
+        for partition in partitions:
+            for name, value in partition.get_stats().items():
+                if name.endswith('_seconds') or not isinstance(value, (int, float)):
+                    totals[name] = value
+                else:
+                    totals[name] = totals.get(name, 0) + value
+        return totals
@@ -6,10 +6,11 @@ This script migrates existing groups from numeric format (Group 1, Group 2)
 to letter format (Group A, Group B) with VPC mapping.
 
 Usage:
-    python migrate_groups.py [--dry-run]
+    python migrate_groups.py [--dry-run] [--event EVENT_ID]
     
 Options:
     --dry-run    Show what would be changed without making actual changes
+    --event      Event whose groups to migrate (default: CHECKIN_DEFAULT_EVENT)
 """
 
 import os
@@ -20,66 +21,37 @@ from datetime import datetime
 # Add the app directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db, User, Group, get_vpc_info_from_group_name
+from app import DEFAULT_EVENT, app, get_known_event, plan_group_migration, apply_group_migration
+from lab_events import normalize_event_id
 
-def migrate_numeric_groups_to_letters(dry_run=False):
-    """Migrate numeric groups to letter-based groups"""
+def migrate_numeric_groups_to_letters(dry_run=False, event_id=DEFAULT_EVENT):
+    """Migrate an event's numeric groups to letter-based groups"""
     
     with app.app_context():
-        print(f"🔄 Starting group migration {'(DRY RUN)' if dry_run else ''}")
+        event_id = get_known_event(normalize_event_id(event_id))
+        print(f"🔄 Starting group migration for event '{event_id}' {'(DRY RUN)' if dry_run else ''}")
         print(f"⏰ Timestamp: {datetime.now().isoformat()}")
         print("-" * 60)
         
         try:
-            # Find all numeric groups
-            all_groups = Group.query.all()
-            numeric_groups = []
+            # Plan from one aggregate query over groups and their member counts
+            migration_plan, skipped = plan_group_migration(event_id)
             
-            for group in all_groups:
-                group_identifier = group.name.replace("Group ", "").strip()
-                if group_identifier.isdigit():
-                    numeric_groups.append(group)
+            for step in skipped:
+                print(f"⚠️  Warning: {step['old_name']} not migrated: {step['reason']}")
             
-            if not numeric_groups:
+            if not migration_plan:
                 print("✅ No numeric groups found - migration not needed")
                 return
             
-            print(f"📊 Found {len(numeric_groups)} numeric groups to migrate")
-            print(f"📊 Total groups in database: {len(all_groups)}")
+            print(f"📊 Found {len(migration_plan)} numeric groups to migrate")
             print()
             
-            migration_plan = []
-            
-            # Plan the migration
-            for group in numeric_groups:
-                group_identifier = group.name.replace("Group ", "").strip()
-                group_number = int(group_identifier)
-                group_index = group_number - 1  # Group 1 = index 0
-                
-                if 0 <= group_index < 25:
-                    new_letter = chr(ord('a') + group_index).upper()
-                    new_name = f"Group {new_letter}"
-                    vpc_number = (group_index // 5) + 1
-                    
-                    # Count users in this group
-                    users_count = User.query.filter_by(group_name=group.name).count()
-                    
-                    migration_plan.append({
-                        'group': group,
-                        'old_name': group.name,
-                        'new_name': new_name,
-                        'letter': new_letter,
-                        'vpc': vpc_number,
-                        'users_count': users_count
-                    })
-                else:
-                    print(f"⚠️  Warning: Group {group.name} index {group_index} out of range (0-24)")
-            
             # Display migration plan
             print("📋 Migration Plan:")
             print("-" * 60)
             for plan in migration_plan:
-                print(f"  {plan['old_name']} → {plan['new_name']} (Letter: {plan['letter']}, VPC: {plan['vpc']}, Users: {plan['users_count']})")
+                print(f"  {plan['old_name']} → {plan['new_name']} (Letter: {plan['group_letter']}, VPC: {plan['vpc_number']}, Users: {plan['users_count']})")
             
             print()
             
@@ -100,53 +72,25 @@ def migrate_numeric_groups_to_letters(dry_run=False):
                 print("❌ Migration cancelled")
                 return
             
-            # Perform the migration
+            # Perform the migration: one UPDATE for groups and one for users, in one transaction
             print("🚀 Applying migration...")
-            migration_results = []
-            
-            for plan in migration_plan:
-                group = plan['group']
-                old_name = plan['old_name']
-                new_name = plan['new_name']
-                
-                # Update group name
-                group.name = new_name
-                
-                # Update all users in this group
-                users_updated = User.query.filter_by(group_name=old_name).update(
-                    {'group_name': new_name}
-                )
-                
-                migration_results.append({
-                    'old_name': old_name,
-                    'new_name': new_name,
-                    'letter': plan['letter'],
-                    'vpc': plan['vpc'],
-                    'users_updated': users_updated
-                })
-                
-                print(f"  ✅ {old_name} → {new_name} ({users_updated} users updated)")
-            
-            # Commit changes
-            db.session.commit()
+            result = apply_group_migration(migration_plan, event_id)
             
             print()
             print("🎉 Migration completed successfully!")
-            print(f"📊 Total groups migrated: {len(migration_results)}")
-            print(f"📊 Total users updated: {sum(r['users_updated'] for r in migration_results)}")
+            print(f"📊 Total groups migrated: {result['groups_renamed']}")
+            print(f"📊 Total users updated: {result['users_updated']}")
             
             # Display final VPC mapping
             print()
             print("🗺️  Final VPC Group Mapping:")
             print("-" * 30)
             for vpc in range(1, 6):
-                vpc_groups = [r for r in migration_results if r['vpc'] == vpc]
-                if vpc_groups:
-                    letters = [r['letter'] for r in vpc_groups]
+                letters = [plan['group_letter'] for plan in migration_plan if plan['vpc_number'] == vpc]
+                if letters:
                     print(f"  VPC {vpc}: Groups {', '.join(letters)}")
             
         except Exception as e:
-            db.session.rollback()
             print(f"❌ Migration failed: {e}")
             raise
 
@@ -154,11 +98,13 @@ def main():
     parser = argparse.ArgumentParser(description="Migrate numeric groups to letter groups")
     parser.add_argument('--dry-run', action='store_true', 
                        help='Show what would be changed without making actual changes')
+    parser.add_argument('--event', default=DEFAULT_EVENT,
+                       help=f'Event whose groups to migrate (default: {DEFAULT_EVENT})')
     
     args = parser.parse_args()
     
     try:
-        migrate_numeric_groups_to_letters(dry_run=args.dry_run)
+        migrate_numeric_groups_to_letters(dry_run=args.dry_run, event_id=args.event)
     except KeyboardInterrupt:
         print("\n❌ Migration interrupted by user")
         sys.exit(1)
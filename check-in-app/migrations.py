@@ -0,0 +1,325 @@
+"""Versioned schema migrations shared by the SQLAlchemy and Code Engine backends
+
+Each migration is a numbered step written against a SchemaContext, which
+supplies the dialect, the (quoted) table names of the calling backend and a
+way to run SQL. Applied versions are recorded in `schema_migrations`, so a
+startup against a current schema costs two small queries and no DDL.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from lab_events import DEFAULT_EVENT_ID
+
+# Arbitrary key for pg_advisory_xact_lock, so concurrent workers migrate one at a time
+MIGRATION_LOCK_KEY = 7242001
+
+
+class SchemaContext:
+    """What a migration step needs to know about the backend it runs on.
+
+    `execute(sql, params)` runs one statement and returns its rows (or None
+    for statements without results). `users` and `groups` are the table names
+    used by the backend: the SQLAlchemy models map to "user" and "group",
+    while database.py uses "users" and "groups".
+    """
+
+    def __init__(self, dialect: str, execute: Callable[[str, Optional[Sequence[Any]]], Optional[List[tuple]]],
+                 users='users', groups='groups', param='%s'):
+        self.dialect = dialect
+        self._execute = execute
+        self.users_name = users
+        self.groups_name = groups
+        self.users = f'"{users}"'
+        self.groups = f'"{groups}"'
+        self.param = param
+
+    @property
+    def is_postgresql(self):
+        return self.dialect == 'postgresql'
+
+    def execute(self, sql: str, params: Optional[Sequence[Any]] = None):
+        return self._execute(sql, params)
+
+    def scalar(self, sql: str, params: Optional[Sequence[Any]] = None):
+        rows = self.execute(sql, params)
+        return rows[0][0] if rows else None
+
+
+def create_checkin_tables(ctx: SchemaContext):
+    """Users, groups, the shared directory snapshot and the slot counter"""
+    primary_key = 'SERIAL PRIMARY KEY' if ctx.is_postgresql else 'INTEGER PRIMARY KEY'
+
+    ctx.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ctx.users} (
+            id {primary_key},
+            email VARCHAR(255) UNIQUE NOT NULL,
+            group_name VARCHAR(100),
+            checked_in_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_validated BOOLEAN DEFAULT FALSE
+        )
+    """)
+    ctx.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ctx.groups} (
+            id {primary_key},
+            name VARCHAR(100) UNIQUE NOT NULL,
+            max_members INTEGER DEFAULT 3,
+            current_members INTEGER DEFAULT 0,
+            is_full BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Shared IBM Cloud user directory snapshot (one row)
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS user_directory_snapshot (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            users TEXT NOT NULL DEFAULT '[]',
+            refreshed_at FLOAT,
+            lease_owner VARCHAR(255),
+            lease_until FLOAT
+        )
+    """)
+    ctx.execute("INSERT INTO user_directory_snapshot (id) VALUES (1) ON CONFLICT (id) DO NOTHING")
+
+    # Check-in slots for group assignment: a sequence on PostgreSQL, an
+    # AUTOINCREMENT table on SQLite
+    if ctx.is_postgresql:
+        ctx.execute("CREATE SEQUENCE IF NOT EXISTS checkin_slot_seq MINVALUE 0 START WITH 0")
+    else:
+        ctx.execute("CREATE TABLE IF NOT EXISTS group_slots (id INTEGER PRIMARY KEY AUTOINCREMENT)")
+
+
+def add_lookup_indexes(ctx: SchemaContext):
+    """Index the columns that lookups, removals, migrations and pagination filter on"""
+    ctx.execute(f"CREATE INDEX IF NOT EXISTS ix_{ctx.users_name}_group_name ON {ctx.users} (group_name)")
+    ctx.execute(f"CREATE INDEX IF NOT EXISTS ix_{ctx.users_name}_checked_in_at_id ON {ctx.users} (checked_in_at, id)")
+    # Only groups that still have room, which is what an available-group scan wants
+    ctx.execute(f"""
+        CREATE INDEX IF NOT EXISTS ix_{ctx.groups_name}_available
+        ON {ctx.groups} (created_at) WHERE NOT is_full
+    """)
+
+
+def create_archive_tables(ctx: SchemaContext):
+    """Snapshots of a session's users and groups, written before a reset"""
+    primary_key = 'SERIAL PRIMARY KEY' if ctx.is_postgresql else 'INTEGER PRIMARY KEY'
+
+    ctx.execute(f"""
+        CREATE TABLE IF NOT EXISTS checkin_archives (
+            id {primary_key},
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            users_count INTEGER NOT NULL DEFAULT 0,
+            groups_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS archived_users (
+            archive_id INTEGER NOT NULL REFERENCES checkin_archives (id),
+            email VARCHAR(255) NOT NULL,
+            group_name VARCHAR(100),
+            checked_in_at TIMESTAMP,
+            is_validated BOOLEAN
+        )
+    """)
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS archived_groups (
+            archive_id INTEGER NOT NULL REFERENCES checkin_archives (id),
+            name VARCHAR(100) NOT NULL,
+            max_members INTEGER,
+            current_members INTEGER,
+            is_full BOOLEAN,
+            created_at TIMESTAMP
+        )
+    """)
+    ctx.execute("CREATE INDEX IF NOT EXISTS ix_archived_users_archive_id ON archived_users (archive_id)")
+    ctx.execute("CREATE INDEX IF NOT EXISTS ix_archived_groups_archive_id ON archived_groups (archive_id)")
+
+
+def create_idempotency_table(ctx: SchemaContext):
+    """Stored check-in responses, replayed for retried submissions with the same key"""
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            idempotency_key VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            status_code INTEGER NOT NULL,
+            response TEXT NOT NULL,
+            created_at FLOAT NOT NULL,
+            PRIMARY KEY (idempotency_key, email)
+        )
+    """)
+
+
+def _drop_unique_constraints(ctx: SchemaContext, table: str, column: str):
+    """Drop the single-column UNIQUE constraints on a PostgreSQL table column"""
+    rows = ctx.execute(f"""
+        SELECT con.conname FROM pg_constraint con
+        JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = con.conkey[1]
+        WHERE con.conrelid = {ctx.param}::regclass AND con.contype = 'u'
+          AND array_length(con.conkey, 1) = 1 AND att.attname = {ctx.param}
+    """, (table, column))
+    for (name,) in rows:
+        ctx.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+
+
+def _rebuild_sqlite_table(ctx: SchemaContext, table: str, table_name: str, columns: str, definition: str):
+    """Recreate a SQLite table with a new definition, keeping its rows (SQLite cannot drop a UNIQUE constraint)"""
+    rebuilt = f'"{table_name}_rebuilt"'
+    ctx.execute(f"CREATE TABLE {rebuilt} ({definition})")
+    ctx.execute(f"INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table}")
+    ctx.execute(f"DROP TABLE {table}")
+    ctx.execute(f"ALTER TABLE {rebuilt} RENAME TO {table}")
+
+
+def partition_by_event(ctx: SchemaContext):
+    """Events table, event_id columns and per-event unique keys, indexes and slots.
+
+    Existing rows belong to the default event. Emails and group names become
+    unique per event, and every index the check-in, lookup, listing and reset
+    paths use leads with event_id, so one event's queries never scan another's
+    rows.
+    """
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id VARCHAR(40) PRIMARY KEY,
+            name VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    ctx.execute(f"INSERT INTO events (id, name) VALUES ({ctx.param}, {ctx.param}) ON CONFLICT (id) DO NOTHING",
+                (DEFAULT_EVENT_ID, 'Default event'))
+
+    event_column = f"event_id VARCHAR(40) NOT NULL DEFAULT '{DEFAULT_EVENT_ID}'"
+    ctx.execute(f"ALTER TABLE checkin_archives ADD COLUMN {event_column}")
+
+    if ctx.is_postgresql:
+        # A constant default makes ADD COLUMN a catalog-only change
+        for table, column in ((ctx.users, 'email'), (ctx.groups, 'name')):
+            ctx.execute(f"ALTER TABLE {table} ADD COLUMN {event_column}")
+            _drop_unique_constraints(ctx, table, column)
+        ctx.execute(f'ALTER TABLE {ctx.users} ADD CONSTRAINT "{ctx.users_name}_event_id_email_key" '
+                    f"UNIQUE (event_id, email)")
+        ctx.execute(f'ALTER TABLE {ctx.groups} ADD CONSTRAINT "{ctx.groups_name}_event_id_name_key" '
+                    f"UNIQUE (event_id, name)")
+        ctx.execute(f"DROP INDEX IF EXISTS ix_{ctx.users_name}_group_name")
+        ctx.execute(f"DROP INDEX IF EXISTS ix_{ctx.users_name}_checked_in_at_id")
+        ctx.execute(f"DROP INDEX IF EXISTS ix_{ctx.groups_name}_available")
+        # A key replays per event; leading with event_id also serves a reset's DELETE
+        ctx.execute(f"ALTER TABLE idempotency_keys ADD COLUMN {event_column}")
+        ctx.execute("ALTER TABLE idempotency_keys DROP CONSTRAINT idempotency_keys_pkey, "
+                    "ADD PRIMARY KEY (event_id, idempotency_key, email)")
+    else:
+        # Dropping the old tables also drops their indexes
+        _rebuild_sqlite_table(ctx, ctx.users, ctx.users_name, 'id, email, group_name, checked_in_at, is_validated', f"""
+            id INTEGER PRIMARY KEY,
+            email VARCHAR(255) NOT NULL,
+            group_name VARCHAR(100),
+            checked_in_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_validated BOOLEAN DEFAULT FALSE,
+            {event_column},
+            UNIQUE (event_id, email)
+        """)
+        _rebuild_sqlite_table(ctx, ctx.groups, ctx.groups_name,
+                              'id, name, max_members, current_members, is_full, created_at', f"""
+            id INTEGER PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            max_members INTEGER DEFAULT 3,
+            current_members INTEGER DEFAULT 0,
+            is_full BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            {event_column},
+            UNIQUE (event_id, name)
+        """)
+        _rebuild_sqlite_table(ctx, 'idempotency_keys', 'idempotency_keys',
+                              'idempotency_key, email, status_code, response, created_at', f"""
+            idempotency_key VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            status_code INTEGER NOT NULL,
+            response TEXT NOT NULL,
+            created_at FLOAT NOT NULL,
+            {event_column},
+            PRIMARY KEY (event_id, idempotency_key, email)
+        """)
+
+        # Slots become (event, slot) rows; only the highest slot taken so far matters
+        ctx.execute("""
+            CREATE TABLE event_slots (
+                event_id VARCHAR(40) NOT NULL,
+                slot INTEGER NOT NULL,
+                PRIMARY KEY (event_id, slot)
+            )
+        """)
+        ctx.execute(f"""
+            INSERT INTO event_slots (event_id, slot)
+            SELECT {ctx.param}, MAX(id) - 1 FROM group_slots HAVING MAX(id) IS NOT NULL
+        """, (DEFAULT_EVENT_ID,))
+        ctx.execute("DROP TABLE group_slots")
+
+    ctx.execute(f"CREATE INDEX ix_{ctx.users_name}_event_group_name ON {ctx.users} (event_id, group_name)")
+    ctx.execute(f"""
+        CREATE INDEX ix_{ctx.users_name}_event_checked_in_at_id ON {ctx.users} (event_id, checked_in_at, id)
+    """)
+    ctx.execute(f"""
+        CREATE INDEX ix_{ctx.groups_name}_event_available
+        ON {ctx.groups} (event_id, created_at) WHERE NOT is_full
+    """)
+
+
+MIGRATIONS = [
+    (1, "Create check-in tables", create_checkin_tables),
+    (2, "Add group_name, check-in order and available-group indexes", add_lookup_indexes),
+    (3, "Add session archive tables", create_archive_tables),
+    (4, "Add idempotency key table", create_idempotency_table),
+    (5, "Partition users, groups and check-in slots by event", partition_by_event),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(ctx: SchemaContext) -> int:
+    """Highest applied migration, or 0 on a database that has never been migrated"""
+    if ctx.is_postgresql:
+        exists = ctx.scalar("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    else:
+        exists = ctx.scalar("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'")
+    if not exists:
+        return 0
+    return ctx.scalar("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+
+
+def migrate(ctx: SchemaContext) -> Dict[str, Any]:
+    """Apply pending migrations in order. The caller commits.
+
+    On PostgreSQL the whole run, DDL included, is one transaction guarded by
+    an advisory lock, so workers starting together apply each step once.
+    """
+    current = get_schema_version(ctx)
+    if current >= SCHEMA_VERSION:
+        return {'from_version': current, 'to_version': current, 'applied': []}
+
+    if ctx.is_postgresql:
+        ctx.execute(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_KEY})")
+        # Another worker may have finished while we waited for the lock
+        current = get_schema_version(ctx)
+
+    ctx.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"Applying schema migration {version}: {description}")
+        step(ctx)
+        ctx.execute(
+            f"INSERT INTO schema_migrations (version, description) VALUES ({ctx.param}, {ctx.param})",
+            (version, description)
+        )
+        applied.append(version)
+
+    return {'from_version': current, 'to_version': SCHEMA_VERSION, 'applied': applied}
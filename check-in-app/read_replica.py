@@ -0,0 +1,140 @@
+"""Routing of read-only queries to a PostgreSQL read replica"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+def parse_lsn(position: Optional[str]) -> Optional[int]:
+    """PostgreSQL LSN text ('16/B374D848') as a comparable integer"""
+    if not position:
+        return None
+    high, _, low = position.partition('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReplicaRouter:
+    """Sends read-only repository calls to a replica, falling back to the primary.
+
+    The replica's replay position and lag are checked at most every
+    `check_interval` seconds. While it lags more than `max_lag` seconds, or
+    after a failed query until the next check, reads go to the primary.
+
+    Read-your-writes: a caller that passes `min_position` (the primary's WAL
+    position after its write, from the primary's get_write_position()) is
+    served by the replica only once the replica has replayed that far;
+    otherwise the read goes to the primary. Without a replica every read
+    goes to the primary.
+    """
+
+    def __init__(self, primary, replica=None, max_lag=5.0, check_interval=1.0):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._status = None
+        self._checked_at = None
+
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.lagging = 0
+        self.behind_writes = 0
+        self.fallbacks = 0
+
+    def _check(self) -> Optional[Dict[str, Any]]:
+        """Query the replica's replay position now; None if it cannot be reached"""
+        try:
+            status = self.replica.get_replication_status()
+            status['position'] = parse_lsn(status['position'])
+        except Exception as e:
+            print(f"Read replica status check failed: {e}")
+            status = None
+        with self._lock:
+            self._status = status
+            self._checked_at = time.monotonic()
+        return status
+
+    def _get_status(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._status
+        return self._check()
+
+    def _use_replica(self, min_position: Optional[str]) -> bool:
+        if self.replica is None:
+            return False
+        status = self._get_status()
+        if status is None:
+            return False
+        if status['lag_seconds'] > self.max_lag:
+            with self._lock:
+                self.lagging += 1
+            return False
+
+        needed = parse_lsn(min_position)
+        if needed is not None and (status['position'] is None or status['position'] < needed):
+            # The cached position may be old; look again before giving up on the replica
+            status = self._check()
+            if status is None or status['position'] is None or status['position'] < needed:
+                with self._lock:
+                    self.behind_writes += 1
+                return False
+        return True
+
+    def _replica_failed(self, error):
+        print(f"Read replica query failed, using the primary: {error}")
+        with self._lock:
+            self._status = None
+            self._checked_at = time.monotonic()
+            self.fallbacks += 1
+
+    def run(self, read: Callable[[Any], Any], min_position: Optional[str] = None):
+        """Call read(repository) on the replica when it is fresh enough, else on the primary"""
+        if self._use_replica(min_position):
+            try:
+                result = read(self.replica)
+                with self._lock:
+                    self.replica_reads += 1
+                return result
+            except Exception as e:
+                self._replica_failed(e)
+
+        with self._lock:
+            self.primary_reads += 1
+        return read(self.primary)
+
+    def iterate(self, read: Callable[[Any], Any], min_position: Optional[str] = None):
+        """Like run() for a generator; falls back only if the replica fails before the first row"""
+        if self._use_replica(min_position):
+            rows = read(self.replica)
+            try:
+                first = next(rows, None)
+            except Exception as e:
+                self._replica_failed(e)
+            else:
+                with self._lock:
+                    self.replica_reads += 1
+                if first is not None:
+                    yield first
+                    yield from rows
+                return
+
+        with self._lock:
+            self.primary_reads += 1
+        yield from read(self.primary)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            status = self._status
+            return {
+                'configured': self.replica is not None,
+                'max_lag_seconds': self.max_lag,
+                'lag_seconds': round(status['lag_seconds'], 3) if status else None,
+                'reachable': None if self._checked_at is None else status is not None,
+                'replica_reads': self.replica_reads,
+                'primary_reads': self.primary_reads,
+                'skipped_lagging': self.lagging,
+                'skipped_behind_writes': self.behind_writes,
+                'fallbacks': self.fallbacks,
+            }
@@ -0,0 +1,907 @@
+"""Storage interface for the check-in app and its SQLAlchemy Core implementation
+
+Every route talks to a CheckinRepository. There are two implementations:
+
+- DatabaseOperations (database.py): raw psycopg2 on a pooled connection,
+  used on IBM Cloud Code Engine
+- SQLAlchemyRepository (here): SQLAlchemy Core on PostgreSQL or SQLite,
+  used on OpenShift and for local development
+
+Both return plain dicts with the same keys, so routes and caches never see
+rows or model objects.
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import (Boolean, Column, DateTime, Integer, MetaData, String, Table, UniqueConstraint,
+                        and_, bindparam, case, create_engine, exists, func, literal, or_, select, text)
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import make_url
+
+from bulk_import import first_free_slot
+from grouping import GROUP_SIZE, get_group_for_slot
+from lab_events import DEFAULT_EVENT_ID, slot_sequence_name
+from migrations import SchemaContext, migrate
+from user_directory import SQLAlchemyDirectoryStore
+
+
+def pool_settings_from_env() -> Dict[str, Any]:
+    """Size the connection pool for a single worker process.
+
+    DB_POOL_MAX_SIZE sets the per-worker limit directly. Otherwise the
+    DB_MAX_CONNECTIONS budget is split evenly across the WEB_CONCURRENCY
+    worker processes so the whole instance stays within the database limit.
+    """
+    workers = max(int(os.environ.get('WEB_CONCURRENCY', 1)), 1)
+    max_size = os.environ.get('DB_POOL_MAX_SIZE')
+    if max_size:
+        max_size = int(max_size)
+    else:
+        max_size = int(os.environ.get('DB_MAX_CONNECTIONS', 20)) // workers
+    max_size = max(max_size, 1)
+
+    return {
+        'min_size': min(int(os.environ.get('DB_POOL_MIN_SIZE', 1)), max_size),
+        'max_size': max_size,
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        'health_check_interval': float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+    }
+
+
+class CheckinRepository:
+    """Everything the app reads from and writes to the database.
+
+    Users and groups are dicts: users have id, email, group_name,
+    checked_in_at (ISO string) and is_validated; groups have id, name,
+    max_members, current_members, is_full and created_at. User filters are the
+    dicts built by app.parse_user_filters (group_name, group_names,
+    email_prefix), and `after` is a decoded (checked_in_at, id) keyset cursor.
+
+    Check-in data is partitioned by event (see lab_events.py): every method
+    below that reads or writes users, groups, slots or stored responses works
+    within one `event_id`, which defaults to the default event.
+
+    Implementations also expose `dialect`, the `users_name` / `groups_name`
+    tables they use and the `import_batch_size` that suits their bulk loader.
+    """
+
+    dialect = None
+    users_name = 'users'
+    groups_name = 'groups'
+    import_batch_size = 500
+
+    def ensure_tables(self) -> Dict[str, Any]:
+        """Bring the schema up to date and sync the slot counter; returns the migration result"""
+        raise NotImplementedError
+
+    def connect_to_database(self):
+        """A new DB-API connection outside the pool (for LISTEN)"""
+        raise NotImplementedError
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def is_transient_error(self, error: Exception) -> bool:
+        """True if a failed write may succeed on retry (database unreachable, busy or locked)"""
+        raise NotImplementedError
+
+    # Events
+    def create_event(self, event_id: str, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Register an event and its slot counter; None if the id is taken"""
+        raise NotImplementedError
+
+    def get_event(self, event_id: str) -> Optional[Dict[str, Any]]:
+        """{'id', 'name', 'created_at'} for an event, or None"""
+        raise NotImplementedError
+
+    def get_events(self) -> List[Dict[str, Any]]:
+        """Every event, oldest first, with its total_users and total_groups"""
+        raise NotImplementedError
+
+    # Check-in
+    def checkin(self, email: str, is_validated: bool = True, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Register a user and assign the group of the event's next check-in slot, in one transaction.
+
+        Returns {'user', 'group', 'already_registered'}; an email that is
+        already registered takes no slot and gets its existing assignment.
+        """
+        raise NotImplementedError
+
+    def reserve_slots(self, count: int, event_id: str = DEFAULT_EVENT_ID) -> List[int]:
+        """Take `count` check-in slots for write-behind admission"""
+        raise NotImplementedError
+
+    def insert_checkins(self, records: List[Dict[str, Any]], event_id: str = DEFAULT_EVENT_ID) -> List[str]:
+        """Store already-assigned check-ins (skipping stored emails), recount their groups and return them"""
+        raise NotImplementedError
+
+    # Reads
+    def get_user_by_email(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_user_roster(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
+        """{'user', 'group', 'members'} for a user and everyone in their group, or None"""
+        raise NotImplementedError
+
+    def get_stats(self, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, int]:
+        """total_users, total_groups, full_groups and available_groups"""
+        raise NotImplementedError
+
+    def get_users_page(self, filters: Optional[Dict[str, Any]] = None, after=None, limit: int = 100,
+                       event_id: str = DEFAULT_EVENT_ID):
+        """One page of users, newest first; returns (users, has_more)"""
+        raise NotImplementedError
+
+    def count_users(self, filters: Optional[Dict[str, Any]] = None, event_id: str = DEFAULT_EVENT_ID) -> int:
+        raise NotImplementedError
+
+    def iter_users(self, filters: Optional[Dict[str, Any]] = None, batch_size: int = 500,
+                   event_id: str = DEFAULT_EVENT_ID) -> Iterator[Dict[str, Any]]:
+        """Stream users newest first without loading them all"""
+        raise NotImplementedError
+
+    def get_all_groups(self, event_id: str = DEFAULT_EVENT_ID) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_registered_emails(self, event_id: str = DEFAULT_EVENT_ID) -> set:
+        raise NotImplementedError
+
+    def get_group_member_counts(self, event_id: str = DEFAULT_EVENT_ID) -> List[tuple]:
+        """(group name, member count) for every group"""
+        raise NotImplementedError
+
+    # Admin writes
+    def rename_groups(self, renames: List[tuple], event_id: str = DEFAULT_EVENT_ID) -> Dict[str, int]:
+        """Apply (old name, new name) renames to groups and their members"""
+        raise NotImplementedError
+
+    def remove_users(self, emails: Optional[List[str]] = None, group_name: Optional[str] = None,
+                     event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Delete users by email list or by group and recount their groups; returns removed users and a per-group summary"""
+        raise NotImplementedError
+
+    def import_users(self, batches: Iterable[List[Dict[str, Any]]], event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Bulk-register roster rows; rows without a group take slots after the pre-assigned groups"""
+        raise NotImplementedError
+
+    def reset_all_data(self, archive: bool = True, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Optionally archive, then empty the event's users, groups and idempotency keys and restart its slots"""
+        raise NotImplementedError
+
+    # Idempotent check-in replay
+    def get_idempotent_response(self, key: str, email: str, max_age: float,
+                                event_id: str = DEFAULT_EVENT_ID) -> Optional[tuple]:
+        raise NotImplementedError
+
+    def save_idempotent_response(self, key: str, email: str, status_code: int, response: str,
+                                 event_id: str = DEFAULT_EVENT_ID):
+        raise NotImplementedError
+
+    # Cross-worker events (PostgreSQL only)
+    def notify(self, channel: str, payload: str):
+        raise NotImplementedError
+
+    # Read replicas (PostgreSQL only)
+    def get_write_position(self) -> Optional[str]:
+        """Current WAL position (LSN) on the primary, or None where there is no WAL"""
+        raise NotImplementedError
+
+    def get_replication_status(self) -> Dict[str, Any]:
+        """On a replica: {'position': replayed LSN, 'lag_seconds': replay delay}"""
+        raise NotImplementedError
+
+
+# A primary (not in recovery) counts as fully caught up. With nothing left
+# to replay the replica is current, however old its last replayed commit is.
+REPLICATION_STATUS_SQL = """
+    SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END::text,
+           CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+"""
+
+
+def create_database_engine(database_url: str):
+    """SQLAlchemy engine for DATABASE_URL, pooled like DatabaseOperations on PostgreSQL"""
+    url = make_url(database_url)
+    if url.drivername == 'postgresql':
+        # psycopg2 is the driver this app ships with; newer SQLAlchemy defaults to psycopg 3
+        url = url.set(drivername='postgresql+psycopg2')
+    if url.get_backend_name() != 'postgresql':
+        return create_engine(url)
+
+    settings = pool_settings_from_env()
+    return create_engine(
+        url,
+        pool_size=settings['max_size'],
+        max_overflow=0,
+        pool_timeout=settings['timeout'],
+        pool_pre_ping=True
+    )
+
+
+def user_to_dict(row) -> Dict[str, Any]:
+    return {
+        'id': row.id,
+        'email': row.email,
+        'group_name': row.group_name,
+        'checked_in_at': row.checked_in_at.isoformat() if row.checked_in_at else None,
+        'is_validated': row.is_validated
+    }
+
+
+def group_to_dict(row) -> Dict[str, Any]:
+    return {
+        'id': row.id,
+        'name': row.name,
+        'max_members': row.max_members,
+        'current_members': row.current_members,
+        'is_full': row.is_full,
+        'created_at': row.created_at.isoformat() if row.created_at else None
+    }
+
+
+def event_to_dict(row) -> Dict[str, Any]:
+    return {
+        'id': row.id,
+        'name': row.name,
+        'created_at': row.created_at.isoformat() if row.created_at else None
+    }
+
+
+def joined_group_to_dict(row) -> Optional[Dict[str, Any]]:
+    """The group half of a user row joined with its group (group id labelled group_id)"""
+    if row.group_id is None:
+        return None
+    return {
+        'id': row.group_id,
+        'name': row.name,
+        'max_members': row.max_members,
+        'current_members': row.current_members,
+        'is_full': row.is_full,
+        'created_at': row.created_at.isoformat() if row.created_at else None
+    }
+
+
+class SQLAlchemyRepository(SQLAlchemyDirectoryStore, CheckinRepository):
+    """CheckinRepository on a SQLAlchemy engine, written in Core.
+
+    The same statements run on PostgreSQL and SQLite; where they differ
+    (slot allocation, upserts, TRUNCATE) the dialect picks the variant.
+    Timestamps are written in UTC from Python, because tables created by
+    older releases have no column defaults.
+    """
+
+    def __init__(self, engine, users='users', groups='groups'):
+        super().__init__(engine)
+        self.dialect = engine.dialect.name
+        self.users_name = users
+        self.groups_name = groups
+
+        metadata = MetaData()
+        self.users = Table(
+            users, metadata,
+            Column('id', Integer, primary_key=True),
+            Column('email', String(255), nullable=False),
+            Column('group_name', String(100)),
+            Column('checked_in_at', DateTime, default=datetime.utcnow),
+            Column('is_validated', Boolean, default=False),
+            Column('event_id', String(40), nullable=False, default=DEFAULT_EVENT_ID),
+            UniqueConstraint('event_id', 'email')
+        )
+        self.groups = Table(
+            groups, metadata,
+            Column('id', Integer, primary_key=True),
+            Column('name', String(100), nullable=False),
+            Column('max_members', Integer, default=GROUP_SIZE),
+            Column('current_members', Integer, default=0),
+            Column('is_full', Boolean, default=False),
+            Column('created_at', DateTime, default=datetime.utcnow),
+            Column('event_id', String(40), nullable=False, default=DEFAULT_EVENT_ID),
+            UniqueConstraint('event_id', 'name')
+        )
+        self.events = Table(
+            'events', metadata,
+            Column('id', String(40), primary_key=True),
+            Column('name', String(255)),
+            Column('created_at', DateTime, default=datetime.utcnow)
+        )
+        # Slot counters: a sequence per event on PostgreSQL; on SQLite one (event, slot) row per slot
+        self.event_slots = Table(
+            'event_slots', metadata,
+            Column('event_id', String(40), primary_key=True),
+            Column('slot', Integer, primary_key=True)
+        )
+
+        if self.dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        self._upsert = insert
+
+    @property
+    def is_postgresql(self):
+        return self.dialect == 'postgresql'
+
+    def _quoted(self, table):
+        return self.engine.dialect.identifier_preparer.quote(table)
+
+    def ensure_tables(self) -> Dict[str, Any]:
+        with self.engine.begin() as conn:
+            def execute(statement, params=None):
+                result = conn.exec_driver_sql(statement, tuple(params) if params else ())
+                return result.fetchall() if result.returns_rows else None
+
+            ctx = SchemaContext(self.dialect, execute, users=self.users_name, groups=self.groups_name,
+                                param='?' if self.engine.dialect.paramstyle == 'qmark' else '%s')
+            result = migrate(ctx)
+            self._sync_slots(conn)
+
+        if result['applied']:
+            print(f"Database schema migrated to version {result['to_version']} (SQLAlchemy)")
+        else:
+            print(f"Database schema is current (version {result['to_version']}, SQLAlchemy)")
+        return result
+
+    def connect_to_database(self):
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        return self.engine.dialect.loaded_dbapi.connect(*cargs, **cparams)
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        if not hasattr(pool, 'checkedout'):
+            return {'pool': type(pool).__name__}
+        return {
+            'pool': type(pool).__name__,
+            'max_size': pool.size(),
+            'size': pool.checkedin() + pool.checkedout(),
+            'idle': pool.checkedin(),
+            'in_use': pool.checkedout(),
+        }
+
+    def is_transient_error(self, error: Exception) -> bool:
+        # OperationalError covers lost connections, failovers and SQLite's "database is locked"
+        return (isinstance(error, (sa_exc.OperationalError, sa_exc.InterfaceError, sa_exc.TimeoutError))
+                or getattr(error, 'connection_invalidated', False))
+
+    # Events
+    def create_event(self, event_id: str, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        events = self.events
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                self._upsert(events)
+                .values(id=event_id, name=name or event_id, created_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=['id'])
+                .returning(events)
+            ).first()
+            if row is None:
+                return None
+            if self.is_postgresql:
+                # Created with the event row, so check-ins never race to create it
+                conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {slot_sequence_name(event_id)} MINVALUE 0 START WITH 0"))
+        return event_to_dict(row)
+
+    def get_event(self, event_id: str) -> Optional[Dict[str, Any]]:
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.events).where(self.events.c.id == event_id)).first()
+        return event_to_dict(row) if row else None
+
+    def get_events(self) -> List[Dict[str, Any]]:
+        users, groups, events = self.users, self.groups, self.events
+        total_users = select(func.count()).select_from(users).where(users.c.event_id == events.c.id)
+        total_groups = select(func.count()).select_from(groups).where(groups.c.event_id == events.c.id)
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(events, total_users.scalar_subquery().label('total_users'),
+                       total_groups.scalar_subquery().label('total_groups'))
+                .order_by(events.c.created_at, events.c.id)
+            ).all()
+        return [dict(event_to_dict(row), total_users=row.total_users, total_groups=row.total_groups)
+                for row in rows]
+
+    # Slots
+    def _sync_slots(self, conn):
+        """Start the default event's slot counter after its existing groups on a fresh deployment"""
+        groups = self.groups
+        group_count = conn.execute(
+            select(func.count()).select_from(groups).where(groups.c.event_id == DEFAULT_EVENT_ID)
+        ).scalar()
+        if not group_count:
+            return
+
+        next_slot = group_count * GROUP_SIZE
+        if self.is_postgresql:
+            is_called = conn.execute(text("SELECT is_called FROM checkin_slot_seq")).scalar()
+            if not is_called:
+                conn.execute(text("SELECT setval('checkin_slot_seq', :slot, false)"), {"slot": next_slot})
+        elif not conn.execute(
+            select(self.event_slots.c.slot).where(self.event_slots.c.event_id == DEFAULT_EVENT_ID).limit(1)
+        ).first():
+            # The next slot is the one after the highest taken
+            conn.execute(self.event_slots.insert(), [{"event_id": DEFAULT_EVENT_ID, "slot": next_slot - 1}])
+
+    def _next_slot(self, conn, event_id: str) -> int:
+        """Take the event's next check-in slot.
+
+        PostgreSQL hands out values from the event's sequence without locking.
+        SQLite has no sequences, so each slot is an event_slots row one above
+        the event's highest; SQLite serializes writers, which makes that just
+        as race-free.
+        """
+        if self.is_postgresql:
+            return conn.execute(text("SELECT nextval(:sequence)"), {"sequence": slot_sequence_name(event_id)}).scalar()
+        slots = self.event_slots
+        next_slot = (select(literal(event_id), func.coalesce(func.max(slots.c.slot) + 1, 0))
+                     .where(slots.c.event_id == event_id))
+        return conn.execute(
+            slots.insert().from_select(['event_id', 'slot'], next_slot).returning(slots.c.slot)
+        ).scalar()
+
+    def _reserve_slots(self, conn, count, floor=0, event_id: str = DEFAULT_EVENT_ID) -> List[int]:
+        """Take `count` consecutive check-in slots, first moving the event's counter to at least `floor`"""
+        if self.is_postgresql:
+            sequence = slot_sequence_name(event_id)
+            conn.execute(text(f"""
+                SELECT setval('{sequence}', GREATEST(:floor,
+                    (SELECT CASE WHEN is_called THEN last_value + 1 ELSE last_value END FROM {sequence})), false)
+            """), {"floor": floor})
+            if not count:
+                return []
+            return list(conn.execute(
+                text("SELECT nextval(:sequence) FROM generate_series(1, :count)"),
+                {"sequence": sequence, "count": count}
+            ).scalars())
+
+        # SQLite holds the write lock until commit
+        table = self.event_slots
+        last = conn.execute(select(func.max(table.c.slot)).where(table.c.event_id == event_id)).scalar()
+        next_slot = 0 if last is None else last + 1
+        start = max(floor, next_slot)
+        slots = list(range(start, start + count))
+        # With nothing to take, a row just below `floor` still moves the counter up
+        rows = slots or ([start - 1] if start > next_slot else [])
+        if rows:
+            conn.execute(table.insert(), [{"event_id": event_id, "slot": slot} for slot in rows])
+        return slots
+
+    def _reset_slots(self, conn, event_id: str):
+        """Restart the event's slot allocation at Group A"""
+        if self.is_postgresql:
+            conn.execute(text(f"ALTER SEQUENCE {slot_sequence_name(event_id)} RESTART"))
+        else:
+            conn.execute(self.event_slots.delete().where(self.event_slots.c.event_id == event_id))
+
+    def reserve_slots(self, count: int, event_id: str = DEFAULT_EVENT_ID) -> List[int]:
+        with self.engine.begin() as conn:
+            return self._reserve_slots(conn, count, event_id=event_id)
+
+    # Check-in
+    def checkin(self, email: str, is_validated: bool = True, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        users, groups = self.users, self.groups
+        email = email.lower().strip()
+        now = datetime.utcnow()
+
+        with self.engine.begin() as conn:
+            # Re-submissions hit NOT EXISTS / ON CONFLICT and take no slot
+            new_user = select(literal(email), literal(is_validated), literal(now), literal(event_id)).where(
+                ~exists().where(users.c.event_id == event_id, users.c.email == email)
+            )
+            user_id = conn.execute(
+                self._upsert(users)
+                .from_select(['email', 'is_validated', 'checked_in_at', 'event_id'], new_user)
+                .on_conflict_do_nothing(index_elements=['event_id', 'email'])
+                .returning(users.c.id)
+            ).scalar()
+
+            if user_id is None:
+                row = conn.execute(
+                    select(users, groups.c.id.label('group_id'), groups.c.name, groups.c.max_members,
+                           groups.c.current_members, groups.c.is_full, groups.c.created_at)
+                    .select_from(users.outerjoin(groups, and_(groups.c.event_id == users.c.event_id,
+                                                              groups.c.name == users.c.group_name)))
+                    .where(users.c.event_id == event_id, users.c.email == email)
+                ).one()
+                return {'user': user_to_dict(row), 'group': joined_group_to_dict(row), 'already_registered': True}
+
+            group_name, _, _ = get_group_for_slot(self._next_slot(conn, event_id))
+            user = conn.execute(
+                users.update().where(users.c.id == user_id).values(group_name=group_name).returning(users)
+            ).one()
+            stmt = self._upsert(groups).values(
+                event_id=event_id,
+                name=group_name,
+                max_members=GROUP_SIZE,
+                current_members=1,
+                is_full=GROUP_SIZE <= 1,
+                created_at=now
+            )
+            group = conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[groups.c.event_id, groups.c.name],
+                    set_={
+                        'current_members': groups.c.current_members + 1,
+                        'is_full': groups.c.current_members + 1 >= groups.c.max_members
+                    }
+                ).returning(groups)
+            ).one()
+
+        return {'user': user_to_dict(user), 'group': group_to_dict(group), 'already_registered': False}
+
+    def insert_checkins(self, records: List[Dict[str, Any]], event_id: str = DEFAULT_EVENT_ID) -> List[str]:
+        groups = sorted({record['group_name'] for record in records})
+        with self.engine.begin() as conn:
+            conn.execute(
+                self._upsert(self.users).values([{
+                    'event_id': event_id,
+                    'email': record['email'],
+                    'group_name': record['group_name'],
+                    'is_validated': record['is_validated'],
+                    'checked_in_at': datetime.fromisoformat(record['checked_in_at'])
+                } for record in records]).on_conflict_do_nothing(index_elements=['event_id', 'email'])
+            )
+            self._recount_groups(conn, groups, event_id)
+        return groups
+
+    # Reads
+    def get_user_by_email(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
+        users = self.users
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(users).where(users.c.event_id == event_id, users.c.email == email.lower().strip())
+            ).first()
+        return user_to_dict(row) if row else None
+
+    def get_user_roster(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
+        users, groups = self.users, self.groups
+        member = users.alias('m')
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(users, groups.c.id.label('group_id'), groups.c.name, groups.c.max_members,
+                       groups.c.current_members, groups.c.is_full, groups.c.created_at,
+                       member.c.id.label('member_id'), member.c.email.label('member_email'),
+                       member.c.group_name.label('member_group_name'),
+                       member.c.checked_in_at.label('member_checked_in_at'),
+                       member.c.is_validated.label('member_is_validated'))
+                .select_from(users
+                             .outerjoin(groups, and_(groups.c.event_id == users.c.event_id,
+                                                     groups.c.name == users.c.group_name))
+                             .outerjoin(member, and_(member.c.event_id == users.c.event_id,
+                                                     member.c.group_name == users.c.group_name)))
+                .where(users.c.event_id == event_id, users.c.email == email)
+                .order_by(member.c.id)
+            ).all()
+        if not rows:
+            return None
+
+        row = rows[0]
+        return {
+            'user': user_to_dict(row),
+            'group': joined_group_to_dict(row),
+            'members': [{
+                'id': r.member_id,
+                'email': r.member_email,
+                'group_name': r.member_group_name,
+                'checked_in_at': r.member_checked_in_at.isoformat() if r.member_checked_in_at else None,
+                'is_validated': r.member_is_validated
+            } for r in rows if r.member_id is not None]
+        }
+
+    def get_stats(self, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, int]:
+        users, groups = self.users, self.groups
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(
+                    select(func.count(users.c.id)).where(users.c.event_id == event_id).scalar_subquery(),
+                    func.count(groups.c.id),
+                    func.coalesce(func.sum(case((groups.c.is_full, 1), else_=0)), 0),
+                ).select_from(groups).where(groups.c.event_id == event_id)
+            ).one()
+        total_users, total_groups, full_groups = int(row[0]), int(row[1]), int(row[2])
+        return {
+            'total_users': total_users,
+            'total_groups': total_groups,
+            'full_groups': full_groups,
+            'available_groups': total_groups - full_groups,
+        }
+
+    def _select_users(self, filters: Optional[Dict[str, Any]] = None, after=None, event_id: str = DEFAULT_EVENT_ID):
+        """The event's users matching the filters, newest first, continuing after a keyset cursor"""
+        users = self.users
+        filters = filters or {}
+        stmt = select(users).where(users.c.event_id == event_id)
+        if filters.get('group_name'):
+            stmt = stmt.where(users.c.group_name == filters['group_name'])
+        if filters.get('group_names') is not None:
+            stmt = stmt.where(users.c.group_name.in_(filters['group_names']))
+        if filters.get('email_prefix'):
+            stmt = stmt.where(users.c.email.startswith(filters['email_prefix'], autoescape=True))
+        if after is not None:
+            checked_in_at, user_id = after
+            stmt = stmt.where(or_(
+                users.c.checked_in_at < checked_in_at,
+                and_(users.c.checked_in_at == checked_in_at, users.c.id < user_id)
+            ))
+        return stmt.order_by(users.c.checked_in_at.desc(), users.c.id.desc())
+
+    def get_users_page(self, filters: Optional[Dict[str, Any]] = None, after=None, limit: int = 100,
+                       event_id: str = DEFAULT_EVENT_ID):
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._select_users(filters, after, event_id).limit(limit + 1)).all()
+        return [user_to_dict(row) for row in rows[:limit]], len(rows) > limit
+
+    def count_users(self, filters: Optional[Dict[str, Any]] = None, event_id: str = DEFAULT_EVENT_ID) -> int:
+        subquery = self._select_users(filters, event_id=event_id).order_by(None).subquery()
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(subquery)).scalar()
+
+    def iter_users(self, filters: Optional[Dict[str, Any]] = None, batch_size: int = 500,
+                   event_id: str = DEFAULT_EVENT_ID):
+        # yield_per streams through a server-side cursor on PostgreSQL
+        with self.engine.connect() as conn:
+            result = conn.execution_options(yield_per=batch_size).execute(self._select_users(filters, event_id=event_id))
+            for row in result:
+                yield user_to_dict(row)
+
+    def get_all_groups(self, event_id: str = DEFAULT_EVENT_ID) -> List[Dict[str, Any]]:
+        groups = self.groups
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(groups).where(groups.c.event_id == event_id).order_by(groups.c.created_at)).all()
+        return [group_to_dict(row) for row in rows]
+
+    def get_registered_emails(self, event_id: str = DEFAULT_EVENT_ID) -> set:
+        with self.engine.connect() as conn:
+            return set(conn.execute(select(self.users.c.email).where(self.users.c.event_id == event_id)).scalars())
+
+    def get_group_member_counts(self, event_id: str = DEFAULT_EVENT_ID) -> List[tuple]:
+        users, groups = self.users, self.groups
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(
+                select(groups.c.name, func.count(users.c.id))
+                .select_from(groups.outerjoin(users, and_(users.c.event_id == groups.c.event_id,
+                                                          users.c.group_name == groups.c.name)))
+                .where(groups.c.event_id == event_id)
+                .group_by(groups.c.id, groups.c.name)
+            )]
+
+    # Admin writes
+    def rename_groups(self, renames: List[tuple], event_id: str = DEFAULT_EVENT_ID) -> Dict[str, int]:
+        """One UPDATE ... FROM (VALUES ...) for groups and one for users, in one transaction"""
+        if not renames:
+            return {'groups_renamed': 0, 'users_updated': 0}
+        values = ', '.join(f"(:old_{i}, :new_{i})" for i in range(len(renames)))
+        params = {'event_id': event_id}
+        for i, (old_name, new_name) in enumerate(renames):
+            params[f"old_{i}"] = old_name
+            params[f"new_{i}"] = new_name
+
+        def rename(conn, table, column):
+            table = self._quoted(table)
+            # VALUES columns are column1 (old name), column2 (new name) on both PostgreSQL and SQLite
+            return conn.execute(text(f"""
+                UPDATE {table} SET {column} = v.column2
+                FROM (VALUES {values}) AS v
+                WHERE {table}.event_id = :event_id AND {table}.{column} = v.column1
+            """), params).rowcount
+
+        with self.engine.begin() as conn:
+            groups_renamed = rename(conn, self.groups_name, 'name')
+            users_updated = rename(conn, self.users_name, 'group_name')
+        return {'groups_renamed': groups_renamed, 'users_updated': users_updated}
+
+    def _recount_groups(self, conn, group_names, event_id: str) -> List[str]:
+        """Set the event's group counters from the users table for the given groups.
+
+        One aggregate upsert covers every group that still has members; groups
+        left without members are deleted, and their names returned.
+        """
+        if not group_names:
+            return []
+        users, groups = self.users, self.groups
+        member_count = func.count(users.c.id)
+        counts = (select(literal(event_id), users.c.group_name, literal(GROUP_SIZE), member_count,
+                         member_count >= GROUP_SIZE, literal(datetime.utcnow()))
+                  .where(users.c.event_id == event_id, users.c.group_name.in_(list(group_names)))
+                  .group_by(users.c.group_name))
+        stmt = self._upsert(groups).from_select(
+            ['event_id', 'name', 'max_members', 'current_members', 'is_full', 'created_at'], counts
+        )
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[groups.c.event_id, groups.c.name],
+            set_={
+                'current_members': stmt.excluded.current_members,
+                'is_full': stmt.excluded.current_members >= groups.c.max_members
+            }
+        ))
+
+        has_members = select(users.c.id).where(users.c.event_id == groups.c.event_id,
+                                               users.c.group_name == groups.c.name).exists()
+        return list(conn.execute(
+            groups.delete()
+            .where(groups.c.event_id == event_id, groups.c.name.in_(list(group_names)), ~has_members)
+            .returning(groups.c.name)
+        ).scalars())
+
+    def remove_users(self, emails: Optional[List[str]] = None, group_name: Optional[str] = None,
+                     event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        users, groups = self.users, self.groups
+        stmt = users.delete().where(users.c.event_id == event_id).returning(users.c.email, users.c.group_name)
+        if emails is not None:
+            stmt = stmt.where(users.c.email.in_(list(emails)))
+        else:
+            stmt = stmt.where(users.c.group_name == group_name)
+
+        with self.engine.begin() as conn:
+            removed = [tuple(row) for row in conn.execute(stmt)]
+            affected = sorted({name for _, name in removed if name})
+            groups_removed = set(self._recount_groups(conn, affected, event_id))
+            remaining = {row.name: group_to_dict(row) for row in conn.execute(
+                select(groups).where(groups.c.event_id == event_id, groups.c.name.in_(affected))
+            )} if affected else {}
+
+        return {
+            'removed': [{'email': email, 'group_name': name} for email, name in removed],
+            'groups': [{
+                'group_name': name,
+                'users_removed': sum(1 for _, removed_group in removed if removed_group == name),
+                'group_removed': name in groups_removed,
+                'group': remaining.get(name)
+            } for name in affected]
+        }
+
+    def import_users(self, batches: Iterable[List[Dict[str, Any]]], event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Bulk-register attendees with batched executemany inserts in one transaction"""
+        users = self.users
+        now = datetime.utcnow()
+        imported, existing, unassigned = 0, 0, []
+        groups = set()
+
+        with self.engine.begin() as conn:
+            for batch in batches:
+                emails = [row['email'] for row in batch]
+                registered = set(conn.execute(
+                    select(users.c.email).where(users.c.event_id == event_id, users.c.email.in_(emails))
+                ).scalars())
+                new_rows = [{
+                    'event_id': event_id,
+                    'email': row['email'],
+                    'group_name': row['group_name'],
+                    'is_validated': row['is_validated'],
+                    'checked_in_at': now
+                } for row in batch if row['email'] not in registered]
+                existing += len(batch) - len(new_rows)
+
+                if new_rows:
+                    conn.execute(users.insert(), new_rows)
+                imported += len(new_rows)
+                unassigned.extend(row['email'] for row in new_rows if not row['group_name'])
+                groups.update(row['group_name'] for row in new_rows if row['group_name'])
+
+            # Walk-in slots continue after the pre-assigned groups
+            slots = self._reserve_slots(conn, len(unassigned), first_free_slot(groups), event_id)
+            assignments = [{'target_email': email, 'assigned_group': get_group_for_slot(slot)[0]}
+                           for email, slot in zip(unassigned, slots)]
+            if assignments:
+                conn.execute(
+                    users.update()
+                    .where(users.c.event_id == event_id, users.c.email == bindparam('target_email'))
+                    .values(group_name=bindparam('assigned_group')),
+                    assignments
+                )
+                groups.update(assignment['assigned_group'] for assignment in assignments)
+
+            self._recount_groups(conn, sorted(groups), event_id)
+
+        return {
+            'imported': imported,
+            'existing': existing,
+            'auto_assigned': len(unassigned),
+            'groups': sorted(groups)
+        }
+
+    def reset_all_data(self, archive: bool = True, event_id: str = DEFAULT_EVENT_ID) -> Dict[str, Any]:
+        """Archive the event's session (optional), then empty its users and groups and restart its slots.
+
+        While other events have rows in the tables, the event's rows are
+        deleted through the event_id indexes. When the tables hold only this
+        event's rows, PostgreSQL uses TRUNCATE ... RESTART IDENTITY;
+        SQLite has no TRUNCATE, so it deletes every row (which SQLite optimizes
+        to dropping the pages) and clears the AUTOINCREMENT counters.
+        """
+        users, groups = self._quoted(self.users_name), self._quoted(self.groups_name)
+        params = {"event_id": event_id}
+        timings = {}
+
+        with self.engine.begin() as conn:
+            started = time.monotonic()
+            archive_id = None
+            if archive:
+                archive_id = conn.execute(
+                    text("INSERT INTO checkin_archives (event_id) VALUES (:event_id) RETURNING id"), params
+                ).scalar()
+                user_count = conn.execute(text(f"""
+                    INSERT INTO archived_users (archive_id, email, group_name, checked_in_at, is_validated)
+                    SELECT :archive_id, email, group_name, checked_in_at, is_validated FROM {users}
+                    WHERE event_id = :event_id
+                """), dict(params, archive_id=archive_id)).rowcount
+                group_count = conn.execute(text(f"""
+                    INSERT INTO archived_groups (archive_id, name, max_members, current_members, is_full, created_at)
+                    SELECT :archive_id, name, max_members, current_members, is_full, created_at FROM {groups}
+                    WHERE event_id = :event_id
+                """), dict(params, archive_id=archive_id)).rowcount
+                conn.execute(
+                    text("UPDATE checkin_archives SET users_count = :users, groups_count = :groups WHERE id = :id"),
+                    {"users": user_count, "groups": group_count, "id": archive_id}
+                )
+            else:
+                user_count, group_count = conn.execute(text(f"""
+                    SELECT (SELECT COUNT(*) FROM {users} WHERE event_id = :event_id),
+                           (SELECT COUNT(*) FROM {groups} WHERE event_id = :event_id)
+                """), params).one()
+            timings['archive_ms'] = round((time.monotonic() - started) * 1000, 1)
+
+            started = time.monotonic()
+            shared = conn.execute(text(f"""
+                SELECT EXISTS (SELECT 1 FROM {users} WHERE event_id <> :event_id)
+                    OR EXISTS (SELECT 1 FROM {groups} WHERE event_id <> :event_id)
+                    OR EXISTS (SELECT 1 FROM idempotency_keys WHERE event_id <> :event_id)
+            """), params).scalar()
+            if shared:
+                conn.execute(text(f"DELETE FROM {users} WHERE event_id = :event_id"), params)
+                conn.execute(text(f"DELETE FROM {groups} WHERE event_id = :event_id"), params)
+                conn.execute(text("DELETE FROM idempotency_keys WHERE event_id = :event_id"), params)
+            else:
+                if self.is_postgresql:
+                    conn.execute(text(f"TRUNCATE {users}, {groups} RESTART IDENTITY"))
+                else:
+                    conn.execute(text(f"DELETE FROM {users}"))
+                    conn.execute(text(f"DELETE FROM {groups}"))
+                    conn.execute(text("DELETE FROM sqlite_sequence WHERE name IN (:users, :groups)"),
+                                 {"users": self.users_name, "groups": self.groups_name})
+                conn.execute(text("DELETE FROM idempotency_keys"))
+            self._reset_slots(conn, event_id)
+        timings['truncate_ms'] = round((time.monotonic() - started) * 1000, 1)
+
+        return {
+            'users_removed': user_count,
+            'groups_removed': group_count,
+            'archive_id': archive_id,
+            'timings_ms': timings
+        }
+
+    # Idempotent check-in replay
+    def get_idempotent_response(self, key: str, email: str, max_age: float,
+                                event_id: str = DEFAULT_EVENT_ID) -> Optional[tuple]:
+        with self.engine.connect() as conn:
+            row = conn.execute(text("""
+                SELECT status_code, response FROM idempotency_keys
+                WHERE idempotency_key = :key AND email = :email AND event_id = :event_id AND created_at > :cutoff
+            """), {"key": key, "email": email, "event_id": event_id, "cutoff": time.time() - max_age}).first()
+        return (row[0], row[1]) if row else None
+
+    def save_idempotent_response(self, key: str, email: str, status_code: int, response: str,
+                                 event_id: str = DEFAULT_EVENT_ID):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO idempotency_keys (idempotency_key, email, status_code, response, created_at, event_id)
+                VALUES (:key, :email, :status_code, :response, :created_at, :event_id)
+                ON CONFLICT (event_id, idempotency_key, email) DO NOTHING
+            """), {"key": key, "email": email, "status_code": status_code,
+                   "response": response, "created_at": time.time(), "event_id": event_id})
+
+    def notify(self, channel: str, payload: str):
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": payload})
+
+    def get_write_position(self) -> Optional[str]:
+        if not self.is_postgresql:
+            return None
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+
+    def get_replication_status(self) -> Dict[str, Any]:
+        with self.engine.connect() as conn:
+            position, lag = conn.execute(text(REPLICATION_STATUS_SQL)).one()
+        return {'position': position, 'lag_seconds': float(lag)}
@@ -0,0 +1,203 @@
+"""Short-lived in-process snapshots of read-heavy query results"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class CachedSnapshot:
+    """Caches one computed value for up to `ttl` seconds.
+
+    Concurrent readers of an expired snapshot share a single recomputation.
+    invalidate() bumps a generation counter, so a value computed while a write
+    was landing is never stored over the invalidation.
+    """
+
+    def __init__(self, loader: Callable[[], Any], ttl=2.0):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._value = None
+        self._expires_at = 0.0
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self):
+        with self._lock:
+            if time.monotonic() < self._expires_at:
+                self.hits += 1
+                return self._value
+
+        with self._refresh_lock:
+            # Another thread may have refreshed while we waited
+            with self._lock:
+                if time.monotonic() < self._expires_at:
+                    self.hits += 1
+                    return self._value
+                generation = self._generation
+                self.misses += 1
+
+            value = self._loader()
+
+            with self._lock:
+                if generation == self._generation:
+                    self._value = value
+                    self._expires_at = time.monotonic() + self.ttl
+            return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._expires_at = 0.0
+            self._value = None
+            self.invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
+
+
+class AsyncCachedSnapshot:
+    """CachedSnapshot for a coroutine loader, shared by the tasks of one event loop.
+
+    invalidate() only touches plain attributes, so event listeners running
+    on other threads (e.g. the relay) may call it.
+    """
+
+    def __init__(self, loader: Callable[[], Any], ttl=2.0):
+        self._loader = loader
+        self.ttl = ttl
+        self._refresh_lock = None  # created on first use, inside the running loop
+        self._value = None
+        self._expires_at = 0.0
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self):
+        if time.monotonic() < self._expires_at:
+            self.hits += 1
+            return self._value
+
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            # Another task may have refreshed while we waited
+            if time.monotonic() < self._expires_at:
+                self.hits += 1
+                return self._value
+            generation = self._generation
+            self.misses += 1
+
+            value = await self._loader()
+
+            if generation == self._generation:
+                self._value = value
+                self._expires_at = time.monotonic() + self.ttl
+            return value
+
+    def invalidate(self):
+        self._generation += 1
+        self._expires_at = 0.0
+        self.invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
+
+
+class GroupRosterCache:
+    """Per-group rosters (group row plus member rows), indexed by member email.
+
+    Entries are dropped group by group as check-ins and removals land, and all
+    at once for migrations and resets; `ttl` only bounds how long a roster can
+    survive an invalidation this process never heard about. Fill with the
+    token from begin(), taken before querying, so a roster read while a write
+    was landing is never stored over the invalidation.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rosters = {}
+        self._by_email = {}
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def begin(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def get(self, email: str):
+        """Return (user, roster) for a cached member, or None"""
+        with self._lock:
+            group_name = self._by_email.get(email)
+            roster = self._rosters.get(group_name) if group_name else None
+            if roster is None or time.monotonic() >= roster['expires_at']:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return roster['members_by_email'][email], roster
+
+    def put(self, group: Dict[str, Any], members, token: int, ttl: Optional[float] = None):
+        """Store a roster; `ttl` shortens its lifetime below the cache default"""
+        with self._lock:
+            if token != self._generation:
+                return
+            self._drop_locked(group['name'])
+            members_by_email = {member['email']: member for member in members}
+            self._rosters[group['name']] = {
+                'group': group,
+                'members': members,
+                'members_by_email': members_by_email,
+                'expires_at': time.monotonic() + min(self.ttl, ttl if ttl is not None else self.ttl),
+            }
+            for email in members_by_email:
+                self._by_email[email] = group['name']
+
+    def _drop_locked(self, group_name):
+        roster = self._rosters.pop(group_name, None)
+        if roster is not None:
+            for email in roster['members_by_email']:
+                if self._by_email.get(email) == group_name:
+                    del self._by_email[email]
+
+    def invalidate(self, group_name: Optional[str] = None):
+        """Drop one group's roster, or every roster when no group is given"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if group_name is None:
+                self._rosters.clear()
+                self._by_email.clear()
+            else:
+                self._drop_locked(group_name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            groups = len(self._rosters)
+        return {
+            'ttl_seconds': self.ttl,
+            'groups': groups,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,515 @@
+"""In-memory index of the active IBM Cloud account users"""
+
+import json
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from urllib.parse import urlparse, parse_qs
+from typing import Optional, List, Dict, Any, Iterable, Callable, Tuple
+
+from sqlalchemy import text
+
+
+class UserDirectory:
+    """Immutable email-keyed index over a snapshot of account users.
+
+    A directory is built once per refresh and never mutated afterwards, so the
+    app can publish a new snapshot by swapping a single reference while other
+    threads keep reading the previous one. Lookups by user_id and state use
+    secondary indexes that are only built the first time they are needed.
+    """
+
+    def __init__(self, users: Iterable[Dict[str, Any]] = (), version=None, refreshed_at=None):
+        # Later duplicates win, matching a fresh crawl of the account
+        self._by_email = {user['email']: user for user in users}
+        # Shared snapshot version, and when the account was actually crawled
+        self.version = version
+        self.refreshed_at = refreshed_at if refreshed_at is not None else time.time()
+
+    def __len__(self):
+        return len(self._by_email)
+
+    def __bool__(self):
+        return bool(self._by_email)
+
+    def __contains__(self, email):
+        return email.lower().strip() in self._by_email
+
+    def get(self, email: str) -> Optional[Dict[str, Any]]:
+        """Return the user with this email, or None"""
+        return self._by_email.get(email.lower().strip())
+
+    @property
+    def emails(self):
+        """Set-like view of every indexed email"""
+        return self._by_email.keys()
+
+    @cached_property
+    def users(self) -> List[Dict[str, Any]]:
+        """All users ordered by email"""
+        return [self._by_email[email] for email in sorted(self._by_email)]
+
+    @cached_property
+    def _by_user_id(self) -> Dict[str, Dict[str, Any]]:
+        return {user['user_id']: user for user in self._by_email.values() if user.get('user_id')}
+
+    @cached_property
+    def _by_state(self) -> Dict[str, List[Dict[str, Any]]]:
+        by_state = {}
+        for user in self.users:
+            by_state.setdefault(user.get('state', ''), []).append(user)
+        return by_state
+
+    def get_by_user_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the user with this IAM user_id, or None"""
+        return self._by_user_id.get(user_id)
+
+    def with_state(self, state: str) -> List[Dict[str, Any]]:
+        """Users in the given state (e.g. ACTIVE), ordered by email"""
+        return self._by_state.get(state.upper(), [])
+
+    def partition_registered(self, registered_emails) -> Dict[str, List[Dict[str, Any]]]:
+        """Split users into registered and unregistered, each ordered by email"""
+        registered, unregistered = [], []
+        for user in self.users:
+            (registered if user['email'] in registered_emails else unregistered).append(user)
+        return {'registered': registered, 'unregistered': unregistered}
+
+
+class AccountUserCrawler:
+    """Fetches every page of account users with a bounded thread pool.
+
+    The User Management API chains pages through the `_start` token in each
+    response's next_url, so the crawler always prefetches the next page while
+    the current one is being indexed. When the first response shows that the
+    tokens are plain offsets, it goes further and keeps up to max_workers
+    pages in flight at once. Each page's own next token is checked against the
+    expected offset, and any mismatch drops back to following the tokens one
+    page at a time.
+
+    `client` is anything with the SDK's list_users(account_id, limit, start)
+    signature, so a stub or a UserManagementV1 pointed at a local fake works.
+    """
+
+    def __init__(self, client, account_id, page_size=100, max_workers=4):
+        self.client = client
+        self.account_id = account_id
+        self.page_size = page_size
+        self.max_workers = max(max_workers, 1)
+        self.stats = {}
+
+    def _fetch(self, start):
+        result = self.client.list_users(
+            account_id=self.account_id,
+            limit=self.page_size,
+            start=start,
+        ).get_result()
+
+        next_start = None
+        next_url = result.get('next_url')
+        if next_url:
+            next_start = parse_qs(urlparse(next_url).query).get('_start', [None])[0]
+        return result.get('resources') or [], next_start
+
+    def crawl(self, on_page: Callable[[List[Dict[str, Any]]], None]) -> Dict[str, Any]:
+        """Fetch all pages, calling on_page with each one as it arrives (in order)"""
+        started = time.monotonic()
+        pages = users = 0
+        mode = 'sequential'
+        time_to_first_page = None
+
+        def deliver(resources):
+            nonlocal pages, users, time_to_first_page
+            if time_to_first_page is None:
+                time_to_first_page = time.monotonic() - started
+            pages += 1
+            users += len(resources)
+            on_page(resources)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='user-crawl') as pool:
+            resources, next_start = self._fetch(None)
+            deliver(resources)
+
+            if self.max_workers > 1 and next_start == str(self.page_size):
+                # Offset tokens: fan out over the next pages
+                mode = 'parallel'
+                in_flight = deque()
+                offset = self.page_size
+                while next_start is not None:
+                    while len(in_flight) < self.max_workers:
+                        in_flight.append((str(offset), pool.submit(self._fetch, str(offset))))
+                        offset += self.page_size
+                    expected, future = in_flight.popleft()
+                    if expected != next_start:
+                        break
+                    resources, next_start = future.result()
+                    deliver(resources)
+                for _, future in in_flight:
+                    future.cancel()
+
+            # Follow the tokens, fetching page N+1 while page N is indexed
+            future = pool.submit(self._fetch, next_start) if next_start is not None else None
+            while future is not None:
+                resources, next_start = future.result()
+                future = pool.submit(self._fetch, next_start) if next_start is not None else None
+                deliver(resources)
+
+        duration = time.monotonic() - started
+        self.stats = {
+            'mode': mode,
+            'workers': self.max_workers,
+            'pages': pages,
+            'users': users,
+            'duration_ms': round(duration * 1000, 1),
+            'time_to_first_page_ms': round(time_to_first_page * 1000, 1),
+            'users_per_second': round(users / duration, 1) if duration else None,
+        }
+        return self.stats
+
+
+class DirectoryWarmingUp(RuntimeError):
+    """Raised by DirectoryCache.get while the first crawl is still running past initial_wait"""
+
+
+class DirectoryCache:
+    """Stale-while-revalidate cache around a UserDirectory loader.
+
+    A single background thread per process runs the loader, so concurrent
+    requests never start duplicate crawls. Readers always get the last good
+    snapshot immediately; only a cold cache makes them wait, and then they all
+    wait on the same in-flight refresh. Failed refreshes keep the previous
+    snapshot and retry with jittered exponential backoff. The thread only
+    refreshes a snapshot that has been read since it was loaded, so an idle
+    worker stops calling the API.
+
+    The loader may return None to mean "nothing changed"; the snapshot is then
+    kept and checked again after check_interval (default: ttl).
+    """
+
+    def __init__(self, loader: Callable[[], Optional[UserDirectory]], ttl=300,
+                 initial_wait=30.0, backoff_base=5.0, backoff_max=300.0,
+                 check_interval=None):
+        self._loader = loader
+        self.ttl = ttl
+        self.check_interval = check_interval if check_interval is not None else ttl
+        self.initial_wait = initial_wait
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._directory = None
+        self._loaded_at = None  # wall clock, for reporting age
+        self._next_refresh = 0.0  # monotonic
+        self._force = False
+        self._accessed = False
+        self._refreshing = False
+        self._cold_wait_expired = None
+
+        self._attempts = 0
+        self._refresh_count = 0
+        self._failure_count = 0
+        self._consecutive_failures = 0
+        self._last_error = None
+        self._last_duration = None
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        # Threads do not survive a fork, so each worker starts its own
+        self._pid = os.getpid()
+        self._refreshing = False
+        self._thread = threading.Thread(target=self._run, name='user-directory-refresh', daemon=True)
+        self._thread.start()
+
+    def _backoff(self):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self._consecutive_failures - 1))
+        return random.uniform(delay / 2, delay)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._force or (self._accessed and time.monotonic() >= self._next_refresh)):
+                    timeout = self._next_refresh - time.monotonic() if self._accessed else None
+                    self._cond.wait(timeout if timeout is None or timeout > 0 else 0)
+                self._force = False
+                self._accessed = False
+                self._refreshing = True
+
+            started = time.monotonic()
+            try:
+                directory = self._loader()
+            except Exception as e:
+                with self._cond:
+                    self._attempts += 1
+                    self._failure_count += 1
+                    self._consecutive_failures += 1
+                    self._last_error = str(e)
+                    self._last_duration = time.monotonic() - started
+                    delay = self._backoff()
+                    self._next_refresh = time.monotonic() + delay
+                    # Retry even if nobody reads in the meantime
+                    self._accessed = True
+                    self._refreshing = False
+                    self._cond.notify_all()
+                print(f"User directory refresh failed ({e}), retrying in {delay:.1f}s")
+                continue
+
+            with self._cond:
+                if directory is not None:
+                    self._directory = directory
+                    self._loaded_at = directory.refreshed_at
+                    self._refresh_count += 1
+                self._attempts += 1
+                self._consecutive_failures = 0
+                self._last_error = None
+                self._last_duration = time.monotonic() - started
+                self._next_refresh = time.monotonic() + self.check_interval
+                self._refreshing = False
+                self._cond.notify_all()
+
+    def get(self, wait=True) -> Optional[UserDirectory]:
+        """Return the current snapshot, waiting only if none has loaded yet.
+
+        While refreshes are failing and nothing has loaded, an empty directory
+        is returned straight away so callers can use their fallback. A first
+        crawl still running after `initial_wait` is not a failure: it raises
+        DirectoryWarmingUp, so callers do not fall back to format checks just
+        because the account is large. With `wait=False` a cold cache returns
+        None instead of blocking (for callers on an event loop, which then
+        wait in a thread).
+        """
+        with self._cond:
+            self._ensure_thread()
+            self._accessed = True
+            if (self._directory is None and not self._consecutive_failures
+                    and self._cold_wait_expired != self._attempts):
+                # Cold cache: share the first crawl instead of starting another
+                attempts = self._attempts
+                self._force = True
+                self._cond.notify_all()
+                if not wait:
+                    return None
+                if not self._cond.wait_for(
+                    lambda: self._directory is not None or self._attempts > attempts,
+                    timeout=self.initial_wait
+                ):
+                    # Don't make every request wait out the same slow attempt
+                    self._cold_wait_expired = attempts
+            elif time.monotonic() >= self._next_refresh:
+                self._cond.notify_all()
+            if self._directory is not None:
+                return self._directory
+            if not self._consecutive_failures and (self._refreshing or self._force):
+                raise DirectoryWarmingUp("The IBM Cloud user directory is still loading")
+            return UserDirectory()
+
+    def clear(self):
+        """Drop the snapshot and refresh now; readers wait for the new one"""
+        with self._cond:
+            self._ensure_thread()
+            self._directory = None
+            self._loaded_at = None
+            self._force = True
+            self._cond.notify_all()
+
+    def age(self) -> Optional[float]:
+        """Seconds since the current snapshot was crawled"""
+        loaded_at = self._loaded_at
+        return time.time() - loaded_at if loaded_at is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache age, refresh timings and failure counters"""
+        with self._cond:
+            age = self.age()
+            return {
+                'cache_age_seconds': int(age) if age is not None else None,
+                'cache_ttl_seconds': self.ttl,
+                'refreshing': self._refreshing,
+                'refresh_count': self._refresh_count,
+                'failure_count': self._failure_count,
+                'consecutive_failures': self._consecutive_failures,
+                'last_error': self._last_error,
+                'last_refresh_duration_ms': round(self._last_duration * 1000, 1) if self._last_duration is not None else None,
+                'next_refresh_in_seconds': max(round(self._next_refresh - time.monotonic(), 1), 0) if self._directory is not None else None,
+            }
+
+
+class SQLAlchemyDirectoryStore:
+    """Shared directory snapshot in the app database, via a SQLAlchemy engine.
+
+    Holds a single row with the crawled users as JSON, a version that bumps on
+    every save, and a refresh lease so only one worker in the fleet crawls.
+    DatabaseOperations implements the same methods for the Code Engine path.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def get_directory_version(self) -> Optional[Tuple[int, Optional[float]]]:
+        """(version, refreshed_at) of the shared snapshot; version 0 means empty"""
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT version, refreshed_at FROM user_directory_snapshot WHERE id = 1"
+            )).first()
+            return (row[0], row[1]) if row else None
+
+    def load_directory(self) -> Optional[UserDirectory]:
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT version, refreshed_at, users FROM user_directory_snapshot WHERE id = 1"
+            )).first()
+            if not row or not row[0]:
+                return None
+            return UserDirectory(json.loads(row[2]), version=row[0], refreshed_at=row[1])
+
+    def try_lease_directory_refresh(self, owner: str, seconds: float) -> bool:
+        """Claim the right to crawl for the next `seconds`; False if someone holds it"""
+        now = time.time()
+        with self.engine.begin() as conn:
+            result = conn.execute(text("""
+                UPDATE user_directory_snapshot
+                SET lease_owner = :owner, lease_until = :until
+                WHERE id = 1 AND (lease_until IS NULL OR lease_until < :now OR lease_owner = :owner)
+            """), {"owner": owner, "until": now + seconds, "now": now})
+            return result.rowcount == 1
+
+    def release_directory_lease(self, owner: str):
+        """Give up a lease after a failed crawl so another worker can try"""
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE user_directory_snapshot SET lease_until = NULL WHERE id = 1 AND lease_owner = :owner"
+            ), {"owner": owner})
+
+    def save_directory(self, users: List[Dict[str, Any]], refreshed_at: float) -> int:
+        """Publish a new snapshot, release the lease and return the new version"""
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE user_directory_snapshot
+                SET version = version + 1, users = :users, refreshed_at = :refreshed_at,
+                    lease_owner = NULL, lease_until = NULL
+                WHERE id = 1
+            """), {"users": json.dumps(users), "refreshed_at": refreshed_at})
+            return conn.execute(text(
+                "SELECT version FROM user_directory_snapshot WHERE id = 1"
+            )).scalar()
+
+    def expire_directory(self):
+        """Mark the shared snapshot stale so the next check re-crawls"""
+        with self.engine.begin() as conn:
+            conn.execute(text("UPDATE user_directory_snapshot SET refreshed_at = 0 WHERE id = 1"))
+
+
+class SharedDirectoryLoader:
+    """DirectoryCache loader that shares one crawl across workers and replicas.
+
+    Each check is a single-row version query. A worker reloads the snapshot
+    only when the version moved; when the snapshot is older than ttl, the one
+    worker that wins the refresh lease crawls and publishes a new version while
+    the others keep serving what they have. If the store is unreachable the
+    worker falls back to crawling on its own.
+    """
+
+    def __init__(self, store, crawl: Callable[[], UserDirectory], ttl=300, lease_seconds=120):
+        self.store = store
+        self.crawl = crawl
+        self.ttl = ttl
+        self.lease_seconds = lease_seconds
+        self.version = None
+
+        self.crawls = 0
+        self.reloads = 0
+        self.checks = 0
+        self.store_errors = 0
+
+    @property
+    def owner(self):
+        """Lease owner id; per process so forked workers do not share it"""
+        return f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+
+    def _reload(self):
+        directory = self.store.load_directory()
+        if directory is not None:
+            self.version = directory.version
+            self.reloads += 1
+        return directory
+
+    def _crawl_and_publish(self):
+        try:
+            directory = self.crawl()
+        except Exception:
+            # Let another worker (or our next attempt) take over right away
+            try:
+                self.store.release_directory_lease(self.owner)
+            except Exception:
+                pass
+            raise
+        self.crawls += 1
+        try:
+            directory.version = self.store.save_directory(directory.users, directory.refreshed_at)
+        except Exception as e:
+            self.store_errors += 1
+            print(f"Could not publish shared user directory: {e}")
+        self.version = directory.version
+        return directory
+
+    def _wait_for_publish(self, deadline):
+        """Poll the version while another worker holds the lease (cold start only).
+
+        If the holder gives the lease up (its crawl failed) or lets it expire,
+        take it over and crawl here.
+        """
+        while time.time() < deadline:
+            time.sleep(1)
+            meta = self.store.get_directory_version()
+            if meta and meta[0] and meta[0] != self.version:
+                return self._reload()
+            if self.store.try_lease_directory_refresh(self.owner, self.lease_seconds):
+                return self._crawl_and_publish()
+        return None
+
+    def __call__(self) -> Optional[UserDirectory]:
+        try:
+            meta = self.store.get_directory_version()
+        except Exception as e:
+            self.store_errors += 1
+            print(f"Shared user directory unavailable ({e}), crawling locally")
+            directory = self.crawl()
+            self.crawls += 1
+            return directory
+
+        self.checks += 1
+        version, refreshed_at = meta if meta else (0, None)
+        fresh = bool(version) and refreshed_at is not None and time.time() - refreshed_at < self.ttl
+
+        if fresh:
+            return None if version == self.version else self._reload()
+
+        if self.store.try_lease_directory_refresh(self.owner, self.lease_seconds):
+            return self._crawl_and_publish()
+
+        # Someone else is crawling: keep a newer stale snapshot over nothing
+        if version and version != self.version:
+            return self._reload()
+        if self.version is None:
+            return self._wait_for_publish(time.time() + self.lease_seconds)
+        return None
+
+    def expire(self):
+        """Force the next check anywhere in the fleet to re-crawl"""
+        self.store.expire_directory()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'version': self.version,
+            'checks': self.checks,
+            'reloads': self.reloads,
+            'crawls': self.crawls,
+            'store_errors': self.store_errors,
+        }
@@ -0,0 +1,388 @@
+"""Write-behind check-in admission: acknowledge from memory, persist in batches
+
+Used when CHECKIN_WRITE_BEHIND is enabled. A check-in is validated against the
+cached user directory, given the group of a preallocated slot, written to a
+local journal and acknowledged. A background writer then stores queued
+check-ins with multi-row INSERTs. If the process dies before a flush, the
+next process to start replays its journal.
+"""
+
+import fcntl
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lab_events import DEFAULT_EVENT_ID
+
+
+class CheckinJournal:
+    """Append-only JSON-lines journal of acknowledged check-ins, one file per process.
+
+    Every record is fsynced before the check-in is acknowledged. After each
+    flush a checkpoint line marks everything up to a sequence number as
+    stored, and the file is emptied whenever nothing is pending. The owning
+    process holds an exclusive flock on its file, so a file that can be
+    locked belongs to a process that is gone.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, f"checkins-{socket.gethostname()}-{os.getpid()}.jsonl")
+        self.dead_letter_path = os.path.join(directory, f"dead-letter-{socket.gethostname()}-{os.getpid()}.jsonl")
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'ab')
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _write(self, entry: Dict[str, Any]):
+        self._file.write((json.dumps(entry) + '\n').encode())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def append(self, record: Dict[str, Any]):
+        with self._lock:
+            self._write(record)
+
+    def checkpoint(self, flushed_through: int, pending: int):
+        """Record that everything up to `flushed_through` is stored"""
+        with self._lock:
+            if pending:
+                self._write({'flushed_through': flushed_through})
+            else:
+                self._file.truncate(0)
+                os.fsync(self._file.fileno())
+
+    def size(self) -> int:
+        with self._lock:
+            return os.fstat(self._file.fileno()).st_size
+
+    def dead_letter(self, failed: List[Tuple[Dict[str, Any], str]]) -> str:
+        """Append records that can never be stored, with their errors, to a separate file.
+
+        The file is outside the checkins-*.jsonl pattern, so recovery never
+        replays it; an operator fixes and re-imports its records.
+        """
+        with self._lock:
+            with open(self.dead_letter_path, 'ab') as dead:
+                for record, error in failed:
+                    dead.write((json.dumps(dict(record, error=error)) + '\n').encode())
+                dead.flush()
+                os.fsync(dead.fileno())
+            return self.dead_letter_path
+
+    @staticmethod
+    def read_pending(path: str) -> List[Dict[str, Any]]:
+        """Records in a journal that were never checkpointed as stored"""
+        records, flushed_through = [], -1
+        with open(path, 'rb') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write was never acknowledged
+                    continue
+                if 'flushed_through' in entry:
+                    flushed_through = max(flushed_through, entry['flushed_through'])
+                else:
+                    records.append(entry)
+        return [record for record in records if record['seq'] > flushed_through]
+
+    def claim_orphans(self, adopt: Callable[[List[Dict[str, Any]]], None]) -> int:
+        """Hand the pending records of journals left by dead processes to `adopt`.
+
+        `adopt` re-journals them here before the orphan file is deleted, so a
+        crash during recovery loses nothing either. Returns the record count.
+        """
+        recovered = 0
+        for path in glob.glob(os.path.join(self.directory, 'checkins-*.jsonl')):
+            if path == self.path:
+                continue
+            try:
+                orphan = open(path, 'rb')
+            except OSError:
+                continue
+            try:
+                fcntl.flock(orphan, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # Another process may have claimed and deleted it while we waited
+                if os.fstat(orphan.fileno()).st_ino != os.stat(path).st_ino:
+                    raise OSError("journal already claimed")
+            except OSError:
+                orphan.close()
+                continue  # Owner is still running, or already recovered
+            try:
+                pending = self.read_pending(path)
+                adopt(pending)
+                recovered += len(pending)
+                os.unlink(path)
+            finally:
+                orphan.close()
+        return recovered
+
+
+def _pending_key(record: Dict[str, Any]):
+    return record.get('event_id', DEFAULT_EVENT_ID), record['email']
+
+
+class WriteBehindQueue:
+    """Queue of acknowledged check-ins, persisted by a background batch writer.
+
+    `flush(records)` must store a batch idempotently (e.g. INSERT ... ON
+    CONFLICT DO NOTHING), because journal replay can hand it records that
+    were already stored. Failed flushes are retried with backoff and the
+    records stay queued and journaled until one succeeds, as long as
+    `is_transient(error)` says the database is merely unreachable or busy.
+    A batch that fails `max_attempts` times for any other reason is flushed
+    record by record, and the records that still fail are moved to the
+    journal's dead-letter file, so one bad record cannot block the queue
+    (and every drain) forever.
+    """
+
+    def __init__(self, flush: Callable[[List[Dict[str, Any]]], None], journal_dir: str,
+                 batch_size=200, flush_interval=0.05, max_attempts=5,
+                 is_transient: Optional[Callable[[Exception], bool]] = None):
+        self._flush = flush
+        self.journal_dir = journal_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._is_transient = is_transient or (lambda error: False)
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        # Keyed by (event id, email); journals from older releases have no event id
+        self._pending_by_email = {}
+        self._seq = 0
+        self._thread = None
+        self._pid = None
+        self.journal = None
+
+        self.submitted = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.recovered = 0
+        self.dead_lettered = 0
+        self.last_error = None
+        self.last_flush_ms = None
+
+    def _ensure_started(self):
+        """Open the journal, replay orphans and start the writer (per process)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        if self._pid != os.getpid():
+            # A forked worker starts with its own journal and an empty queue
+            self._pid = os.getpid()
+            self._queue.clear()
+            self._pending_by_email.clear()
+            self.journal = CheckinJournal(self.journal_dir)
+
+            recovered = self.journal.claim_orphans(
+                lambda records: [self._enqueue_locked(record) for record in records]
+            )
+            if recovered:
+                self.recovered += recovered
+                print(f"Recovered {recovered} unflushed check-ins from orphaned journals")
+
+        self._thread = threading.Thread(target=self._run, name='checkin-writer', daemon=True)
+        self._thread.start()
+
+    def _enqueue_locked(self, record: Dict[str, Any]):
+        self._seq += 1
+        record = dict(record, seq=self._seq)
+        self.journal.append(record)
+        self._queue.append(record)
+        self._pending_by_email[_pending_key(record)] = record
+        self._cond.notify_all()
+        return record
+
+    def submit_if_absent(self, record: Dict[str, Any],
+                         stored: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None):
+        """Journal and queue a check-in unless the attendee already has one.
+
+        Returns (record, True) once the new check-in is safe to acknowledge, or
+        (existing record, False) when one is queued or `stored(email)` finds
+        one. The check and the enqueue hold the queue lock, so concurrent
+        check-ins for an email in this process get the same answer.
+        """
+        with self._cond:
+            self._ensure_started()
+            existing = self._pending_by_email.get(_pending_key(record)) or (
+                stored(record['email']) if stored else None)
+            if existing:
+                return existing, False
+            record = self._enqueue_locked(record)
+            self.submitted += 1
+            return record, True
+
+    def get_pending(self, email: str, event_id: str = DEFAULT_EVENT_ID) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            return self._pending_by_email.get((event_id, email))
+
+    def drain(self, timeout=10.0) -> bool:
+        """Wait until everything queued so far is stored"""
+        with self._cond:
+            if self._thread is None:
+                return True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._queue, timeout=timeout)
+
+    def _flush_each(self, batch: List[Dict[str, Any]]) -> Optional[int]:
+        """Flush a failing batch one record at a time and dead-letter the records that fail.
+
+        Returns the number dead-lettered, or None if a transient error means
+        the whole batch should simply be retried later.
+        """
+        failed = []
+        for record in batch:
+            try:
+                self._flush([record])
+            except Exception as e:
+                if self._is_transient(e):
+                    return None
+                failed.append((record, str(e)))
+        if failed:
+            path = self.journal.dead_letter(failed)
+            print(f"Moved {len(failed)} check-ins that cannot be stored to {path}")
+        return len(failed)
+
+    def _run(self):
+        delay = 0.5
+        attempts = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                # Give a burst a moment to fill the batch
+                if len(self._queue) < self.batch_size:
+                    self._cond.wait(timeout=self.flush_interval)
+                batch = [self._queue[i] for i in range(min(self.batch_size, len(self._queue)))]
+
+            started = time.monotonic()
+            dead = 0
+            try:
+                self._flush(batch)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                if not self._is_transient(e):
+                    attempts += 1
+                dead = self._flush_each(batch) if attempts >= self.max_attempts else None
+                if dead is None:
+                    print(f"Check-in batch write failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30)
+                    continue
+            delay = 0.5
+            attempts = 0
+
+            with self._cond:
+                for record in batch:
+                    self._queue.popleft()
+                    if self._pending_by_email.get(_pending_key(record)) is record:
+                        del self._pending_by_email[_pending_key(record)]
+                self.journal.checkpoint(batch[-1]['seq'], len(self._queue))
+                self.flushed += len(batch) - dead
+                self.dead_lettered += dead
+                self.batches += 1
+                if not dead:
+                    self.last_error = None
+                self.last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+                self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'queued': len(self._queue),
+                'submitted': self.submitted,
+                'flushed': self.flushed,
+                'batches': self.batches,
+                'failures': self.failures,
+                'recovered': self.recovered,
+                'dead_lettered': self.dead_lettered,
+                'last_error': self.last_error,
+                'last_flush_ms': self.last_flush_ms,
+                'journal_bytes': self.journal.size() if self.journal else 0,
+            }
+
+
+class SlotAllocator:
+    """Hands out check-in slots from blocks reserved ahead of time.
+
+    `reserve(n)` takes n consecutive slots from the shared counter. Blocks
+    are small, because slots still held when a process exits are never used
+    (their groups stay a member short).
+    """
+
+    def __init__(self, reserve: Callable[[int], List[int]], block_size=6):
+        self._reserve = reserve
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._slots = deque()
+        self._pid = None
+        self.reservations = 0
+
+    def put_back(self, slot: int):
+        """Return an unused slot (its check-in turned out to be a duplicate) for the next check-in"""
+        with self._lock:
+            if self._pid == os.getpid():
+                # Keep the block ascending, so groups still fill in order
+                position = 0
+                while position < len(self._slots) and self._slots[position] < slot:
+                    position += 1
+                self._slots.insert(position, slot)
+
+    def take(self) -> int:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Never share a parent's block with a forked worker
+                self._slots.clear()
+                self._pid = os.getpid()
+            if not self._slots:
+                self._slots.extend(self._reserve(self.block_size))
+                self.reservations += 1
+            return self._slots.popleft()
+
+    def clear(self):
+        """Drop held slots (after a reset restarts the counter)"""
+        with self._lock:
+            self._slots.clear()
+
+
+class RegisteredIndex:
+    """Email -> stored or acknowledged check-in, so repeat scans skip the database.
+
+    Loaded lazily with `load()`, kept current from check-in and removal events
+    (including ones relayed from other workers), and reloaded after events
+    that can change many users at once.
+    """
+
+    def __init__(self, load: Callable[[], Dict[str, Dict[str, Any]]]):
+        self._load = load
+        self._lock = threading.Lock()
+        self._users = None
+        self.loads = 0
+
+    def get(self, email: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._users is None:
+                self._users = self._load()
+                self.loads += 1
+            return self._users.get(email)
+
+    def add(self, user: Dict[str, Any]):
+        with self._lock:
+            if self._users is not None:
+                self._users[user['email']] = user
+
+    def discard(self, email: str):
+        with self._lock:
+            if self._users is not None:
+                self._users.pop(email, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._users = None